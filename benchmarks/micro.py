@@ -0,0 +1,421 @@
+#!/usr/bin/env python3
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Micro-benchmarks of the functions sample-tester calls in its inner loops.
+
+Each benchmark is parametrized by an input size. For each size, the function
+under test is run in batches sized so that a batch takes at least
+`--min-batch-seconds`; after `--warmup` discarded batches, `--repeats` batches
+are timed, and the per-call times are summarized (min, mean, stddev,
+percentiles).
+
+Run from the top of the repository, eg:
+
+  python3 -m benchmarks.micro --output micro.json
+  python3 -m benchmarks.micro --filter 'manifest\\.' --baseline micro.json
+
+The JSON output records the git commit it was measured at, so results can be
+kept and compared across commits; with `--baseline`, the exit code is non-zero
+if the median time of any benchmark regressed by more than `--tolerance`.
+"""
+
+import argparse
+import json
+import math
+import platform
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+from dataclasses import dataclass
+from typing import Callable
+from typing import List
+
+from sampletester import caserunner
+from sampletester import sample_manifest
+from sampletester import testenv
+from sampletester.convention import tag
+
+DEFAULT_SIZES = [1, 10, 100]
+
+
+@dataclass
+class Benchmark:
+  """A function to benchmark at various input sizes.
+
+  `prepare(size)` builds the inputs for one size and returns the no-argument
+  callable to time.
+  """
+  name: str
+  prepare: Callable[[int], Callable[[], object]]
+  sizes: List[int]
+
+
+# All the benchmarks, in the order in which they are registered.
+BENCHMARKS = []
+
+
+def benchmark(name: str, sizes: List[int] = None):
+  """Decorator registering a `prepare` function as a Benchmark."""
+  def register(prepare):
+    BENCHMARKS.append(Benchmark(name, prepare, sizes or DEFAULT_SIZES))
+    return prepare
+  return register
+
+
+### Statistics
+
+def percentile(sorted_values, fraction: float):
+  """Returns the `fraction` percentile of `sorted_values`, interpolated."""
+  if not sorted_values:
+    return 0
+  position = (len(sorted_values) - 1) * fraction
+  lower = math.floor(position)
+  upper = math.ceil(position)
+  if lower == upper:
+    return sorted_values[lower]
+  weight = position - lower
+  return sorted_values[lower] * (1 - weight) + sorted_values[upper] * weight
+
+
+def summarize(samples):
+  """Returns summary statistics of the per-call times in `samples`."""
+  ordered = sorted(samples)
+  return {
+      'repeats': len(ordered),
+      'min': ordered[0],
+      'mean': statistics.mean(ordered),
+      'stddev': statistics.stdev(ordered) if len(ordered) > 1 else 0,
+      'p50': percentile(ordered, 0.5),
+      'p90': percentile(ordered, 0.9),
+      'p99': percentile(ordered, 0.99),
+      'max': ordered[-1],
+  }
+
+
+def batch_size(fn, min_batch_seconds: float):
+  """Returns how many calls of `fn` take at least `min_batch_seconds`."""
+  number = 1
+  while True:
+    if time_batch(fn, number) >= min_batch_seconds or number >= 1e7:
+      return number
+    number *= 10
+
+
+def time_batch(fn, number: int):
+  """Returns the seconds taken by `number` successive calls to `fn`."""
+  start = time.perf_counter()
+  for _ in range(number):
+    fn()
+  return time.perf_counter() - start
+
+
+def measure(fn, warmup: int, repeats: int, min_batch_seconds: float):
+  """Times `fn` and returns its summary statistics, in seconds per call."""
+  number = batch_size(fn, min_batch_seconds)
+  for _ in range(warmup):
+    time_batch(fn, number)
+  samples = [time_batch(fn, number) / number for _ in range(repeats)]
+  stats = summarize(samples)
+  stats['calls_per_repeat'] = number
+  return stats
+
+
+### Benchmarked functions
+
+@benchmark('manifest.Inclusions.determine')
+def prepare_determine(size):
+  value = ' '.join(f'lit{idx} {{tag{idx}}} {{{{escaped}}}}'
+                   for idx in range(size))
+  return lambda: sample_manifest.Inclusions.determine(value, None, 'bench')
+
+
+@benchmark('manifest.Inclusions.resolve')
+def prepare_resolve(size):
+  value = ' '.join(f'lit{idx} {{tag{idx}}}' for idx in range(size))
+  values = {f'tag{idx}': f'value{idx}' for idx in range(size)}
+  inclusions = sample_manifest.Inclusions.determine(value, None, 'bench')
+  return lambda: inclusions.resolve(values)
+
+
+@benchmark('manifest.resolve_element_inclusions')
+def prepare_resolve_element(size):
+  # a chain of tags, each including the previous one, plus literal tags
+  element = {'tag0': 'root'}
+  for idx in range(1, size):
+    element[f'tag{idx}'] = f'{{tag{idx - 1}}}/{idx}'
+    element[f'literal{idx}'] = f'literal value {idx}'
+  # the element is resolved in place, so each call resolves a fresh copy
+  return lambda: sample_manifest.resolve_element_inclusions(dict(element))
+
+
+@benchmark('manifest.resolve_inclusions', sizes=[10, 1000, 10000])
+def prepare_resolve_inclusions(size):
+  # elements sharing their templates, as in a factored manifest
+  common = {'environment': 'python', 'basepath': '/samples',
+            'invocation': 'python {path} @args', 'chdir': '{@manifest_dir}',
+            '@manifest_dir': '/manifests', '@manifest_source': '/manifests/m.yaml'}
+  elements = [dict(common, sample=f'sample{idx}',
+                   path=f'{{basepath}}/sample{idx}.py')
+              for idx in range(size)]
+  # the elements are resolved in place, so each call resolves fresh copies
+  return lambda: sample_manifest.resolve_inclusions(
+      [dict(element) for element in elements])
+
+
+def synthetic_manifest(size):
+  """Returns an indexed manifest with `size` samples in each of 3 languages."""
+  elements = [{'language': language, 'sample': f'sample{idx}',
+               'path': f'/samples/{language}/sample{idx}'}
+              for language in ['python', 'java', 'go']
+              for idx in range(size)]
+  manifest = sample_manifest.Manifest('language', 'sample')
+  manifest._index_elements(elements)
+  return manifest
+
+
+@benchmark('manifest.Manifest.get', sizes=[10, 1000, 100000])
+def prepare_get(size):
+  manifest = synthetic_manifest(size)
+  key = f'sample{size // 2}'
+  return lambda: manifest.get('java', key)
+
+
+@benchmark('manifest.Manifest.get_one', sizes=[10, 1000, 100000])
+def prepare_get_one(size):
+  manifest = synthetic_manifest(size)
+  key = f'sample{size // 2}'
+  return lambda: manifest.get_one('java', key)
+
+
+@benchmark('manifest.Manifest.get_keys', sizes=[10, 1000, 100000])
+def prepare_get_keys(size):
+  manifest = synthetic_manifest(size)
+  return lambda: manifest.get_keys('java')
+
+
+# The labels of the deeper synthetic manifests, beyond language and sample.
+EXTRA_LABELS = ['region', 'release', 'variant']
+
+
+def deep_manifest(size, num_labels):
+  """Returns an indexed manifest with `size` samples and `num_labels` indices.
+
+  The first two indices are the language and sample, as in
+  `synthetic_manifest`; the remaining ones take a few values each.
+  """
+  extra = EXTRA_LABELS[:num_labels - 2]
+  elements = []
+  for language in ['python', 'java', 'go']:
+    for idx in range(size):
+      element = {'language': language, 'sample': f'sample{idx}',
+                 'path': f'/samples/{language}/sample{idx}'}
+      element.update({label: f'{label}{idx % 3}' for label in extra})
+      elements.append(element)
+  manifest = sample_manifest.Manifest('language', 'sample', *extra)
+  manifest._index_elements(elements)
+  return manifest
+
+
+def deep_key(size, num_labels):
+  """Returns the full index key of a sample in `deep_manifest`."""
+  idx = size // 2
+  return (['java', f'sample{idx}'] +
+          [f'{label}{idx % 3}' for label in EXTRA_LABELS[:num_labels - 2]])
+
+
+def register_deep_benchmarks(num_labels):
+  @benchmark(f'manifest.Manifest.get.{num_labels}labels', sizes=[1000, 100000])
+  def prepare_deep_get(size):
+    manifest = deep_manifest(size, num_labels)
+    key = deep_key(size, num_labels)
+    return lambda: manifest.get(*key)
+
+  @benchmark(f'manifest.Manifest.get_miss.{num_labels}labels',
+             sizes=[1000, 100000])
+  def prepare_deep_get_miss(size):
+    manifest = deep_manifest(size, num_labels)
+    key = deep_key(size, num_labels)[:-1] + ['absent']
+    return lambda: manifest.get(*key)
+
+  @benchmark(f'manifest.Manifest.get_keys.{num_labels}labels',
+             sizes=[1000, 100000])
+  def prepare_deep_get_keys(size):
+    manifest = deep_manifest(size, num_labels)
+    prefix = deep_key(size, num_labels)[:-1]
+    return lambda: manifest.get_keys(*prefix)
+
+
+for num_labels in [3, 4, 5]:
+  register_deep_benchmarks(num_labels)
+
+
+@benchmark('caserunner.interpolate_symbols')
+def prepare_interpolate(size):
+  msg = ' '.join(f'word{idx} {{sample{idx}:path}}' for idx in range(size))
+  return lambda: caserunner.interpolate_symbols(msg, lambda symbol: symbol)
+
+
+class _SymbolEnvironment(testenv.Base):
+  """An environment whose symbols resolve to their own names."""
+
+  def get_symbol(self, symbol):
+    return symbol
+
+
+@benchmark('caserunner.TestCase.format_string')
+def prepare_format_string(size):
+  case = caserunner.TestCase(_SymbolEnvironment(), 0, 'bench', [], [], [])
+  msg = ' '.join(f'{{sample{idx}:path}} {{}}' for idx in range(size))
+  args = [f'arg{idx}' for idx in range(size)]
+  return lambda: case.format_string(msg, *args)
+
+
+@benchmark('tag.insert_into')
+def prepare_insert_into(size):
+  host = ' '.join(f'word{idx} @args @@escaped' for idx in range(size))
+  return lambda: tag.insert_into(host, ('@args', '--flag=value'))
+
+
+@benchmark('testenv.process_args')
+def prepare_process_args(size):
+  args = ['sample'] + [f'positional{idx}' for idx in range(size)]
+  kwargs = {f'name{idx}': f'value "{idx}"' for idx in range(size)}
+  kwargs.update({f'_{idx}': f'positional kwarg {idx}' for idx in range(size)})
+  return lambda: testenv.process_args(*args, **kwargs)
+
+
+### Driver
+
+def result_key(name: str, size: int):
+  return f'{name}[{size}]'
+
+
+def run(pattern: str = None, warmup: int = 2, repeats: int = 10,
+        min_batch_seconds: float = 0.01, sizes: List[int] = None):
+  """Runs the benchmarks whose names match `pattern`; returns their stats."""
+  results = {}
+  for bench in BENCHMARKS:
+    if pattern and not re.search(pattern, bench.name):
+      continue
+    for size in sizes or bench.sizes:
+      fn = bench.prepare(size)
+      results[result_key(bench.name, size)] = measure(fn, warmup, repeats,
+                                                      min_batch_seconds)
+  return results
+
+
+def compare(baseline, current, tolerance: float):
+  """Returns descriptions of the benchmarks whose median regressed."""
+  regressions = []
+  for key, stats in sorted(current.items()):
+    old = baseline.get(key)
+    if not old:
+      continue
+    if stats['p50'] > old['p50'] * (1 + tolerance):
+      regressions.append('{}: median went from {} to {} (+{:.1%})'.format(
+          key, format_seconds(old['p50']), format_seconds(stats['p50']),
+          stats['p50'] / old['p50'] - 1))
+  return regressions
+
+
+def format_seconds(seconds: float):
+  for unit, scale in [('s', 1), ('ms', 1e-3), ('us', 1e-6)]:
+    if seconds >= scale:
+      return f'{seconds / scale:.3f}{unit}'
+  return f'{seconds / 1e-9:.1f}ns'
+
+
+def format_results(results):
+  width = max([len(key) for key in results] + [0])
+  lines = []
+  for key, stats in results.items():
+    lines.append('{}  p50 {:>10}  p90 {:>10}  p99 {:>10}  mean {:>10} '
+                 '± {:>10}'.format(
+                     key.ljust(width), format_seconds(stats['p50']),
+                     format_seconds(stats['p90']), format_seconds(stats['p99']),
+                     format_seconds(stats['mean']),
+                     format_seconds(stats['stddev'])))
+  return '\n'.join(lines)
+
+
+def git_commit():
+  """Returns the current git commit, or None if it cannot be determined."""
+  try:
+    return subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+                                   stderr=subprocess.DEVNULL).decode().strip()
+  except Exception:
+    return None
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(
+      description='Micro-benchmarks of sample-tester inner-loop functions',
+      formatter_class=argparse.RawDescriptionHelpFormatter,
+      epilog=__doc__)
+  parser.add_argument('--filter', metavar='REGEX',
+                      help='only run the benchmarks whose names match REGEX')
+  parser.add_argument('--sizes', metavar='N,N,...',
+                      type=lambda value: [int(n) for n in value.split(',') if n],
+                      help='override the input sizes of every benchmark')
+  parser.add_argument('--warmup', type=int, default=2,
+                      help='number of discarded batches per benchmark (default: 2)')
+  parser.add_argument('--repeats', type=int, default=10,
+                      help='number of timed batches per benchmark (default: 10)')
+  parser.add_argument('--min-batch-seconds', type=float, default=0.01,
+                      help='minimum duration of each timed batch (default: 0.01)')
+  parser.add_argument('--list', action='store_true',
+                      help='list the benchmarks and exit')
+  parser.add_argument('--output', metavar='FILE',
+                      help='write the results as JSON to FILE')
+  parser.add_argument('--baseline', metavar='FILE',
+                      help='compare against the JSON results in FILE and fail '
+                      'on regressions')
+  parser.add_argument('--tolerance', type=float, default=0.1,
+                      help='allowed fractional slow-down of the median versus '
+                      'the baseline (default: 0.1)')
+  args = parser.parse_args(argv)
+
+  if args.list:
+    for bench in BENCHMARKS:
+      print('{} {}'.format(bench.name, bench.sizes))
+    return 0
+
+  results = run(args.filter, args.warmup, args.repeats, args.min_batch_seconds,
+                args.sizes)
+  print(format_results(results))
+  if args.output:
+    with open(args.output, 'w') as stream:
+      json.dump({'commit': git_commit(),
+                 'python': platform.python_version(),
+                 'results': results},
+                stream, indent=2, sort_keys=True)
+
+  if args.baseline:
+    with open(args.baseline) as stream:
+      baseline = json.load(stream)
+    regressions = compare(baseline['results'], results, args.tolerance)
+    if regressions:
+      print('\nREGRESSIONS against commit {}:\n  {}'.format(
+          baseline.get('commit'), '\n  '.join(regressions)))
+      return 1
+    print('\nno regressions against commit {}'.format(baseline.get('commit')))
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
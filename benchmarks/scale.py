@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Measures the overhead of sample-tester itself on synthetic inputs.
+
+For each requested scenario, this generates a synthetic manifest and test plan
+(see `synthetic.py`), runs the real sample-tester CLI on them in a subprocess,
+and reports:
+  - the time taken by each phase of the run (from the `--trace` timeline)
+  - the mean per-case overhead, ie the case duration minus the time spent in
+    the calls the case made
+  - the peak memory (RSS) of the sample-tester process
+
+Run from the top of the repository, eg:
+
+  python3 -m benchmarks.scale --versions 1,2,3 --artifacts 10,1000,100000 \\
+      --cases 10 --output results.json
+
+To check for regressions, pass the results of a previous run as a baseline;
+the exit code is non-zero if any metric regressed by more than the tolerance:
+
+  python3 -m benchmarks.scale --baseline results.json --tolerance 0.25
+"""
+
+import argparse
+import itertools
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks import synthetic
+
+_ABS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(_ABS_DIR)
+
+# Metrics whose absolute difference from the baseline is below these floors are
+# never reported as regressions, so that noise in tiny measurements does not
+# fail the comparison.
+SECONDS_FLOOR = 0.01
+RSS_KB_FLOOR = 2048
+
+
+def run_scenario(scenario: synthetic.Scenario, python: str = sys.executable):
+  """Runs sample-tester on the inputs for `scenario` and returns its metrics."""
+  with tempfile.TemporaryDirectory(prefix='sampletester-bench-') as workdir:
+    files = synthetic.generate(workdir, scenario)
+    trace_path = os.path.join(workdir, 'trace.json')
+    command = [python, '-m', 'sampletester.cli', '--trace', trace_path,
+               '-v', 'quiet'] + files
+    environment = dict(os.environ)
+    environment['PYTHONPATH'] = os.pathsep.join(
+        [REPO_ROOT] + [environment.get('PYTHONPATH', '')]).rstrip(os.pathsep)
+
+    start = time.perf_counter()
+    process = subprocess.Popen(command, cwd=workdir, env=environment,
+                               stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    output = process.stdout.read()
+    process.stdout.close()
+    _, status, usage = os.wait4(process.pid, 0)
+    wall_seconds = time.perf_counter() - start
+    if not os.WIFEXITED(status) or os.WEXITSTATUS(status) != 0:
+      raise BenchmarkError('sample-tester failed for scenario {}:\n{}'
+                           .format(scenario.name(), output.decode('utf-8')))
+
+    with open(trace_path) as stream:
+      metrics = analyze_trace(json.load(stream)['traceEvents'])
+  metrics['wall_seconds'] = wall_seconds
+  metrics['peak_rss_kb'] = usage.ru_maxrss
+  return metrics
+
+
+def analyze_trace(events):
+  """Extracts the benchmark metrics from a sample-tester trace timeline.
+
+  Returns a dict with the duration of each phase, the number of cases run, and
+  the mean and total per-case overhead (case time not spent in calls).
+  """
+  phases = {}
+  cases = []
+  calls = []
+  for event in events:
+    if event.get('ph') != 'X':
+      continue
+    seconds = event['dur'] / 1e6
+    category = event.get('cat')
+    if category == 'phase':
+      phases[event['name']] = phases.get(event['name'], 0) + seconds
+    elif category == 'case':
+      cases.append(event)
+    elif category == 'call':
+      calls.append(event)
+
+  overhead = 0
+  for case in cases:
+    start, end = case['ts'], case['ts'] + case['dur']
+    in_calls = sum(call['dur'] for call in calls
+                   if call['tid'] == case['tid'] and
+                   start <= call['ts'] and call['ts'] + call['dur'] <= end)
+    overhead += (case['dur'] - in_calls) / 1e6
+  return {
+      'phases': phases,
+      'cases': len(cases),
+      'case_overhead_seconds': overhead,
+      'mean_case_overhead_seconds': overhead / len(cases) if cases else 0,
+  }
+
+
+def flatten(metrics):
+  """Returns the comparable numeric metrics as a flat dict."""
+  flat = {f'phase:{name}': seconds
+          for name, seconds in metrics.get('phases', {}).items()}
+  for name in ['wall_seconds', 'mean_case_overhead_seconds', 'peak_rss_kb']:
+    if name in metrics:
+      flat[name] = metrics[name]
+  return flat
+
+
+def compare(baseline, current, tolerance: float):
+  """Returns a list of descriptions of metrics that regressed.
+
+  A metric regresses if it exceeds its baseline value by more than `tolerance`
+  (a fraction of the baseline) and by more than the floor for its unit.
+  """
+  regressions = []
+  for scenario, metrics in sorted(current.items()):
+    if scenario not in baseline:
+      continue
+    old = flatten(baseline[scenario])
+    for name, value in sorted(flatten(metrics).items()):
+      if name not in old:
+        continue
+      floor = RSS_KB_FLOOR if name.endswith('_kb') else SECONDS_FLOOR
+      if value > old[name] * (1 + tolerance) and value - old[name] > floor:
+        regressions.append('{}: {} went from {:.4g} to {:.4g} (+{:.1%})'.format(
+            scenario, name, old[name], value,
+            (value - old[name]) / old[name] if old[name] else float('inf')))
+  return regressions
+
+
+def format_results(results):
+  lines = []
+  for scenario, metrics in sorted(results.items()):
+    lines.append(f'{scenario}:')
+    for name, value in sorted(flatten(metrics).items()):
+      lines.append(f'  {name}: {value:.4g}')
+  return '\n'.join(lines)
+
+
+def parse_counts(value: str):
+  return [int(count) for count in value.split(',') if count]
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(
+      description='Benchmark the overhead of sample-tester on synthetic inputs',
+      formatter_class=argparse.RawDescriptionHelpFormatter,
+      epilog=__doc__)
+  parser.add_argument('--versions', type=parse_counts, default=[3],
+                      help='comma-separated manifest schema versions (default: 3)')
+  parser.add_argument('--artifacts', type=parse_counts, default=[10, 100, 1000],
+                      help='comma-separated numbers of manifest artifacts '
+                      '(default: 10,100,1000)')
+  parser.add_argument('--cases', type=parse_counts, default=[10],
+                      help='comma-separated numbers of test cases (default: 10)')
+  parser.add_argument('--environments', type=int, default=1,
+                      help='number of environments (default: 1)')
+  parser.add_argument('--sources', type=int, default=1,
+                      help='number of manifest files per environment (default: 1)')
+  parser.add_argument('--output', metavar='FILE',
+                      help='write the results as JSON to FILE')
+  parser.add_argument('--baseline', metavar='FILE',
+                      help='compare against the JSON results in FILE and fail '
+                      'on regressions')
+  parser.add_argument('--tolerance', type=float, default=0.2,
+                      help='allowed fractional slow-down versus the baseline '
+                      '(default: 0.2)')
+  args = parser.parse_args(argv)
+
+  results = {}
+  for version, artifacts, cases in itertools.product(args.versions,
+                                                     args.artifacts, args.cases):
+    scenario = synthetic.Scenario(version=version, artifacts=artifacts,
+                                  cases=cases, environments=args.environments,
+                                  sources=args.sources)
+    print(f'running {scenario.name()}', file=sys.stderr)
+    results[scenario.name()] = run_scenario(scenario)
+
+  print(format_results(results))
+  if args.output:
+    with open(args.output, 'w') as stream:
+      json.dump({'scenarios': results}, stream, indent=2, sort_keys=True)
+
+  if args.baseline:
+    with open(args.baseline) as stream:
+      baseline = json.load(stream)['scenarios']
+    regressions = compare(baseline, results, args.tolerance)
+    if regressions:
+      print('\nREGRESSIONS:\n  ' + '\n  '.join(regressions))
+      return 1
+    print('\nno regressions against {}'.format(args.baseline))
+  return 0
+
+
+class BenchmarkError(Exception):
+  pass
+
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,165 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Generates synthetic manifests and test plans for benchmarking.
+
+All the generated artifacts invoke the same no-op mock sample, so that running
+the generated test plan measures the overhead of sample-tester itself rather
+than that of the samples.
+"""
+
+import os
+import stat
+
+from dataclasses import dataclass
+
+SAMPLE_NAME = 'noop.sh'
+
+# The mock sample simply echoes its arguments, which is enough for the
+# generated test cases to have something to assert on.
+SAMPLE_CONTENT = """#!/bin/sh
+echo "noop: $@"
+"""
+
+# The phrase every generated test case expects in its sample's output.
+EXPECTED_OUTPUT = 'noop:'
+
+
+@dataclass
+class Scenario:
+  """The shape of one synthetic set of inputs."""
+  version: int = 3
+  artifacts: int = 10
+  cases: int = 10
+  environments: int = 1
+  sources: int = 1
+
+  def name(self) -> str:
+    return (f'v{self.version}-a{self.artifacts}-c{self.cases}'
+            f'-e{self.environments}-s{self.sources}')
+
+
+def sample_id(idx: int) -> str:
+  return f'sample_{idx:06d}'
+
+
+def environment_name(idx: int) -> str:
+  return f'env_{idx:02d}'
+
+
+def write_sample(directory: str) -> str:
+  """Writes the no-op mock sample into `directory` and returns its path."""
+  path = os.path.join(directory, SAMPLE_NAME)
+  with open(path, 'w') as stream:
+    stream.write(SAMPLE_CONTENT)
+  os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR | stat.S_IXGRP)
+  return path
+
+
+def split(total: int, parts: int):
+  """Returns `parts` ranges that evenly partition `range(total)`."""
+  parts = max(1, min(parts, total)) if total else 1
+  bounds = [total * part // parts for part in range(parts + 1)]
+  return [range(bounds[part], bounds[part + 1]) for part in range(parts)]
+
+
+def manifest_v3(artifact_ids, environment: str, sample_dir: str) -> str:
+  """Returns a factored v3 manifest sharing common tags via a YAML anchor."""
+  lines = ['type: manifest/samples',
+           'schema_version: 3',
+           'base: &common',
+           f"  environment: '{environment}'",
+           f"  basepath: '{sample_dir}'",
+           "  invocation: 'sh {path} @args'",
+           "  chdir: '{@manifest_dir}'",
+           'samples:']
+  for idx in artifact_ids:
+    lines.extend(['- <<: *common',
+                  f"  sample: '{sample_id(idx)}'",
+                  f"  path: '{{basepath}}/{SAMPLE_NAME}'",
+                  f"  description: 'synthetic sample {{sample}} in {{environment}}'"])
+  return '\n'.join(lines) + '\n'
+
+
+def manifest_v1v2(version: int, artifact_ids, environment: str,
+                  sample_dir: str) -> str:
+  """Returns a v1 or v2 manifest with set-wide tag prefixes.
+
+  For v2, the artifacts also use tag inclusions; v1 does not support them.
+  """
+  lines = [f'version: {version}',
+           'sets:',
+           f"- environment: '{environment}'",
+           f"  path: '{sample_dir}/'"]
+  if version > 1:
+    lines.append("  invocation: 'sh {path} @args'")
+  else:
+    lines.append("  bin: 'sh'")
+  lines.append('  __items__:')
+  for idx in artifact_ids:
+    lines.extend([f"  - sample: '{sample_id(idx)}'",
+                  f"    path: '{SAMPLE_NAME}'"])
+    if version > 1:
+      lines.append("    description: 'synthetic sample {sample}'")
+  return '\n'.join(lines) + '\n'
+
+
+def testplan(num_cases: int, num_artifacts: int) -> str:
+  """Returns a test plan whose cases each call one of the artifacts."""
+  lines = ['type: test/samples',
+           'schema_version: 1',
+           'test:',
+           '  suites:',
+           '  - name: synthetic',
+           '    cases:']
+  for idx in range(num_cases):
+    lines.extend([f'    - name: case_{idx:06d}',
+                  '      spec:',
+                  '      - call:',
+                  f'          sample: {sample_id(idx % max(num_artifacts, 1))}',
+                  '          params:',
+                  '            case:',
+                  f'              literal: "{idx}"',
+                  '      - assert_contains:',
+                  f'        - literal: "{EXPECTED_OUTPUT}"'])
+  return '\n'.join(lines) + '\n'
+
+
+def generate(directory: str, scenario: Scenario):
+  """Writes the inputs for `scenario` into `directory`.
+
+  Returns the list of the YAML files written, to be passed to sample-tester.
+  """
+  sample_dir = os.path.dirname(write_sample(directory))
+  files = []
+  for env_idx in range(scenario.environments):
+    environment = environment_name(env_idx)
+    for source_idx, artifact_ids in enumerate(split(scenario.artifacts,
+                                                    scenario.sources)):
+      if scenario.version >= 3:
+        content = manifest_v3(artifact_ids, environment, sample_dir)
+      else:
+        content = manifest_v1v2(scenario.version, artifact_ids, environment,
+                                sample_dir)
+      path = os.path.join(directory,
+                          f'{environment}_{source_idx:04d}.manifest.yaml')
+      with open(path, 'w') as stream:
+        stream.write(content)
+      files.append(path)
+
+  path = os.path.join(directory, 'synthetic.test.yaml')
+  with open(path, 'w') as stream:
+    stream.write(testplan(scenario.cases, scenario.artifacts))
+  files.append(path)
+  return files
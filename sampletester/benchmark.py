@@ -0,0 +1,144 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Summarizes how long the calls of test cases run repeatedly took.
+
+When test cases run repeatedly (see runner.run_repeatedly()), each collects
+the wall and CPU time of the calls of its timed runs. A Visitor summarizes
+these times per test case and per environment, as the Stats of their
+distributions, into a report that describe() renders as text and that can be
+written as JSON.
+"""
+
+import collections
+import math
+import statistics
+
+from sampletester import testplan
+
+# The distribution of `count` times: their mean, standard deviation, and
+# percentiles, in seconds.
+Stats = collections.namedtuple('Stats', ['count', 'mean', 'stddev', 'p50',
+                                         'p90', 'p99'])
+
+# The resources summarized, as attributes of caserunner.CallUsage
+MEASURES = ('wall', 'cpu')
+
+
+def percentile(values, percent: float):
+  """Returns the `percent` percentile of the sorted `values`.
+
+  Values between ranks are linearly interpolated.
+  """
+  rank = (len(values) - 1) * percent / 100
+  low, high = math.floor(rank), math.ceil(rank)
+  return values[low] + (values[high] - values[low]) * (rank - low)
+
+
+def summarize(values):
+  """Returns the Stats of `values`, or None if there are none."""
+  if not values:
+    return None
+  values = sorted(values)
+  return Stats(len(values), statistics.mean(values),
+               statistics.stdev(values) if len(values) > 1 else 0.0,
+               percentile(values, 50), percentile(values, 90),
+               percentile(values, 99))
+
+
+def summarize_usage(call_usage):
+  """Returns a dict of the Stats, as dicts, of each of MEASURES."""
+  return {measure: summarize([getattr(usage, measure)
+                              for usage in call_usage])._asdict()
+          for measure in MEASURES}
+
+
+class Visitor(testplan.Visitor):
+  """Summarizes the times of the calls made by the test cases visited.
+
+  end_visit() returns the report: a dict listing, for each environment whose
+  test cases made calls, the summary of those calls (see summarize_usage())
+  and that of the calls of each such test case. Only the calls made by the
+  timed runs, after the `warmup` ones, of each of the `repeat` runs count.
+  """
+
+  def __init__(self, repeat: int, warmup: int):
+    self.report = {'repeat': repeat, 'warmup': warmup, 'environments': []}
+    self.environment_usage = []
+    self.cases = []
+
+  def visit_environment(self, environment: testplan.Environment, doit: bool):
+    if not doit or not environment.attempted:
+      return None, None
+    self.environment_usage = []
+    self.cases = []
+    return self.visit_suite, None
+
+  def visit_suite(self, idx, suite: testplan.Suite, doit: bool):
+    if not doit or not suite.attempted:
+      return None
+    return lambda idx, tcase, doit: self.visit_testcase(tcase, doit, suite)
+
+  def visit_testcase(self, tcase: testplan.TestCase, doit: bool,
+                     suite: testplan.Suite):
+    if not doit or not tcase.call_usage:
+      return
+    self.environment_usage.extend(tcase.call_usage)
+    self.cases.append({'suite': suite.name(), 'case': tcase.name(),
+                       **summarize_usage(tcase.call_usage)})
+
+  def visit_environment_end(self, environment: testplan.Environment,
+                            doit: bool):
+    if not self.environment_usage:
+      return
+    self.report['environments'].append({
+        'environment': environment.name(),
+        **summarize_usage(self.environment_usage),
+        'cases': self.cases,
+    })
+    self.environment_usage = []
+
+  def start_visit(self):
+    return self.visit_environment, self.visit_environment_end
+
+  def end_visit(self):
+    return self.report
+
+
+def describe_stats(stats):
+  """Returns a line describing the Stats dict `stats`, in milliseconds."""
+  return ('mean {:.1f}ms, stddev {:.1f}ms, p50 {:.1f}ms, p90 {:.1f}ms, '
+          'p99 {:.1f}ms'.format(*(stats[name] * 1000
+                                  for name in Stats._fields[1:])))
+
+
+def describe(report):
+  """Returns a human-readable rendering of a Visitor's report."""
+  lines = ['Call times over {} runs of each test case (after {} warmup runs):'
+           .format(report['repeat'], report['warmup'])]
+
+  def append_usage(indent, summary):
+    for measure in MEASURES:
+      lines.append('{}{}: {}'.format(indent, measure,
+                                     describe_stats(summary[measure])))
+
+  for environment in report['environments']:
+    lines.append('  Test environment "{}": {} calls'.format(
+        environment['environment'], environment['wall']['count']))
+    append_usage('    ', environment)
+    for case in environment['cases']:
+      lines.append('    Test case "{}" of suite "{}": {} calls'.format(
+          case['case'], case['suite'], case['wall']['count']))
+      append_usage('      ', case)
+  return '\n'.join(lines)
@@ -0,0 +1,83 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Parses and formats the performance budgets of calls.
+
+A budget limits the wall time (DURATION), the CPU time (CPU) or the peak
+resident memory (MAX_RSS) of a call, as measured in a caserunner.CallUsage.
+Times are given in seconds, optionally suffixed with "s" or "ms" (eg "1.5",
+"250ms"), and memory sizes in bytes, optionally suffixed with "K", "M" or "G"
+for powers of 1024 (eg "512M").
+"""
+
+import re
+
+DURATION = 'wall'
+CPU = 'cpu'
+MAX_RSS = 'max_rss'
+
+# The names of the measures, for messages
+NAMES = {DURATION: 'duration', CPU: 'CPU time', MAX_RSS: 'peak memory'}
+
+_TIME_UNITS = {'': 1.0, 's': 1.0, 'ms': 0.001}
+_SIZE_UNITS = {prefix + suffix: 1 << (10 * power)
+               for power, prefix in enumerate(['', 'k', 'm', 'g'])
+               for suffix in (['', 'b'] if power == 0 else ['', 'b', 'ib'])}
+_QUANTITY = re.compile(r'\s*([0-9.]+(?:e-?[0-9]+)?)\s*([a-z]*)\s*$')
+
+
+def _parse(value, units, what: str):
+  number, unit = None, ''
+  if isinstance(value, (int, float)) and not isinstance(value, bool):
+    number = value
+  else:
+    match = _QUANTITY.match(str(value).lower())
+    if match and match.group(2) in units:
+      try:
+        number, unit = float(match.group(1)), match.group(2)
+      except ValueError:
+        pass
+  if number is None or number <= 0:
+    raise ValueError(f'expected a positive {what}, got "{value}"')
+  return number * units[unit]
+
+
+def parse_seconds(value):
+  """Returns the time `value` in seconds.
+
+  Raises:
+    ValueError: if `value` is not a positive time
+  """
+  return _parse(value, _TIME_UNITS, 'time (eg "2s" or "250ms")')
+
+
+def parse_bytes(value):
+  """Returns the memory size `value` in bytes.
+
+  Raises:
+    ValueError: if `value` is not a positive size
+  """
+  return int(_parse(value, _SIZE_UNITS, 'size (eg "1024", "64K" or "2G")'))
+
+
+def parse(measure: str, value):
+  """Returns the budget `value` for `measure` in seconds or bytes."""
+  return parse_bytes(value) if measure == MAX_RSS else parse_seconds(value)
+
+
+def describe(measure: str, value):
+  """Returns a human-readable rendering of `value` of `measure`."""
+  if measure == MAX_RSS:
+    return '{:.1f}M'.format(value / _SIZE_UNITS['m'])
+  return '{:.0f}ms'.format(value * 1000)
@@ -0,0 +1,212 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Runs the build steps of the artifacts that test cases call, once per run.
+
+Environments declare the Steps that build their artifacts (see
+testenv.Base.get_builds()); artifacts sharing the same Step, such as all those
+of an environment built by one command, are built once. Before the test cases
+run, build_all() runs the Steps of the artifacts they call, in parallel.
+
+A Step that declares its inputs has a key hashing its command, working
+directory, and the names and contents of its input files. Given a Cache, a
+Step whose key matches the last successful build (and whose declared outputs
+still exist) is not run again, so its outputs are reused across runs until its
+inputs change. Steps that declare no inputs run on every run.
+"""
+
+import collections
+import concurrent.futures
+import glob
+import hashlib
+import json
+import logging
+import os
+import subprocess
+import time
+
+from sampletester import impact
+from sampletester import testplan
+from sampletester import tracing
+
+# A build step: the shell `command` to run in the directory `chdir` (or the
+# current directory, if None), and tuples of the glob patterns, relative to
+# `chdir`, of its `inputs` and `outputs`.
+Step = collections.namedtuple('Step', ['command', 'chdir', 'inputs',
+                                       'outputs'])
+
+# The outcome of running a Step: whether it was `built` (as opposed to reused
+# from the Cache), its combined stdout and stderr `output`, and the `error`
+# that made it fail, or None.
+Result = collections.namedtuple('Result', ['step', 'built', 'output',
+                                           'error'])
+
+_HASH_CHUNK = 1 << 16
+
+
+def expand(step: Step, patterns):
+  """Returns the sorted paths of the files matching `patterns` in `step`."""
+  paths = set()
+  for pattern in patterns:
+    pattern = os.path.join(step.chdir or '', pattern)
+    for path in glob.glob(pattern, recursive=True):
+      if os.path.isdir(path):
+        for directory, _, names in os.walk(path):
+          paths.update(os.path.join(directory, name) for name in names)
+      else:
+        paths.add(path)
+  return sorted(paths)
+
+
+def step_key(step: Step):
+  """Returns the key of `step`, or None if it declares no inputs."""
+  if not step.inputs:
+    return None
+  digest = hashlib.sha256()
+  digest.update(json.dumps([step.command, step.chdir, step.inputs]).encode())
+  for path in expand(step, step.inputs):
+    digest.update(b'\0' + path.encode() + b'\0')
+    with open(path, 'rb') as stream:
+      for chunk in iter(lambda: stream.read(_HASH_CHUNK), b''):
+        digest.update(chunk)
+  return digest.hexdigest()
+
+
+class Cache:
+  """The keys of the last successful builds, in the JSON file at `path`.
+
+  Without a `path`, the Cache is only kept in memory.
+  """
+
+  def __init__(self, path: str = None):
+    self.path = path
+    # built[command and chdir] is the key of the last successful build
+    self.built = {}
+    if not path:
+      return
+    try:
+      with open(path) as stream:
+        self.built = json.load(stream)
+    except FileNotFoundError:
+      pass
+    except ValueError as e:
+      logging.warning(f'ignoring malformed build cache "{path}": {e}')
+
+  @staticmethod
+  def _entry(step: Step):
+    return json.dumps([step.command, step.chdir])
+
+  def is_current(self, step: Step, key: str):
+    """Returns whether `step` last built with `key`, and its outputs exist."""
+    return (key is not None and self.built.get(self._entry(step)) == key and
+            all(expand(step, [output]) for output in step.outputs))
+
+  def update(self, step: Step, key: str):
+    if key is not None:
+      self.built[self._entry(step)] = key
+
+  def save(self):
+    if not self.path:
+      return
+    with open(self.path, 'w') as stream:
+      json.dump(self.built, stream, indent=1, sort_keys=True)
+
+
+def steps_for(manager: testplan.Manager):
+  """Returns the Steps building the artifacts the selected test cases call.
+
+  The Steps are in the order in which the test cases first call them. Test
+  cases whose calls cannot be determined without running them (see
+  impact.case_lookups()) need all the Steps of their environment.
+  """
+  steps = {}
+  for environment in manager.environments:
+    if not environment.selected():
+      continue
+    builds = environment.config.get_builds()
+    if not builds:
+      continue
+    for suite in environment.suites:
+      if not suite.selected():
+        continue
+      for case in suite.cases:
+        if not case.selected():
+          continue
+        keys = impact.case_lookups(environment, suite, case)
+        for key in (builds if keys is None else keys):
+          for step in builds.get(key, ()):
+            steps.setdefault(step, None)
+  return list(steps)
+
+
+def run_step(step: Step, cache: Cache = None):
+  """Runs `step`, unless `cache` has it current.
+
+  Returns:
+    the Result
+  """
+  try:
+    key = step_key(step)
+  except OSError as e:
+    return Result(step, False, '', e)
+  if cache and key is not None:
+    if cache.is_current(step, key):
+      tracing.count('build cache' + tracing.HITS_SUFFIX)
+      return Result(step, False, '', None)
+    tracing.count('build cache' + tracing.MISSES_SUFFIX)
+
+  with tracing.span(step.command, tracing.CATEGORY_BUILD, cwd=step.chdir):
+    start = time.monotonic()
+    process = subprocess.run(step.command, shell=True, cwd=step.chdir,
+                             stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+  output = process.stdout.decode('utf-8', errors='replace')
+  logging.info('built "{}" in {:.1f}s'.format(step.command,
+                                               time.monotonic() - start))
+  if process.returncode != 0:
+    return Result(step, True, output, subprocess.CalledProcessError(
+        process.returncode, step.command))
+  if cache:
+    cache.update(step, key)
+  return Result(step, True, output, None)
+
+
+def build_all(steps, cache: Cache = None, jobs: int = 1):
+  """Runs `steps` on `jobs` worker threads, and saves `cache`.
+
+  Returns:
+    the Results, in the order of `steps`
+  """
+  with tracing.phase('build') as counts:
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+      results = list(executor.map(lambda step: run_step(step, cache), steps))
+    counts['built'] = sum(result.built and not result.error
+                          for result in results)
+    counts['reused'] = sum(not result.built and not result.error
+                           for result in results)
+    counts['failed'] = sum(bool(result.error) for result in results)
+  if cache:
+    cache.save()
+  return results
+
+
+def describe(failures):
+  """Returns a human-readable report of the failed build Results."""
+  lines = ['{} build step{} failed:'.format(
+      len(failures), '' if len(failures) == 1 else 's')]
+  for result in failures:
+    lines.append('  {} (in {}): {}'.format(result.step.command,
+                                           result.step.chdir or '.',
+                                           result.error))
+    lines.extend('    | ' + line for line in result.output.splitlines())
+  return '\n'.join(lines)
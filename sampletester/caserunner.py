@@ -12,16 +12,35 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import collections
 import copy
 from datetime import datetime
 import logging
 import os
 import re
 import subprocess
+import sys
+import time
 import traceback
 import uuid
 
+from sampletester import budget
+from sampletester import cassette
 from sampletester import testenv
+from sampletester import tracing
+
+# The resources used by a call run by a TestCase: the `command` run, the
+# `wall` and `cpu` (user and system) time it took, in seconds, and the peak
+# resident memory of its largest process, in bytes.
+CallUsage = collections.namedtuple('CallUsage', ['command', 'wall', 'cpu',
+                                                 'max_rss'])
+
+# The status of the failures of test cases whose calls exceed their budgets
+# (see `budget`), as opposed to failing their assertions
+BUDGET_FAILURE = 'EXCEEDED BUDGET'
+
+# The unit of ru_maxrss, in bytes
+_MAX_RSS_UNIT = 1 if sys.platform == 'darwin' else 1024
 
 
 class TestCase:
@@ -29,9 +48,15 @@ class TestCase:
   # functions testing for string inclusion/exclusion in previous output.
   KEY_CONTAINS_MESSAGE='message'
 
+  # The key of `call` and `shell` directives (in their dict form) marking the
+  # call as cacheable, so that identical calls in the run share its result
+  # (see `memo`).
+  KEY_CACHEABLE='cacheable'
+
   def __init__(self, environment: testenv.Base,
                idx: int, label: str,
-               setup, case, teardown):
+               setup, case, teardown, throttle=None, cassette=None,
+               memo=None):
     self.failures = []
     self.errors = []
     self.output = ""
@@ -42,11 +67,21 @@ class TestCase:
     self.setup = setup
     self.case = case
     self.teardown = teardown
+    # a throttle.Throttle admitting each call, when cases run in parallel
+    self.throttle = throttle
+    # a cassette.CaseCassette recording or replaying the calls
+    self.cassette = cassette
+    # the memo.Memo sharing the results of cacheable calls across cases
+    self.memo = memo
 
     self.last_return_code = 0
     self.last_call_output = ""
     self.start_time = None
     self.end_time = None
+    # the CallUsage of each call run (as opposed to reused or replayed)
+    self.call_usage = []
+    # the CallUsage of the last call, or None if it was not run
+    self.last_call_usage = None
 
     # The key is the external binding available through `code` and directly through yaml keys.
     #
@@ -64,7 +99,7 @@ class TestCase:
         ### Functions to execute processes
         "call": (self.call_no_error, self.params_for_call),
         "call_may_fail": (self.call_allow_error, self.params_for_call),
-        "shell": (self.shell, self.yaml_args_string),
+        "shell": (self.shell, self.params_for_shell),
 
         ### Other functions available to the test suite
         "uuid": (self.get_uuid, self.yaml_get_uuid),
@@ -100,6 +135,12 @@ class TestCase:
                                 self.params_for_contains),
         "assert_success": (self.assert_success, self.yaml_args_string),
         "assert_failure": (self.assert_failure, self.yaml_args_string),
+        # performance budgets of the last call, or of the whole test case
+        "assert_duration_below": (self.assert_duration_below,
+                                  self.params_for_budget),
+        "assert_cpu_below": (self.assert_cpu_below, self.params_for_budget),
+        "assert_max_rss_below": (self.assert_max_rss_below,
+                                 self.params_for_budget),
         # Due to feedback in the spec, we only allow assert_ functions (which exit
         # the test case immediately) and not expect_ functions (which would allow
         # the test to continue even if an expectation is not met).
@@ -224,34 +265,56 @@ class TestCase:
     return [parts.get(key_pattern), parts.get(key_variable),
       parts.get(key_groups)], None
 
-  def call_allow_error(self, *args, **kwargs):
-    """Invokes `cmd` (formatted with `params`). Does not fail in case of error."""
+  def call_allow_error(self, *args, cacheable=None, **kwargs):
+    """Invokes `cmd` (formatted with `params`). Does not fail in case of error.
+
+    The call is memoized if `cacheable` is set or, if it is None, if the
+    environment marks the artifact called as cacheable.
+    """
     try:
       call, chdir = self.environment.get_call(*args, **kwargs)
+      if cacheable is None:
+        cacheable = self.environment.is_cacheable(args[0])
+      budgets = self.environment.get_budgets(args[0])
     except Exception as e:
       raise CallError('could not resolve call: {}'.format(str(e)))
-    return self._call_external(call, chdir)
-
-  def shell(self, cmd, *args):
-    return self._call_external(self.format_string(cmd + " {}"*len(args), *args))
-
-  def _call_external(self, cmd, chdir=None):
+    return_code, out = self._call_external(call, chdir, cacheable)
+    if return_code == 0:
+      for measure, limit in budgets.items():
+        self._check_budget(measure, limit, False,
+                           'the budget of "{}"'.format(args[0]))
+    return return_code, out
+
+  def shell(self, cmd, *args, cacheable=False):
+    return self._call_external(self.format_string(cmd + " {}"*len(args), *args),
+                               cacheable=cacheable)
+
+  def _call_external(self, cmd, chdir=None, cacheable=False):
     self.last_return_code = 0
     self.last_call_output = ""
+    self.last_call_usage = None
 
-    try:
-      self.print_out("\n# Calling: " + cmd)
-      out = subprocess.check_output(cmd, stderr=subprocess.STDOUT, shell=True, cwd=chdir)
-      return_code = 0
-    except subprocess.CalledProcessError as e:
-      return_code = e.returncode
-      out = e.output
+    if self.cassette and self.cassette.replaying:
+      # Replayed calls are cheap, and each test case replays its own.
+      self.print_out("\n# Replaying: " + cmd)
+      try:
+        return_code, out = self.cassette.replay(cmd, chdir)
+      except cassette.MissingCallError as e:
+        raise CallError(f'{e}: "{cmd}"')
+    elif cacheable and self.memo:
+      return_code, out, reused = self.memo.call(
+          self.environment.name(), cmd, chdir,
+          lambda: self._run_external(cmd, chdir))
+      if reused:
+        self.print_out("\n# Reusing the result of: " + cmd)
+    else:
+      return_code, out = self._run_external(cmd, chdir)
+
+    if self.cassette and not self.cassette.replaying:
+      self.cassette.record(cmd, chdir, return_code, out)
+    if return_code != 0:
       # TODO(vchudnov): Prefix the error output with comments
       self.output += "# ... call did not succeed  "
-      # return return_code, out
-    except Exception as e:
-      raise
-
     new_output = out.decode("utf-8")
     self.last_return_code = return_code
     # TODO: De-dupe the following. Either some accessor magic, or have it live in local_symbols
@@ -261,6 +324,29 @@ class TestCase:
     self.output += new_output
     return return_code, new_output
 
+  def _run_external(self, cmd, chdir=None):
+    """Runs `cmd`, returning its exit code and (binary) output."""
+    tokens = (self.throttle.acquire(self.environment.name())
+              if self.throttle else None)
+    return_code = None
+    span = tracing.TRACER.begin(cmd, tracing.CATEGORY_CALL,
+                                command=cmd, cwd=chdir)
+    try:
+      self.print_out("\n# Calling: " + cmd)
+      start = time.monotonic()
+      return_code, out, usage = run_process(cmd, chdir)
+      self.last_call_usage = CallUsage(
+          cmd, time.monotonic() - start, usage.ru_utime + usage.ru_stime,
+          usage.ru_maxrss * _MAX_RSS_UNIT)
+      self.call_usage.append(self.last_call_usage)
+    finally:
+      tracing.TRACER.end(span)
+      if tokens:
+        # the call could not be made if run_process() raised, eg because the
+        # process could not be spawned; exit codes are up to the sample
+        self.throttle.release(tokens, overloaded=return_code is None)
+    return return_code, out
+
   def call_no_error(self, *args, **kwargs):
     """Invokes `cmd` (formatted with `args`), failing/soft-aborting if error."""
     return_code, out = self.call_allow_error(*args, **kwargs)
@@ -319,6 +405,64 @@ class TestCase:
     message = message or "expected last call to fail"
     self.assert_that(self.last_return_code != 0, message, *args)
 
+  # Assertions on the resources used by the last call, or by the test case.
+  def assert_duration_below(self, limit, case=False, message=''):
+    """Asserts that the last call, or the test case so far, was quick enough.
+
+    `limit` is the budget of wall time (see `budget.parse_seconds()`).
+    """
+    self._check_budget(budget.DURATION, limit, case, message)
+
+  def assert_cpu_below(self, limit, case=False, message=''):
+    """Asserts that the last call, or all those of the case, used little CPU.
+
+    `limit` is the budget of CPU time (see `budget.parse_seconds()`).
+    """
+    self._check_budget(budget.CPU, limit, case, message)
+
+  def assert_max_rss_below(self, limit, case=False, message=''):
+    """Asserts that the last call, or any call of the case, used little memory.
+
+    `limit` is the budget of peak resident memory (see `budget.parse_bytes()`).
+    """
+    self._check_budget(budget.MAX_RSS, limit, case, message)
+
+  def _check_budget(self, measure: str, limit, case: bool, message: str):
+    """Soft-aborts the test if the `measure` reaches `limit`.
+
+    The `measure` is that of the last call or, if `case` is set, of the test
+    case, and reaching `limit` records a BUDGET_FAILURE. Calls that were not
+    run, because they were replayed or reused, are not checked.
+    """
+    try:
+      limit = budget.parse(measure, limit)
+    except ValueError as e:
+      raise ConfigError(f'invalid budget: {e}')
+    if case:
+      scope = 'test case'
+      usage = self.call_usage
+      if measure == budget.DURATION:
+        value = (datetime.now() - self.start_time).total_seconds()
+      elif measure == budget.CPU:
+        value = sum(call.cpu for call in usage)
+      else:
+        value = max((call.max_rss for call in usage), default=0)
+    else:
+      scope = 'last call'
+      if not self.last_call_usage:
+        self.print_out('# budget not checked: the last call was not run')
+        return
+      value = getattr(self.last_call_usage, measure)
+    if value < limit:
+      return
+    details = '{} of the {} was {}, over the budget of {}'.format(
+        budget.NAMES[measure], scope, budget.describe(measure, value),
+        budget.describe(measure, limit))
+    message = f'{message}: {details}' if message else details
+    self.record_failure(BUDGET_FAILURE, '{}', message)
+    self.print_out('# {}: {}', BUDGET_FAILURE, message)
+    raise TestFailure
+
   def _check_several(self, check, which, condition, message, values):
     """Utility function for the `expect_*` and `assert_*` calls.
 
@@ -525,6 +669,43 @@ class TestCase:
           .format(key_name, key_variable))
     return parts[key_variable], parts[key_name]
 
+  def params_for_shell(self, parts):
+    """Gets the arguments of a `shell` directive.
+
+    `parts` is either a list as for yaml_args_string(), or a dict with the
+    print string under "command", the list of arguments under "args", and
+    optionally "cacheable".
+    """
+    if not isinstance(parts, dict):
+      return self.yaml_args_string(parts)
+    key_command = "command"
+    unknown = set(parts) - {key_command, "args", TestCase.KEY_CACHEABLE}
+    if key_command not in parts or unknown:
+      log_raise(logging.critical, ValueError,
+                '"shell" expects "{}", "args" and "{}", got {}'.format(
+                    key_command, TestCase.KEY_CACHEABLE, sorted(parts)))
+    return ([parts[key_command]] + self.lookup_values(parts.get("args", [])),
+            {"cacheable": bool(parts.get(TestCase.KEY_CACHEABLE))})
+
+  def params_for_budget(self, parts):
+    """Gets the arguments of an `assert_*_below` directive.
+
+    `parts` is either the limit for the last call, or a dict with the limit
+    under either "call" or "case" (for the whole test case), and optionally a
+    "message".
+    """
+    if not isinstance(parts, dict):
+      return [parts], {}
+    scopes = [scope for scope in ("call", "case") if scope in parts]
+    unknown = set(parts) - {"call", "case", TestCase.KEY_CONTAINS_MESSAGE}
+    if len(scopes) != 1 or unknown:
+      log_raise(logging.critical, ValueError,
+                'budgets expect one of "call" or "case", and "{}", got {}'
+                .format(TestCase.KEY_CONTAINS_MESSAGE, sorted(parts)))
+    return [parts[scopes[0]]], {
+        "case": scopes[0] == "case",
+        "message": parts.get(TestCase.KEY_CONTAINS_MESSAGE, '')}
+
   def params_for_call(self, parts):
     key_cmd = self.environment.get_testcase_settings().get('call.target', 'target')
     key_params = "params"
@@ -540,6 +721,8 @@ class TestCase:
     args = []
     if len(parts) == 1:
       return [cmd], params
+    if TestCase.KEY_CACHEABLE in parts:
+      params["cacheable"] = bool(parts[TestCase.KEY_CACHEABLE])
 
     for key, val in parts.items():
       if key == key_cmd:
@@ -557,6 +740,8 @@ class TestCase:
         for value in val:
           args.append(self.get_variable_or_literal(value))
         continue
+      if key == TestCase.KEY_CACHEABLE:
+        continue
       log_raise(logging.critical, ValueError,
                 'unknown argument to function call "- {}"'.format(key))
     return [cmd] + args, params
@@ -618,6 +803,29 @@ class TestCase:
     """
     return [self.local_symbols.get(p, '"{}"'.format(str(p))) for p in strings]
 
+def run_process(cmd, chdir=None):
+  """Runs the shell command `cmd` in the directory `chdir`.
+
+  Returns:
+    the exit code of `cmd`, its combined stdout and stderr, and the
+    resource.struct_rusage of it and the processes it waited for
+  """
+  process = subprocess.Popen(cmd, stdout=subprocess.PIPE,
+                             stderr=subprocess.STDOUT, shell=True, cwd=chdir)
+  try:
+    with process.stdout:
+      out = process.stdout.read()
+  except BaseException:  # eg KeyboardInterrupt
+    process.kill()
+    process.wait()
+    raise
+  # unlike Popen.wait(), wait4() reports the resources the process used
+  _, status, usage = os.wait4(process.pid, 0)
+  process.returncode = (-os.WTERMSIG(status) if os.WIFSIGNALED(status)
+                        else os.WEXITSTATUS(status))
+  return process.returncode, out, usage
+
+
 ### Helpers for substituting symbol values
 
 _interpolated_symbol_re = re.compile('{([^}]+)}')
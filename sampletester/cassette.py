@@ -0,0 +1,155 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Records the calls test cases make, and replays them without running them.
+
+A Cassette is a directory holding two files: DATA_FILE, to which each call
+made while recording is appended as a JSON line (its command, working
+directory, exit code and output), and INDEX_FILE, a JSON object mapping the
+key of each call to the offset and length of its line in DATA_FILE. When
+replaying, only the index is read up front, and each call's line is read from
+DATA_FILE as the call is made, so that replaying a large cassette is quick.
+
+The key of a call hashes the names of the environment, suite and test case
+making it, how many calls the test case made before it, its command, and its
+working directory relative to the current one. A test case thus replays the
+same outputs however the test cases are ordered, sharded or parallelized.
+"""
+
+import hashlib
+import json
+import os
+import threading
+
+DATA_FILE = 'calls.jsonl'
+INDEX_FILE = 'index.json'
+
+
+class MissingCallError(Exception):
+  pass
+
+
+def call_key(environment: str, suite: str, case: str, sequence: int,
+             command: str, cwd: str):
+  """Returns the key of a call in a Cassette."""
+  return hashlib.sha256(json.dumps(
+      [environment, suite, case, sequence, command, cwd]).encode()).hexdigest()
+
+
+def relative_cwd(cwd: str):
+  """Returns `cwd` relative to the current directory, or None if unset."""
+  return os.path.relpath(cwd) if cwd else None
+
+
+class Cassette:
+  """The calls recorded in the directory `path`.
+
+  If `replay` is set, the calls in the directory are read to be replayed;
+  otherwise, the directory is created if needed and emptied, and the calls
+  made are recorded in it. Call close() to finish recording.
+  """
+
+  def __init__(self, path: str, replay: bool = False):
+    self.path = path
+    self.replaying = replay
+    self.lock = threading.Lock()
+    self.misses = 0
+    data_path = os.path.join(path, DATA_FILE)
+    index_path = os.path.join(path, INDEX_FILE)
+    if replay:
+      with open(index_path) as stream:
+        # index[key] is the (offset, length) of each call in DATA_FILE
+        self.index = json.load(stream)
+      self.data = open(data_path, 'rb')
+    else:
+      os.makedirs(path, exist_ok=True)
+      self.index = {}
+      self.data = open(data_path, 'wb')
+      self.index_path = index_path
+
+  def close(self):
+    if self.data.closed:
+      return
+    self.data.close()
+    if not self.replaying:
+      with open(self.index_path, 'w') as stream:
+        json.dump(self.index, stream)
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *unused):
+    self.close()
+
+  def for_case(self, environment: str, suite: str, case: str):
+    """Returns the CaseCassette of the test case named `case`."""
+    return CaseCassette(self, environment, suite, case)
+
+  def record(self, key: str, entry):
+    line = json.dumps(entry).encode() + b'\n'
+    with self.lock:
+      self.index[key] = (self.data.tell(), len(line))
+      self.data.write(line)
+
+  def replay(self, key: str):
+    """Returns the entry recorded under `key`.
+
+    Raises:
+      MissingCallError: if there is no such entry
+    """
+    location = self.index.get(key)
+    if location is None:
+      with self.lock:
+        self.misses += 1
+      raise MissingCallError(f'call not recorded in "{self.path}"')
+    offset, length = location
+    with self.lock:
+      self.data.seek(offset)
+      line = self.data.read(length)
+    return json.loads(line)
+
+
+class CaseCassette:
+  """The calls made by one test case in a Cassette, in order."""
+
+  def __init__(self, cassette: Cassette, environment: str, suite: str,
+               case: str):
+    self.cassette = cassette
+    self.replaying = cassette.replaying
+    self.names = (environment, suite, case)
+    self.sequence = 0
+
+  def _next_key(self, command: str, cwd: str):
+    key = call_key(*self.names, self.sequence, command, relative_cwd(cwd))
+    self.sequence += 1
+    return key
+
+  def record(self, command: str, cwd: str, return_code: int, output: bytes):
+    """Records the next call of the test case."""
+    self.cassette.record(self._next_key(command, cwd), {
+        'command': command,
+        'cwd': relative_cwd(cwd),
+        'return_code': return_code,
+        'output': output.decode('utf-8', errors='surrogateescape'),
+    })
+
+  def replay(self, command: str, cwd: str):
+    """Returns the (return code, output) recorded for the next call.
+
+    Raises:
+      MissingCallError: if the call was not recorded
+    """
+    entry = self.cassette.replay(self._next_key(command, cwd))
+    return (entry['return_code'],
+            entry['output'].encode('utf-8', errors='surrogateescape'))
@@ -0,0 +1,87 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Checks, before running any test case, that their references resolve.
+
+This walks the `call` directives and `{symbol}` interpolations of every
+selected test case (see `impact.case_references()`) and resolves each of them
+in the case's environment, as running the case would. Each reference is
+resolved once per environment. References that cannot be resolved (eg
+artifacts not defined in the manifest, or matching more than one of its
+elements) are reported as Problems, so that they can all be fixed before a
+long run instead of being discovered one at a time as it goes.
+
+References made by `code` directives cannot be found without running them,
+and are not checked.
+"""
+
+import collections
+
+from sampletester import impact
+from sampletester import testplan
+from sampletester import tracing
+
+# A reference of a test case that could not be resolved. `kind` and `name` are
+# as yielded by impact.case_references(), and `error` is the exception raised
+# when resolving it.
+Problem = collections.namedtuple(
+    'Problem', ['environment', 'suite', 'case', 'kind', 'name', 'error'])
+
+
+def check(manager: testplan.Manager):
+  """Returns the Problems resolving the references of the selected cases."""
+  problems = []
+  with tracing.phase('check') as counts:
+    references = 0
+    for environment in manager.environments:
+      if not environment.selected():
+        continue
+      resolve = {impact.REFERENCE_CALL: environment.config.get_call,
+                 impact.REFERENCE_SYMBOL: environment.config.get_symbol}
+      # (kind, name) -> the error resolving it, or None
+      errors = {}
+      for suite in environment.suites:
+        if not suite.selected():
+          continue
+        for case in suite.cases:
+          if not case.selected():
+            continue
+          for kind, name in impact.case_references(environment, suite, case):
+            if kind not in resolve:
+              continue
+            if (kind, name) not in errors:
+              references += 1
+              try:
+                resolve[kind](name)
+                errors[kind, name] = None
+              except Exception as e:
+                errors[kind, name] = e
+            if errors[kind, name] is not None:
+              problems.append(Problem(environment.name(), suite.name(),
+                                      case.name(), kind, name,
+                                      errors[kind, name]))
+    counts['references'] = references
+    counts['problems'] = len(problems)
+  return problems
+
+
+def describe(problems):
+  """Returns a human-readable report of `problems`."""
+  lines = ['found {} problem{} resolving test case references:'
+           .format(len(problems), '' if len(problems) == 1 else 's')]
+  for problem in problems:
+    lines.append('  {}: suite "{}": case "{}": {} "{}": {}'.format(
+        problem.environment, problem.suite, problem.case, problem.kind,
+        problem.name, problem.error))
+  return '\n'.join(lines)
@@ -31,9 +31,12 @@
 
 
 import argparse
+import atexit
 import contextlib
+import json
 import logging
 import os
+import signal
 import string
 import sys
 import traceback
@@ -42,12 +45,28 @@ from typing import Dict
 from typing import List
 from typing import Tuple
 
+from sampletester import benchmark
+from sampletester import build
+from sampletester import cassette
+from sampletester import check
+from sampletester import client
+from sampletester import compiled_manifest
 from sampletester import convention
 from sampletester import environment_registry
+from sampletester import history
+from sampletester import impact
 from sampletester import inputs
+from sampletester import jobserver
+from sampletester import journal
+from sampletester import load
+from sampletester import parallel
 from sampletester import runner
+from sampletester import sample_manifest
 from sampletester import summary
 from sampletester import testplan
+from sampletester import throttle
+from sampletester import tracing
+from sampletester import watch
 from sampletester import xunit
 
 VERSION = '0.16.3'
@@ -62,6 +81,10 @@ EXITCODE_USER_ABORT = 4
 DEBUGME=False
 
 def main():
+  command = COMMANDS.get(sys.argv[1]) if len(sys.argv) > 1 else None
+  if command:
+    exit(command(sys.argv[2:]))
+
   args, usage = parse_cli()
   if not args:
     exit(EXITCODE_SETUP_ERROR)
@@ -77,15 +100,88 @@ def main():
   global DEBUGME
   DEBUGME = DEBUGME or (log_level == logging.DEBUG)
 
+  if args.trace:
+    tracing.TRACER.enable()
+    atexit.register(write_trace, args.trace)
+  if args.timings:
+    atexit.register(print_timings)
+
+  if args.resume and not args.journal:
+    print('ERROR: --resume requires --journal')
+    exit(EXITCODE_FLAG_ERROR)
+  if args.failed_first and not args.history:
+    print('ERROR: --failed-first requires --history')
+    exit(EXITCODE_FLAG_ERROR)
+  if args.balance_shards and not (args.shard and args.history):
+    print('ERROR: --balance-shards requires --shard and --history')
+    exit(EXITCODE_FLAG_ERROR)
+
+  if args.jobs < 1:
+    print('ERROR: --jobs must be at least 1')
+    exit(EXITCODE_FLAG_ERROR)
+  if args.repeat < 1 or args.warmup < 0:
+    print('ERROR: --repeat must be at least 1, and --warmup at least 0')
+    exit(EXITCODE_FLAG_ERROR)
+  benchmarking = args.repeat > 1 or args.warmup > 0 or args.benchmark_json
+  if benchmarking and args.replay:
+    print('ERROR: --repeat, --warmup and --benchmark-json time calls, ' +
+          'which --replay does not make')
+    exit(EXITCODE_FLAG_ERROR)
   try:
-    indexed_docs = inputs.index_docs(*args.files)
+    concurrency, environment_concurrency = throttle.parse_limits(
+        args.concurrency, int, '--concurrency')
+    calls_per_second, environment_calls_per_second = throttle.parse_limits(
+        args.calls_per_second, float, '--calls-per-second')
+  except ValueError as e:
+    print(f'ERROR: {e}')
+    exit(EXITCODE_FLAG_ERROR)
 
-    registry = environment_registry.new(args.convention, indexed_docs)
-    test_suites = testplan.suites_from(indexed_docs, args.suites, args.cases)
+  if args.watch:
+    exit(watch_inputs(args, usage))
+
+  if args.server:
+    exit(run_on_server(args))
+
+  try:
+    with tracing.phase('load inputs') as counts:
+      indexed_docs = inputs.index_docs(*args.files)
+      counts['manifest documents'] = len(
+          indexed_docs.of_type(sample_manifest.SCHEMA.primary_type))
+      counts['testplan documents'] = len(
+          indexed_docs.of_type(testplan.SCHEMA.primary_type))
+
+    with tracing.phase('create environments') as counts:
+      registry = environment_registry.new(args.convention, indexed_docs)
+      counts['environments'] = len(registry.get_names())
+
+    with tracing.phase('read test suites') as counts:
+      test_suites = testplan.suites_from(indexed_docs, args.suites, args.cases)
+      counts['suites'] = len(test_suites)
+      counts['cases'] = sum(len(suite.cases) for suite in test_suites)
 
     if len(test_suites) == 0:
       exit(EXITCODE_SUCCESS)
-    manager = testplan.Manager(registry, test_suites, args.envs)
+
+    with tracing.phase('build test plan') as counts:
+      manager = testplan.Manager(registry, test_suites, args.envs)
+      changed_paths = changed_files(args)
+      if changed_paths is not None:
+        counts['unaffected cases'] = impact.select_affected(manager,
+                                                            changed_paths)
+      durations = history.History(args.history) if args.history else None
+      # shard before reordering, so that the shards only depend on inputs
+      # every shard shares
+      if args.shard:
+        manager.shard(*testplan.parse_shard(args.shard),
+                      durations.estimate if args.balance_shards else None)
+      if durations:
+        manager.order_cases(durations.estimate,
+                            durations.failed if args.failed_first else None)
+      make_jobserver = make_jobserver_client() if args.jobserver else None
+      run_throttle = parallel.new_throttle(
+          manager, args.jobs, concurrency, calls_per_second,
+          environment_concurrency, environment_calls_per_second,
+          args.adaptive, make_jobserver)
 
   except Exception as e:
     logging.error(f'fatal error: {repr(e)}')
@@ -98,15 +194,98 @@ def main():
 
   verbosity = VERBOSITY_LEVELS[args.verbosity]
   quiet = verbosity == summary.Detail.NONE
-  visitor = testplan.MultiVisitor(runner.Visitor(args.fail_fast),
-                                  summary.SummaryVisitor(verbosity,
-                                                         not args.suppress_failures,
-                                                         debug=DEBUGME))
+
+  if args.check or args.check_first:
+    problems = check.check(manager)
+    if problems:
+      print(check.describe(problems))
+      exit(EXITCODE_SETUP_ERROR)
+    if args.check:
+      if not quiet:
+        print('all test case references resolved')
+      exit(EXITCODE_SUCCESS)
+
+  # replayed calls need no samples, built or not
+  steps = [] if args.replay else build.steps_for(manager)
+  if steps:
+    try:
+      results = build.build_all(
+          steps, build.Cache(args.build_cache) if args.build_cache else None,
+          args.jobs)
+    except Exception as e:
+      print(f'\nERROR: could not build samples: {e}\n')
+      exit(EXITCODE_SETUP_ERROR)
+    failures = [result for result in results if result.error]
+    if failures:
+      print(build.describe(failures))
+      exit(EXITCODE_SETUP_ERROR)
+
+  run_journal = None
+  resumed_passed = True
+  if args.journal:
+    try:
+      run_journal = journal.Journal(args.journal, args.resume)
+    except Exception as e:
+      print(f'\nERROR: could not open journal "{args.journal}": {e}\n')
+      exit(EXITCODE_SETUP_ERROR)
+    resumed = run_journal.skip_finished(manager)
+    resumed_passed = all(outcome == history.OUTCOME_PASSED
+                         for outcome in resumed)
+    if resumed:
+      print('resuming: skipping {} test cases finished before ({} failed)'
+            .format(len(resumed),
+                    sum(outcome != history.OUTCOME_PASSED
+                        for outcome in resumed)))
+
+  calls = None
+  if args.record or args.replay:
+    try:
+      calls = cassette.Cassette(args.record or args.replay,
+                                replay=bool(args.replay))
+    except Exception as e:
+      print('\nERROR: could not open cassette "{}": {}\n'
+            .format(args.record or args.replay, e))
+      exit(EXITCODE_SETUP_ERROR)
+
+  scheduler = None
+  if args.jobs > 1 or run_throttle:
+    scheduler = parallel.Scheduler(manager, args.jobs, run_throttle,
+                                   args.fail_fast, calls, args.repeat,
+                                   args.warmup)
+  visitors = [runner.Visitor(args.fail_fast, scheduler, calls, args.repeat,
+                             args.warmup),
+              summary.SummaryVisitor(verbosity, not args.suppress_failures,
+                                     debug=DEBUGME)]
+  if run_journal:
+    visitors.append(journal.Visitor(run_journal))
+  visitor = testplan.MultiVisitor(*visitors)
   try:
-    success = manager.accept(visitor)
+    with tracing.phase('run'), contextlib.ExitStack() as running:
+      if scheduler:
+        running.enter_context(scheduler)
+      success = manager.accept(visitor) and resumed_passed
   except KeyboardInterrupt:
     print('\nkeyboard interrupt; aborting')
+    if durations and not benchmarking:
+      record_durations(durations, manager)
+    if run_journal:
+      print('resume the run by passing --resume along with the same flags')
     exit(EXITCODE_USER_ABORT)
+  finally:
+    if run_journal:
+      run_journal.close()
+    if make_jobserver:
+      make_jobserver.close()
+    if calls:
+      calls.close()
+
+  # The durations of repeated runs are not those of ordinary runs.
+  if durations and not benchmarking:
+    record_durations(durations, manager)
+
+  if calls and calls.misses:
+    print('\nERROR: {} call{} not recorded in cassette "{}"'.format(
+        calls.misses, ' was' if calls.misses == 1 else 's were', args.replay))
 
   if not quiet or (not success and not args.suppress_failures):
     print()
@@ -115,9 +294,23 @@ def main():
     else:
       print("Tests failed")
 
+  if benchmarking:
+    report = manager.accept(benchmark.Visitor(args.repeat, args.warmup))
+    print()
+    print(benchmark.describe(report))
+    if args.benchmark_json:
+      try:
+        with smart_open(args.benchmark_json) as json_output:
+          json.dump(report, json_output, indent=2)
+      except Exception as e:
+        print('could not write benchmark output to {}: {}'
+              .format(args.benchmark_json, e))
+        exit(EXITCODE_FLAG_ERROR)
+
   if args.xunit:
     try:
-      with smart_open(args.xunit) as xunit_output:
+      with tracing.phase('report'), \
+           smart_open(args.xunit) as xunit_output:
         xunit_output.write(manager.accept(xunit.Visitor()))
       if not quiet:
         print('xUnit output written to "{}"'.format(args.xunit))
@@ -163,6 +356,17 @@ def parse_cli():
   parser.add_argument(
       "--xunit", metavar="FILE", help="xunit output file (use `-` for stdout)")
 
+  parser.add_argument(
+      "--trace", metavar="FILE",
+      help=("write a timeline of the run to FILE in the Chrome trace-event " +
+            "format (viewable in chrome://tracing or Perfetto)"))
+
+  parser.add_argument(
+      "--timings",
+      help=("print a summary of how long each phase of the run took, with " +
+            "counts of the inputs processed"),
+      action="store_true")
+
   parser.add_argument(
       "-v", "--verbosity",
       help=('how much output to show for passing tests (default: "{}")'
@@ -213,10 +417,533 @@ def parse_cli():
             "additional test cases/suites/environments from running"),
       action="store_true")
 
+  parser.add_argument(
+      "--watch",
+      help=("after running the tests, keep polling the test plans, manifests " +
+            "and sample files (their `path` tags) for changes, and re-run " +
+            "the test cases affected by each change"),
+      action="store_true")
+
+  checks = parser.add_mutually_exclusive_group()
+  checks.add_argument(
+      "--check",
+      help=("instead of running the selected test cases, check that all the " +
+            "artifacts they call and the symbols they interpolate resolve, " +
+            "and report those that do not"),
+      action="store_true")
+  checks.add_argument(
+      "--check-first",
+      help=("run the checks of --check first, and run the test cases only " +
+            "if they pass"),
+      action="store_true")
+
+  parser.add_argument(
+      "--history", metavar="FILE",
+      help=("keep the durations of the test cases run in the SQLite " +
+            "database FILE, and use those of previous runs to run the " +
+            "longest test cases first (the durations of runs with --repeat, " +
+            "--warmup or --benchmark-json are not kept)"))
+
+  parser.add_argument(
+      "--failed-first",
+      help=("run the test cases that failed when they last ran (according " +
+            "to --history) before the others"),
+      action="store_true")
+
+  parser.add_argument(
+      "--build-cache", metavar="FILE",
+      help=("remember in FILE the inputs of the sample builds (the `build` " +
+            "manifest tags) that succeeded, and skip those builds in later " +
+            "runs while their `build_inputs` are unchanged"))
+
+  parser.add_argument(
+      "--journal", metavar="FILE",
+      help=("record each test case in FILE as it finishes, so that an " +
+            "interrupted run can be resumed with --resume"))
+
+  parser.add_argument(
+      "--resume",
+      help=("skip the test cases already recorded in the --journal FILE by " +
+            "an interrupted run, and append the rest to it; the run fails " +
+            "if any of the skipped test cases failed"),
+      action="store_true")
+
+  parser.add_argument(
+      "--shard", metavar="INDEX/COUNT",
+      help=("run only one of COUNT equal shares of the selected test cases, " +
+            "numbered from 0 (eg `--shard 1/4` runs the second quarter)"))
+
+  parser.add_argument(
+      "--balance-shards",
+      help=("deal the test cases into the --shard shares by their durations " +
+            "in the --history FILE, so that the shares take about as long " +
+            "as each other. Every shard must read an identical copy of FILE " +
+            "(eg one restored from a shared cache): shards reading " +
+            "different histories split the test cases differently, and " +
+            "may run some twice and others not at all"),
+      action="store_true")
+
+  parser.add_argument(
+      "--jobs", metavar="N", type=int, default=1,
+      help=("run up to N test cases at once; their results are still " +
+            "reported in order"))
+
+  parser.add_argument(
+      "--concurrency", metavar="[ENVIRONMENT=]N", action="append",
+      help=("allow at most N sample calls in flight at once, overall or in " +
+            "ENVIRONMENT (overriding its `concurrency` manifest tag); may " +
+            "be repeated"))
+
+  parser.add_argument(
+      "--calls-per-second", metavar="[ENVIRONMENT=]RATE", action="append",
+      help=("start at most RATE sample calls per second, overall or in " +
+            "ENVIRONMENT (overriding its `calls_per_second` manifest tag); " +
+            "may be repeated"))
+
+  parser.add_argument(
+      "--adaptive",
+      help=("adapt the concurrency limits as calls finish, backing off " +
+            "when calls cannot be spawned or slow down, and ramping back up " +
+            "when they finish promptly; samples exiting with an error do " +
+            "not count as failures"),
+      action="store_true")
+
+  parser.add_argument(
+      "--jobserver",
+      help=("when run from `make -j`, take one of make's job slots for each " +
+            "sample call in flight, so that make and sample-tester share " +
+            "its job limit; the recipe must be marked recursive (`+`)"),
+      action="store_true")
+
+  parser.add_argument(
+      "--repeat", metavar="N", type=int, default=1,
+      help=("run each selected test case N times, and report the " +
+            "distribution of the wall and CPU times of its sample calls " +
+            "per test case and per environment"))
+
+  parser.add_argument(
+      "--warmup", metavar="M", type=int, default=0,
+      help=("before the --repeat runs of each test case, run it M times " +
+            "without timing its calls"))
+
+  parser.add_argument(
+      "--benchmark-json", metavar="FILE",
+      help=("write the call times of --repeat to FILE as JSON, in seconds " +
+            "(use `-` for stdout)"))
+
+  cassettes = parser.add_mutually_exclusive_group()
+  cassettes.add_argument(
+      "--record", metavar="DIR",
+      help=("record the command, working directory, exit code and output " +
+            "of each sample call in the cassette directory DIR"))
+  cassettes.add_argument(
+      "--replay", metavar="DIR",
+      help=("instead of running samples, replay the calls recorded with " +
+            "--record in DIR; test cases making calls not recorded there " +
+            "fail with an error. Samples are not built"))
+
+  changes = parser.add_mutually_exclusive_group()
+  changes.add_argument(
+      "--changed-files", metavar="FILE",
+      help=("run only the test cases affected by changes to the files " +
+            "listed, one per line, in FILE (use `-` for stdin); the others " +
+            "are reported as skipped"))
+  changes.add_argument(
+      "--since", metavar="GIT_REV",
+      help=("run only the test cases affected by the files changed since " +
+            "GIT_REV, as listed by `git diff --name-only GIT_REV`; the " +
+            "others are reported as skipped"))
+
+  parser.add_argument(
+      "--server", metavar="SOCKET",
+      help=("send the run to the `sample-tester serve` daemon listening on " +
+            "SOCKET, which keeps the inputs of previous runs loaded"))
+
   parser.add_argument("files", metavar="CONFIGS", nargs=argparse.REMAINDER)
   return parser.parse_args(), parser.format_usage()
 
 
+def watch_inputs(args, usage):
+  """Runs the tests in `args` in watch mode until interrupted.
+
+  Returns the exit code.
+  """
+  if args.xunit:
+    print('ERROR: --xunit cannot be used with --watch')
+    return EXITCODE_FLAG_ERROR
+  if (args.check or args.check_first or args.history or args.shard or
+      args.journal or args.changed_files or args.since or args.jobs > 1 or
+      args.concurrency or args.calls_per_second or args.adaptive or
+      args.jobserver or args.record or args.replay or args.repeat > 1 or
+      args.warmup or args.benchmark_json):
+    print('ERROR: --check, --check-first, --history, --shard, --journal, '
+          '--changed-files, --since, --jobs, --concurrency, '
+          '--calls-per-second, --adaptive, --jobserver, --record, --replay, '
+          '--repeat, --warmup and --benchmark-json cannot be used with '
+          '--watch')
+    return EXITCODE_FLAG_ERROR
+  watcher = watch.Watcher(args.files, args.convention, args.envs, args.suites,
+                          args.cases, args.fail_fast,
+                          VERBOSITY_LEVELS[args.verbosity],
+                          not args.suppress_failures, debug=DEBUGME,
+                          build_cache=build.Cache(args.build_cache))
+  try:
+    watcher.watch()
+  except KeyboardInterrupt:
+    print('\nstopped watching')
+    return EXITCODE_SUCCESS
+  except Exception as e:
+    logging.error(f'fatal error: {repr(e)}')
+    print(f'\nERROR: could not run tests because {e}\n')
+    if DEBUGME:
+      traceback.print_exc(file=sys.stdout)
+    else:
+      print(usage)
+    return EXITCODE_SETUP_ERROR
+
+
+def record_durations(durations: history.History, manager: testplan.Manager):
+  """Records the durations of the test cases run by `manager`."""
+  try:
+    with tracing.phase('record durations') as counts, durations:
+      counts['cases'] = durations.record(manager)
+  except Exception as e:
+    print('could not record test case durations in {}: {}'
+          .format(durations.path, e))
+
+
+def make_jobserver_client():
+  """Returns the jobserver.Client for the jobserver in MAKEFLAGS, if any.
+
+  Returns None, after printing a warning, if there is no usable jobserver.
+  """
+  makeflags = os.environ.get('MAKEFLAGS')
+  try:
+    make_client = jobserver.Client.from_makeflags(makeflags)
+    if make_client:
+      return make_client
+    if makeflags is not None:
+      # make is running jobs serially
+      return jobserver.Client()
+    print('WARNING: not run from make; ignoring --jobserver')
+  except OSError as e:
+    print(f'WARNING: jobserver unavailable ({e}); ignoring --jobserver')
+  return None
+
+
+def changed_files(args):
+  """Returns the paths of the changed files selected by `args`, if any.
+
+  Returns None if the tests are not to be selected by the changed files.
+  """
+  if args.changed_files:
+    return impact.changed_files_from(args.changed_files)
+  if args.since:
+    return impact.changed_files_since(args.since)
+  return None
+
+
+def run_on_server(args):
+  """Sends the run in `args` to the server at `args.server`.
+
+  Returns the exit code.
+  """
+  if (args.watch or args.trace or args.check or args.check_first or
+      args.journal or args.jobs > 1 or args.concurrency or
+      args.calls_per_second or args.adaptive or args.jobserver or
+      args.record or args.replay or args.repeat > 1 or args.warmup or
+      args.benchmark_json):
+    print('ERROR: --watch, --trace, --check, --check-first, --journal, '
+          '--jobs, --concurrency, --calls-per-second, --adaptive, '
+          '--jobserver, --record, --replay, --repeat, --warmup and '
+          '--benchmark-json cannot be used with --server')
+    return EXITCODE_FLAG_ERROR
+  try:
+    changed_paths = changed_files(args)
+  except Exception as e:
+    print(f'\nERROR: could not run tests because {e}\n')
+    return EXITCODE_SETUP_ERROR
+  request = {
+      'cwd': os.getcwd(),
+      'files': args.files,
+      'convention': args.convention,
+      'envs': args.envs,
+      'suites': args.suites,
+      'cases': args.cases,
+      'shard': args.shard,
+      'balance_shards': args.balance_shards,
+      'history': args.history,
+      'failed_first': args.failed_first,
+      'build_cache': args.build_cache,
+      'changed_files': (None if changed_paths is None
+                        else sorted(changed_paths)),
+      'fail_fast': args.fail_fast,
+      'verbosity': VERBOSITY_LEVELS[args.verbosity].name,
+      'show_errors': not args.suppress_failures,
+      'xunit': args.xunit,
+  }
+  try:
+    result = client.run(args.server, request)
+  except KeyboardInterrupt:
+    print('\nkeyboard interrupt; aborting')
+    return EXITCODE_USER_ABORT
+  except OSError as e:
+    print(f'\nERROR: could not run tests on server "{args.server}": {e}\n')
+    return EXITCODE_SETUP_ERROR
+  return {client.RESULT_PASSED: EXITCODE_SUCCESS,
+          client.RESULT_FAILED: EXITCODE_TEST_FAILURE}.get(result,
+                                                           EXITCODE_SETUP_ERROR)
+
+
+def serve(argv):
+  """Runs `sample-tester serve` with the arguments in `argv`.
+
+  Returns the exit code.
+  """
+  parser = argparse.ArgumentParser(
+      prog="sample-tester serve",
+      description=("Serve test runs sent by `sample-tester --server SOCKET` " +
+                   "over the Unix domain socket SOCKET, keeping the test " +
+                   "plans and indexed manifests of recent runs loaded " +
+                   "between runs"))
+  parser.add_argument(
+      "--socket", metavar="SOCKET", required=True,
+      help="the path of the Unix domain socket to listen on")
+  parser.add_argument(
+      "-l",
+      "--logging",
+      help=('show logs at the specified level (default: "{}")'
+            .format(DEFAULT_LOG_LEVEL)),
+      choices=list(LOG_LEVELS.keys()),
+      default="none")
+  args = parser.parse_args(argv)
+
+  logging.getLogger().setLevel(LOG_LEVELS[args.logging])
+  # Imported here so that clients, which share this module, do not load it.
+  from sampletester import server
+
+  # Stop cleanly, removing the socket, when terminated.
+  signal.signal(signal.SIGTERM, signal.default_int_handler)
+  print('serving on "{}" (press Ctrl-C to stop)'.format(args.socket))
+  try:
+    server.serve(args.socket)
+  except KeyboardInterrupt:
+    print('\nstopped serving')
+  except OSError as e:
+    print(f'\nERROR: could not serve on "{args.socket}": {e}\n')
+    return EXITCODE_SETUP_ERROR
+  return EXITCODE_SUCCESS
+
+
+def compile_manifest(argv):
+  """Runs `sample-tester compile-manifest` with the arguments in `argv`.
+
+  Returns the exit code.
+  """
+  parser = argparse.ArgumentParser(
+      prog="sample-tester compile-manifest",
+      description=("Index the manifests in MANIFEST_PATHS and write them to " +
+                   "a compiled manifest file, which can then be passed to " +
+                   "sample-tester instead of the manifests themselves"))
+  parser.add_argument(
+      "-c",
+      "--convention",
+      metavar="CONVENTION:ARG,ARG,...",
+      help=('the convention the compiled manifest will be used with; it must ' +
+            'match the one used when running the tests ' +
+            '(default: "{}")'.format(convention.DEFAULT)),
+      default=convention.DEFAULT)
+  parser.add_argument(
+      "-o", "--output", metavar="FILE", required=True,
+      help=('the compiled manifest file to write, conventionally ending in ' +
+            '"{}"'.format(compiled_manifest.EXTENSION)))
+  parser.add_argument(
+      "-l",
+      "--logging",
+      help=('show logs at the specified level (default: "{}")'
+            .format(DEFAULT_LOG_LEVEL)),
+      choices=list(LOG_LEVELS.keys()),
+      default="none")
+  parser.add_argument(
+      "--timings",
+      help="print a summary of how long each phase of the compilation took",
+      action="store_true")
+  parser.add_argument("files", metavar="MANIFEST_PATHS", nargs="+")
+  args = parser.parse_args(argv)
+
+  logging.getLogger().setLevel(LOG_LEVELS[args.logging])
+  if args.timings:
+    atexit.register(print_timings)
+
+  convention_name, testcase_args, manifest_options = (
+      environment_registry.parse_spec(args.convention))
+  if convention_name != 'tag' or not testcase_args:
+    print('ERROR: only manifests for the "tag" convention, with at least one '
+          'argument, can be compiled; got "{}"'.format(args.convention))
+    return EXITCODE_FLAG_ERROR
+
+  # Imported here, like every convention, only when needed.
+  from sampletester.convention import tag
+
+  try:
+    with tracing.phase('load inputs') as counts:
+      paths = inputs.get_globbed(*args.files)
+      paths |= inputs.get_globbed(*{f'{path}/**/*.yaml'
+                                    for path in paths if os.path.isdir(path)})
+      indexed_docs = inputs.create_indexed_docs(*paths)
+      manifest = sample_manifest.Manifest(*tag.manifest_indices(testcase_args))
+      manifest.convention = tag.convention_spec(testcase_args,
+                                                manifest_options)
+      manifest.from_docs(indexed_docs)
+      counts['manifest documents'] = len(manifest.sources)
+    if manifest.compiled_sources:
+      raise ValueError('cannot compile already compiled manifests: "{}"'
+                       .format('", "'.join(manifest.compiled_sources)))
+    if not manifest.sources:
+      raise ValueError('no manifests found in {}'.format(args.files))
+    manifest.index()
+    num_elements = manifest.compile(args.output)
+  except Exception as e:
+    logging.error(f'fatal error: {repr(e)}')
+    print(f'\nERROR: could not compile manifest because {e}\n')
+    if DEBUGME:
+      traceback.print_exc(file=sys.stdout)
+    return EXITCODE_SETUP_ERROR
+
+  print('compiled {} manifest elements from {} documents into "{}"'
+        .format(num_elements, len(manifest.sources), args.output))
+  return EXITCODE_SUCCESS
+
+
+def load_test(argv):
+  """Runs `sample-tester load` with the arguments in `argv`.
+
+  Returns the exit code.
+  """
+  parser = argparse.ArgumentParser(
+      prog="sample-tester load",
+      description=("Load-test the services behind a sample by running the " +
+                   "test case NAME over and over for a duration, validating " +
+                   "each iteration, and report its throughput, error rate " +
+                   "and latency over time"))
+  parser.add_argument(
+      "-c",
+      "--convention",
+      metavar="CONVENTION:ARG,ARG,...",
+      help=('name of the convention to use in resolving artifact names in ' +
+            'specific languages, and a comma-separated list of arguments to ' +
+            'that convention (default: "{}")'.format(convention.DEFAULT)),
+      default=convention.DEFAULT)
+  parser.add_argument(
+      "--case", metavar="NAME", required=True,
+      help="the name of the test case to run")
+  parser.add_argument(
+      "--envs", metavar="TESTENV_FILTER",
+      help="regex filtering the test environments to find the test case in")
+  parser.add_argument(
+      "--suites", metavar="SUITE_FILTER",
+      help="regex filtering the test suites to find the test case in")
+  parser.add_argument(
+      "--duration", metavar="SECONDS", type=float, required=True,
+      help="how long to keep starting iterations of the test case")
+  parser.add_argument(
+      "--concurrency", metavar="N", type=int, default=1,
+      help="run up to N iterations at once (default: 1)")
+  parser.add_argument(
+      "--rate", metavar="RATE", type=float,
+      help=("start at most RATE iterations per second; --concurrency must " +
+            "be high enough to sustain it"))
+  parser.add_argument(
+      "--window", metavar="SECONDS", type=float, default=1.0,
+      help=("report the iterations started in each window of SECONDS " +
+            "(default: 1)"))
+  parser.add_argument(
+      "--json", metavar="FILE",
+      help="also write the report to FILE as JSON (use `-` for stdout)")
+  parser.add_argument(
+      "-l",
+      "--logging",
+      help=('show logs at the specified level (default: "{}")'
+            .format(DEFAULT_LOG_LEVEL)),
+      choices=list(LOG_LEVELS.keys()),
+      default="none")
+  parser.add_argument("files", metavar="CONFIGS", nargs="+")
+  args = parser.parse_args(argv)
+
+  logging.getLogger().setLevel(LOG_LEVELS[args.logging])
+  if args.concurrency < 1:
+    print('ERROR: --concurrency must be at least 1')
+    return EXITCODE_FLAG_ERROR
+  if args.duration <= 0 or args.window <= 0 or (args.rate is not None and
+                                                 args.rate <= 0):
+    print('ERROR: --duration, --window and --rate must be positive')
+    return EXITCODE_FLAG_ERROR
+
+  try:
+    indexed_docs = inputs.index_docs(*args.files)
+    registry = environment_registry.new(args.convention, indexed_docs)
+    test_suites = testplan.suites_from(indexed_docs, args.suites)
+    manager = testplan.Manager(registry, test_suites, args.envs)
+    environment, suite, idx, tcase = load.find_case(manager, args.case)
+    manager.keep_cases(lambda *found: found == (environment, suite, tcase))
+    failures = [result for result
+                in build.build_all(build.steps_for(manager))
+                if result.error]
+  except Exception as e:
+    logging.error(f'fatal error: {repr(e)}')
+    print(f'\nERROR: could not run load test because {e}\n')
+    if DEBUGME:
+      traceback.print_exc(file=sys.stdout)
+    return EXITCODE_SETUP_ERROR
+  if failures:
+    print(build.describe(failures))
+    return EXITCODE_SETUP_ERROR
+
+  print('load-testing "{}" of suite "{}" in environment "{}" for {}s'
+        .format(tcase.name(), suite.name(), environment.name(),
+                args.duration))
+  try:
+    iterations, failure = load.run(environment, suite, idx, tcase,
+                                   args.duration, args.concurrency, args.rate)
+  except KeyboardInterrupt:
+    print('\nkeyboard interrupt; aborting')
+    return EXITCODE_USER_ABORT
+  report = load.summarize(iterations, args.duration, args.window)
+  print(load.describe(report))
+  if failure:
+    print('\nThe first iteration to fail:')
+    for status, message in failure.get_failures() + failure.get_errors():
+      print(f'  {status}: {message}')
+    print(failure.get_output(4, '| '))
+  if args.json:
+    try:
+      with smart_open(args.json) as json_output:
+        json.dump(report, json_output, indent=2)
+    except Exception as e:
+      print('could not write load test report to {}: {}'.format(args.json, e))
+      return EXITCODE_FLAG_ERROR
+  return EXITCODE_TEST_FAILURE if report['failed'] else EXITCODE_SUCCESS
+
+
+# Subcommands, by the name given as the first argument to sample-tester
+COMMANDS = {
+    'compile-manifest': compile_manifest,
+    'load': load_test,
+    'serve': serve,
+}
+
+
+def write_trace(filename: str):
+  try:
+    tracing.TRACER.write(filename)
+  except Exception as e:
+    print("could not write trace to {}: {}".format(filename, e))
+
+
+def print_timings():
+  print(tracing.TIMINGS.summary(), file=sys.stderr)
+
+
 # from https://stackoverflow.com/a/17603000
 @contextlib.contextmanager
 def smart_open(filename: str=None):
@@ -0,0 +1,71 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Sends test runs to a `sample-tester serve` daemon (see `server`).
+
+This module is deliberately small and imports nothing else from sampletester,
+so that a client does not pay for loading what the server already has loaded.
+
+The protocol consists of JSON objects, one per line. The client sends a single
+request, whose keys are those of `server.REQUEST_DEFAULTS`; unless the request
+specifies one, `run()` adds the client's environment variables as "env", so
+that the samples run with them. The server then
+sends a sequence of messages, each with one of these keys:
+  - "stdout" or "stderr": output of the run, to be written to the client's
+    stdout or stderr
+  - "result": one of the RESULT_* values below. This is the last message.
+"""
+
+import json
+import os
+import socket
+import sys
+
+RESULT_PASSED = 'passed'
+RESULT_FAILED = 'failed'
+RESULT_ERROR = 'error'
+
+
+def run(socket_path: str, request, stdout=None, stderr=None):
+  """Sends a run `request` to the server listening on `socket_path`.
+
+  The run uses the client's environment variables unless `request` specifies
+  an "env". The output of the run is written to `stdout` and `stderr` (by default,
+  sys.stdout and sys.stderr) as it is received.
+
+  Returns:
+    the result of the run, one of the RESULT_* values
+
+  Raises:
+    OSError: if the server cannot be reached
+    ConnectionError: if the server closes the connection before the end of
+      the run
+  """
+  request = dict({'env': dict(os.environ)}, **request)
+  streams = {'stdout': stdout or sys.stdout, 'stderr': stderr or sys.stderr}
+  with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+    connection.connect(socket_path)
+    connection.sendall((json.dumps(request) + '\n').encode('utf-8'))
+    with connection.makefile('r', encoding='utf-8') as responses:
+      for line in responses:
+        message = json.loads(line)
+        if 'result' in message:
+          return message['result']
+        for name, text in message.items():
+          stream = streams.get(name)
+          if stream:
+            stream.write(text)
+            stream.flush()
+  raise ConnectionError(
+      f'the server at "{socket_path}" closed the connection during the run')
@@ -0,0 +1,348 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Reads and writes compiled manifests.
+
+A compiled manifest is a binary snapshot of an indexed `sample_manifest.Manifest`
+(after tag inclusions and implicit tags have been resolved), so that repeated
+runs against the same large manifest need neither parse its YAML nor index it
+again. It is read via mmap, and elements are only decoded into dicts when
+looked up.
+
+The header records, besides the sizes and offsets of the sections, the spec of
+the convention the manifest was compiled for (eg "tag:sample"), since the
+elements are indexed by the convention arguments. It is followed by these
+sections, all little-endian:
+  - the string table: the offset of each string, followed by the strings
+    themselves. Each string is a kind byte (KIND_STR or KIND_JSON) followed by
+    its UTF-8 encoding. Every tag name, tag value and index label is stored
+    once in this table and referred to elsewhere by its number.
+  - the index labels: the string number of each of the manifest's indices.
+  - the elements: the offset of each element, followed by the elements
+    themselves, each a sequence of (tag name, tag value) string number pairs.
+  - the groups: one record per distinct tuple of index values, holding the
+    string numbers of the index values and the range of elements with those
+    values. Groups are stored in the order `Manifest.get_all_elements()`
+    visits them.
+  - the sorted groups: the group numbers ordered by their encoded index
+    values, which allows binary searches by full or partial keys.
+  - the sources: the path, modification time and size of each manifest file
+    compiled, so that stale compiled manifests can be detected.
+"""
+
+import json
+import mmap
+import os
+import struct
+
+# The extension conventionally used for compiled manifest files.
+EXTENSION = '.manifest.bin'
+
+MAGIC = b'STMANIFC'
+FORMAT_VERSION = 2
+
+# The kinds of entries in the string table. Non-string tag values (eg numbers)
+# are stored as JSON so that they are read back with their original types.
+KIND_STR = b'\x00'
+KIND_JSON = b'\x01'
+
+_HEADER = struct.Struct('<8sHHIIIIIQQQQQQQ')
+_OFFSET = struct.Struct('<Q')
+_ID = struct.Struct('<I')
+_SOURCE = struct.Struct('<IqQ')
+
+
+def is_compiled(path: str) -> bool:
+  """Returns whether `path` is a compiled manifest file."""
+  try:
+    with open(path, 'rb') as stream:
+      return stream.read(len(MAGIC)) == MAGIC
+  except OSError:
+    return False
+
+
+def encode(value) -> bytes:
+  """Returns the string table encoding of `value`."""
+  if isinstance(value, str):
+    return KIND_STR + value.encode('utf-8')
+  try:
+    return KIND_JSON + json.dumps(value, sort_keys=True).encode('utf-8')
+  except TypeError:
+    raise CompiledManifestError(
+        'cannot compile manifest value of type {}: {}'
+        .format(type(value).__name__, value))
+
+
+def decode(data: bytes):
+  """Returns the value whose string table encoding is `data`."""
+  kind, payload = data[:1], data[1:]
+  text = payload.decode('utf-8')
+  return text if kind == KIND_STR else json.loads(text)
+
+
+def write(path: str, indices, groups, sources, convention: str = ''):
+  """Writes a compiled manifest to `path`.
+
+  Args:
+    path: the file to write. It is replaced atomically.
+    indices: the index labels of the manifest
+    groups: an iterable of (index values, elements) pairs, as yielded by
+      `Manifest.groups()`
+    sources: the paths of the manifest files that were compiled
+    convention: the spec of the convention the manifest is compiled for, or ''
+      if unknown
+
+  Returns:
+    the number of elements written
+  """
+  strings = {}
+  def string_id(value):
+    data = encode(value)
+    number = strings.get(data)
+    if number is None:
+      number = len(strings)
+      strings[data] = number
+    return number
+
+  convention_id = string_id(convention)
+  label_ids = [string_id(label) for label in indices]
+  element_data = []
+  group_records = []
+  for keys, elements in groups:
+    first = len(element_data)
+    for element in elements:
+      element_data.append(b''.join(
+          _ID.pack(string_id(tag_name)) + _ID.pack(string_id(value))
+          for tag_name, value in element.items()))
+    group_records.append(([string_id(key) for key in keys],
+                          first, len(element_data) - first))
+
+  source_records = []
+  for source in sources:
+    stat = os.stat(source)
+    source_records.append(_SOURCE.pack(string_id(source), stat.st_mtime_ns,
+                                       stat.st_size))
+
+  string_data = list(strings.keys())
+  string_key = {number: data for data, number in strings.items()}
+  sorted_groups = sorted(
+      range(len(group_records)),
+      key=lambda group: [string_key[key] for key in group_records[group][0]])
+  group_format = struct.Struct('<{}III'.format(len(label_ids)))
+
+  sections = [
+      offsets_and_data(string_data),
+      b''.join(_ID.pack(label) for label in label_ids),
+      offsets_and_data(element_data),
+      b''.join(group_format.pack(*keys, first, count)
+               for keys, first, count in group_records),
+      b''.join(_ID.pack(group) for group in sorted_groups),
+      b''.join(source_records),
+  ]
+  offsets = []
+  position = _HEADER.size
+  for section in sections:
+    offsets.append(position)
+    position += len(section)
+  header = _HEADER.pack(MAGIC, FORMAT_VERSION, len(label_ids), len(string_data),
+                        len(element_data), len(group_records),
+                        len(source_records), convention_id, *offsets, position)
+
+  partial_path = '{}.{}.tmp'.format(path, os.getpid())
+  with open(partial_path, 'wb') as stream:
+    stream.write(header)
+    for section in sections:
+      stream.write(section)
+  os.replace(partial_path, path)
+  return len(element_data)
+
+
+def offsets_and_data(items):
+  """Returns the offset table for `items` followed by their concatenation."""
+  offsets = [0]
+  for item in items:
+    offsets.append(offsets[-1] + len(item))
+  return (b''.join(_OFFSET.pack(offset) for offset in offsets) +
+          b''.join(items))
+
+
+class CompiledManifest:
+  """A read-only view of a compiled manifest file.
+
+  This supports the look-up methods of `sample_manifest.Manifest` that are used
+  once a manifest has been indexed.
+  """
+
+  def __init__(self, path: str):
+    self.path = path
+    with open(path, 'rb') as stream:
+      try:
+        self.data = mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)
+      except ValueError:  # empty file
+        raise CompiledManifestError(f'not a compiled manifest: "{path}"')
+    if (len(self.data) < _HEADER.size or
+        self.data[:len(MAGIC)] != MAGIC):
+      raise CompiledManifestError(f'not a compiled manifest: "{path}"')
+    (_, version, num_indices, self.num_strings, self.num_elements,
+     self.num_groups, self.num_sources, convention_id, self._strings,
+     self._labels, self._elements, self._groups, self._sorted, self._sources,
+     end) = _HEADER.unpack_from(self.data)
+    if version != FORMAT_VERSION:
+      raise CompiledManifestError(
+          'compiled manifest "{}" has format version {}, expected {}; '
+          'recompile it'.format(path, version, FORMAT_VERSION))
+    if end != len(self.data):
+      raise CompiledManifestError(f'compiled manifest "{path}" is truncated')
+
+    self._string_data = self._strings + _OFFSET.size * (self.num_strings + 1)
+    self._element_data = self._elements + _OFFSET.size * (self.num_elements + 1)
+    self._group = struct.Struct('<{}III'.format(num_indices))
+
+    # string number -> decoded value, filled in as strings are looked up
+    self._decoded = {}
+
+    self.indices = [self.string(_ID.unpack_from(self.data, self._labels +
+                                                _ID.size * idx)[0])
+                    for idx in range(num_indices)]
+
+    # the spec of the convention compiled for, or None if unknown
+    self.convention = self.string(convention_id) or None
+
+  def close(self):
+    self.data.close()
+
+  def raw_string(self, number: int) -> bytes:
+    """Returns the encoded string with the given number."""
+    position = self._strings + _OFFSET.size * number
+    start, = _OFFSET.unpack_from(self.data, position)
+    end, = _OFFSET.unpack_from(self.data, position + _OFFSET.size)
+    return self.data[self._string_data + start:self._string_data + end]
+
+  def string(self, number: int):
+    """Returns the decoded value of the string with the given number."""
+    value = self._decoded.get(number, self)
+    if value is self:
+      value = decode(self.raw_string(number))
+      self._decoded[number] = value
+    return value
+
+  def element(self, number: int):
+    """Returns the element with the given number as a dict."""
+    position = self._elements + _OFFSET.size * number
+    start, = _OFFSET.unpack_from(self.data, position)
+    end, = _OFFSET.unpack_from(self.data, position + _OFFSET.size)
+    ids = struct.unpack_from('<{}I'.format((end - start) // _ID.size),
+                             self.data, self._element_data + start)
+    return {self.string(ids[idx]): self.string(ids[idx + 1])
+            for idx in range(0, len(ids), 2)}
+
+  def group(self, number: int):
+    """Returns the (index value numbers, first element, count) of a group."""
+    fields = self._group.unpack_from(self.data,
+                                     self._groups + self._group.size * number)
+    return fields[:-2], fields[-2], fields[-1]
+
+  def sorted_group(self, position: int) -> int:
+    return _ID.unpack_from(self.data, self._sorted + _ID.size * position)[0]
+
+  def group_key(self, number: int, length: int):
+    """Returns the first `length` encoded index values of a group."""
+    keys, _, _ = self.group(number)
+    return [self.raw_string(key) for key in keys[:length]]
+
+  def lower_bound(self, prefix):
+    """Returns the first sorted position whose key is not less than `prefix`."""
+    low, high = 0, self.num_groups
+    while low < high:
+      middle = (low + high) // 2
+      if self.group_key(self.sorted_group(middle), len(prefix)) < prefix:
+        low = middle + 1
+      else:
+        high = middle
+    return low
+
+  def groups_with_prefix(self, *keys):
+    """Returns the numbers of the groups whose index values start with `keys`.
+
+    The groups are returned in their stored order.
+    """
+    try:
+      prefix = [encode(key) for key in keys]
+    except CompiledManifestError:
+      return []
+    groups = []
+    for position in range(self.lower_bound(prefix), self.num_groups):
+      group = self.sorted_group(position)
+      if self.group_key(group, len(prefix)) != prefix:
+        break
+      groups.append(group)
+    return sorted(groups)
+
+  def get_all_elements(self):
+    """Generator that yields each element in the compiled manifest."""
+    for number in range(self.num_elements):
+      yield self.element(number)
+
+  def get_keys(self, *specified_keys):
+    """Returns the keys at the next level after specified_keys have been resolved"""
+    if self.indices == [None]:  # no indices
+      return []
+    if len(specified_keys) >= len(self.indices):
+      return []
+    keys = {}
+    for group in self.groups_with_prefix(*specified_keys):
+      key_ids, _, _ = self.group(group)
+      keys[self.string(key_ids[len(specified_keys)])] = None
+    return list(keys)
+
+  def get(self, *keys, **filters):
+    """Returns the list of elements with these keys and filters, or None."""
+    keys = keys or [None]
+    if len(keys) < len(self.indices):
+      return None
+    groups = self.groups_with_prefix(*keys[:len(self.indices)])
+    if not groups:
+      return None
+    _, first, count = self.group(groups[0])
+    elements = (self.element(number) for number in range(first, first + count))
+    return [element
+            for element in elements
+            if all(tag_filter in element.items()
+                   for tag_filter in filters.items())]
+
+  def sources(self):
+    """Returns a list of the (path, mtime_ns, size) of each compiled source."""
+    sources = []
+    for idx in range(self.num_sources):
+      path, mtime_ns, size = _SOURCE.unpack_from(
+          self.data, self._sources + _SOURCE.size * idx)
+      sources.append((self.string(path), mtime_ns, size))
+    return sources
+
+  def stale_sources(self):
+    """Returns the compiled sources that changed on disk since compilation."""
+    stale = []
+    for path, mtime_ns, size in self.sources():
+      try:
+        stat = os.stat(path)
+      except OSError:
+        stale.append(path)
+        continue
+      if stat.st_mtime_ns != mtime_ns or stat.st_size != size:
+        stale.append(path)
+    return stale
+
+
+class CompiledManifestError(Exception):
+  pass
@@ -14,30 +14,87 @@
 
 import importlib
 import logging
-import os
 
 DEFAULT="tag:sample:invocation,chdir"
 
-__abs_file__ = os.path.abspath(__file__)
-__abs_file_path__ = os.path.split(__abs_file__)[0]
+# The setuptools entry point group under which other packages can register
+# conventions. Each entry point is named after its convention, and refers
+# either to its environment creation function or to a module defining it as
+# `test_environments`, eg:
+#   entry_points={'sampletester.conventions': ['mine = mypackage.convention']}
+ENTRY_POINT_GROUP = 'sampletester.conventions'
 
-# The list of environment creation functions for each of the various conventions
-# we discover below.
-environment_creators = {}
+# The environment creation function for each registered convention, by name. A
+# value may instead be the "MODULE" or "MODULE:FUNCTION" name of the function,
+# which is then only imported when the convention is first used, so that
+# running with one convention does not pay for (or fail because of) importing
+# the others. A module name stands for its `test_environments` function.
+environment_creators = {
+    'tag': 'sampletester.convention.tag',
+    'cloud': 'sampletester.convention.cloud',
+}
 
-# We find all the conventions defined via modules and subpackages rooted in the
-# current directory
-all_files = [entry for entry in os.listdir(__abs_file_path__)
-             if entry !='__init__.py' and entry != '__pycache__' and not entry.endswith('~')]
-all_conventions = [os.path.splitext(os.path.basename(entry))[0] for entry in all_files]
+# Whether the conventions registered via entry points have been added to
+# `environment_creators`.
+_loaded_entry_points = False
 
-# We register the environment creation function for each convention. Each such
-# function has the name `test_environments` within the convention code.
-for convention in all_conventions:
-  module = importlib.import_module('.'+convention, package='sampletester.convention')
-  if 'test_environments' in dir(module):
-    logging.info('registering convention "{}"'.format(convention))
-    environment_creators[convention] = module.test_environments
+
+def register(name: str, creator):
+  """Registers the environment creation function `creator` as convention `name`.
+
+  `creator` may also be the name of the function, as in `environment_creators`.
+  """
+  logging.info('registering convention "{}"'.format(name))
+  environment_creators[name] = creator
+
+
+def names():
+  """Returns the names of all the registered conventions."""
+  _load_entry_points()
+  return sorted(environment_creators)
+
+
+def get_creator(name: str):
+  """Returns the environment creation function of convention `name`.
+
+  Raises:
+    ValueError: if there is no such convention, or it cannot be imported
+  """
+  if name not in environment_creators:
+    _load_entry_points()
+  creator = environment_creators.get(name, None)
+  if creator is None:
+    raise ValueError('convention "{}" not implemented'.format(name))
+  if isinstance(creator, str):
+    module_name, _, function_name = creator.partition(':')
+    try:
+      module = importlib.import_module(module_name)
+      creator = getattr(module, function_name or 'test_environments')
+    except Exception as ex:
+      raise ValueError(f'could not load convention "{name}" from "{module_name}": '
+                       f'{ex}')
+    environment_creators[name] = creator
+  return creator
+
+
+def _load_entry_points():
+  """Registers the conventions declared by installed packages, once."""
+  global _loaded_entry_points
+  if _loaded_entry_points:
+    return
+  _loaded_entry_points = True
+  try:
+    from importlib import metadata
+  except ImportError:  # Python < 3.8
+    import importlib_metadata as metadata
+  all_entry_points = metadata.entry_points()
+  if hasattr(all_entry_points, 'select'):
+    entry_points = all_entry_points.select(group=ENTRY_POINT_GROUP)
+  else:  # Python < 3.10
+    entry_points = all_entry_points.get(ENTRY_POINT_GROUP, [])
+  for entry_point in entry_points:
+    if entry_point.name not in environment_creators:
+      register(entry_point.name, entry_point.value)
 
 def generate_environments(requested_conventions, testcase_args, manifest_options, indexed_docs):
   """Generates the environments for the requested conventions with the given args.
@@ -47,7 +104,8 @@ def generate_environments(requested_conventions, testcase_args, manifest_options
 
   Args:
     requested_conventions: A list of strings, each of which contains the
-       name of a convention previously registered in `environment_creators`
+       name of a convention registered in `environment_creators` or via the
+       ENTRY_POINT_GROUP entry points
     testcase_args: A list of args to pass in its entirety to each convention in
        `requested_conventions`. These are intended to be passed through to the
        caserunner.
@@ -58,9 +116,7 @@ def generate_environments(requested_conventions, testcase_args, manifest_options
   """
   all_environments = []
   for convention in requested_conventions:
-    create_fn = environment_creators.get(convention, None)
-    if create_fn is None:
-      raise ValueError('convention "{}" not implemented'.format(convention))
+    create_fn = get_creator(convention)
     try:
       all_environments.extend(create_fn(indexed_docs, testcase_args, manifest_options))
     except Exception as ex:
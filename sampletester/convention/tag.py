@@ -14,8 +14,11 @@
 
 import glob
 import logging
+import os
 from typing import Iterable
 
+from sampletester import budget
+from sampletester import build
 from sampletester import parser
 from sampletester import sample_manifest
 from sampletester import testenv
@@ -54,6 +57,42 @@ BINARY_KEY = 'bin'
 # artifact if INVOCATION is not specified.
 PATH_KEY = 'path'
 
+# The value of BUILD_KEY is a shell command that builds the artifact, run in
+# the artifact's working directory (see CHDIR_KEY) before any test case calls
+# it. The glob patterns in BUILD_INPUTS_KEY and BUILD_OUTPUTS_KEY, separated by
+# whitespace or as a list, name, relative to that directory, the files the
+# build reads and writes; when the inputs are declared, the build is skipped
+# while they are unchanged and the outputs exist (see `build`). Artifacts with
+# the same build command, directory, inputs and outputs share a single build.
+# Changes to the inputs affect the artifact like changes to its PATH_KEY file.
+BUILD_KEY = 'build'
+BUILD_INPUTS_KEY = 'build_inputs'
+BUILD_OUTPUTS_KEY = 'build_outputs'
+
+# If the value of CACHEABLE_KEY is "true" (or "yes" or "1"), identical calls of
+# the artifact in a run, with the same arguments and working directory, are
+# only made once, and share the result (see `memo`). Set it only for
+# artifacts whose calls have no side effects and give the same output
+# throughout a run.
+CACHEABLE_KEY = 'cacheable'
+CACHEABLE_VALUES = ('true', 'yes', '1')
+
+# The values of CONCURRENCY_KEY and CALLS_PER_SECOND_KEY limit, respectively,
+# the number of calls in flight at once and the number of calls started per
+# second in the artifact's environment when test cases run in parallel. If
+# several artifacts of an environment specify a limit, the lowest one applies.
+CONCURRENCY_KEY = 'concurrency'
+CALLS_PER_SECOND_KEY = 'calls_per_second'
+
+# The values of these keys are the budgets of each successful call of the
+# artifact: its duration and CPU time (eg "2s" or "250ms") and its peak memory
+# (eg "512M"). A call over budget fails its test case (see `budget`).
+BUDGET_KEYS = {
+    'max_duration': budget.DURATION,
+    'max_cpu': budget.CPU,
+    'max_rss': budget.MAX_RSS,
+}
+
 
 class ManifestEnvironment(testenv.Base):
   """Sets up a manifest-derived Base for a single environment.
@@ -105,6 +144,11 @@ class ManifestEnvironment(testenv.Base):
     self.manifest_options = (manifest_options
                              if manifest_options is not None else {})
 
+    # When set to a set, the keys of the artifacts looked up in the manifest
+    # (whether or not they were found) are added to it, so that callers such
+    # as `watch` can tell which test cases depend on which artifacts.
+    self.lookups = None
+
   def get_symbol(self, symbol):
     """Returns the artifact manifest tag specified in `symbol`.
 
@@ -123,6 +167,7 @@ class ManifestEnvironment(testenv.Base):
 
     indices = self.const_indices.copy()
     indices.append(artifact)
+    self.record_lookup(indices)
     artifact = self.manifest.get_one(*indices)
     if not artifact:
       raise Exception('object "{}" not defined'.format(indices))
@@ -138,6 +183,7 @@ class ManifestEnvironment(testenv.Base):
 
     indices = self.const_indices.copy()
     indices.extend(full_call.split(' '))
+    self.record_lookup(indices)
     artifact = self.manifest.get_one(*indices)
     if not artifact:
       raise Exception('object "{}" not defined'.format(indices))
@@ -158,6 +204,171 @@ class ManifestEnvironment(testenv.Base):
     chdir = artifact.get(chdir_key, None)
     return insert_into(invocation, (PLACEHOLDER_ARGS, cli_args)), chdir
 
+  def record_lookup(self, indices):
+    if self.lookups is not None:
+      self.lookups.add(tuple(indices[:len(self.manifest.indices)]))
+
+  def lookup_key(self, artifact: str):
+    indices = self.const_indices + artifact.split(' ')
+    return tuple(indices[:len(self.manifest.indices)])
+
+  def get_files(self):
+    """Returns the artifact files of this environment.
+
+    Returns:
+      a dict mapping the path of each file named by the PATH_KEY tag of an
+      artifact, or matching its BUILD_INPUTS_KEY, to the set of keys of the
+      artifacts naming it. Relative paths are resolved against the artifact's
+      working directory (see CHDIR_KEY).
+    """
+    chdir_key = self.manifest_options.get(CHDIR_KEY, CHDIR_KEY)
+    files = {}
+    for keys, artifacts in self.manifest.groups(*self.const_indices):
+      for artifact in artifacts:
+        paths = self.build_input_files(artifact)
+        path = artifact.get(PATH_KEY)
+        if path and isinstance(path, str):
+          paths.append(os.path.join(artifact.get(chdir_key) or '', path))
+        for path in paths:
+          files.setdefault(os.path.abspath(path), set()).add(keys)
+    return files
+
+  def get_dependencies(self):
+    """Returns the files that the artifacts of this environment depend on.
+
+    Returns:
+      a dict mapping the keys of each artifact to the set of paths of its
+      manifest source, of the file named by its PATH_KEY tag, of the files
+      that the words of its invocation would name, and of the existing files
+      matching its BUILD_INPUTS_KEY. Relative paths are resolved against the
+      artifact's working directory (see CHDIR_KEY).
+    """
+    chdir_key = self.manifest_options.get(CHDIR_KEY, CHDIR_KEY)
+    invocation_key = self.manifest_options.get(INVOCATION_KEY, INVOCATION_KEY)
+    dependencies = {}
+    for keys, artifacts in self.manifest.groups(*self.const_indices):
+      files = dependencies.setdefault(keys, set())
+      for artifact in artifacts:
+        source = artifact.get(sample_manifest.IMPLICIT_TAG_SOURCE)
+        if source:
+          files.add(os.path.abspath(source))
+        names = [artifact.get(PATH_KEY)]
+        invocation = artifact.get(invocation_key)
+        if isinstance(invocation, str):
+          names.extend(invocation.split())
+        chdir = artifact.get(chdir_key) or ''
+        for name in names:
+          if (name and isinstance(name, str) and
+              not name.startswith(PLACEHOLDER_CHAR)):
+            files.add(os.path.abspath(os.path.join(chdir, name)))
+        files.update(os.path.abspath(path)
+                     for path in self.build_input_files(artifact))
+    return dependencies
+
+  def is_cacheable(self, artifact: str):
+    indices = self.const_indices + artifact.split(' ')
+    element = self.manifest.get_one(*indices)
+    return bool(element) and (str(element.get(CACHEABLE_KEY, '')).lower()
+                              in CACHEABLE_VALUES)
+
+  def get_budgets(self, artifact: str):
+    """Returns the budgets in the BUDGET_KEYS of `artifact`.
+
+    Raises:
+      ValueError: if a budget is malformed
+    """
+    indices = self.const_indices + artifact.split(' ')
+    element = self.manifest.get_one(*indices) or {}
+    budgets = {}
+    for key, measure in BUDGET_KEYS.items():
+      value = element.get(key)
+      if value is None or value == '':
+        continue
+      try:
+        budgets[measure] = budget.parse(measure, value)
+      except ValueError as e:
+        raise ValueError(f'"{key}" of "{artifact}": {e}')
+    return budgets
+
+  def get_builds(self):
+    """Returns the build.Steps of the artifacts that declare a BUILD_KEY.
+
+    Raises:
+      ValueError: if a BUILD_INPUTS_KEY or BUILD_OUTPUTS_KEY is malformed
+    """
+    builds = {}
+    for keys, artifacts in self.manifest.groups(*self.const_indices):
+      for artifact in artifacts:
+        step = self.build_step(artifact)
+        if not step:
+          continue
+        steps = builds.setdefault(keys, [])
+        if step not in steps:
+          steps.append(step)
+    return builds
+
+  def build_step(self, artifact):
+    """Returns the build.Step of `artifact`, or None if it has no BUILD_KEY.
+
+    Its BUILD_INPUTS_KEY and BUILD_OUTPUTS_KEY may each be a string of
+    whitespace-separated glob patterns, or a list of patterns.
+
+    Raises:
+      ValueError: if a BUILD_INPUTS_KEY or BUILD_OUTPUTS_KEY is malformed
+    """
+    command = artifact.get(BUILD_KEY)
+    if not command:
+      return None
+    patterns = []
+    for key in (BUILD_INPUTS_KEY, BUILD_OUTPUTS_KEY):
+      value = artifact.get(key) or ()
+      if isinstance(value, str):
+        value = value.split()
+      if (not isinstance(value, (list, tuple)) or
+          not all(isinstance(pattern, str) for pattern in value)):
+        raise ValueError(f'"{key}" of the artifact built by "{command}" must '
+                         f'be a string or a list of strings, got "{value}"')
+      patterns.append(tuple(value))
+    chdir_key = self.manifest_options.get(CHDIR_KEY, CHDIR_KEY)
+    return build.Step(command, artifact.get(chdir_key) or None, *patterns)
+
+  def build_input_files(self, artifact):
+    """Returns the paths of the existing BUILD_INPUTS_KEY files of `artifact`.
+
+    Malformed inputs are left for get_builds() to report.
+    """
+    try:
+      step = self.build_step(artifact)
+    except ValueError:
+      return []
+    return build.expand(step, step.inputs) if step else []
+
+  def get_limits(self):
+    """Returns the lowest CONCURRENCY_KEY and CALLS_PER_SECOND_KEY values.
+
+    Raises:
+      ValueError: if any of the values is not a positive number
+    """
+    limits = []
+    for key, convert in ((CONCURRENCY_KEY, int),
+                         (CALLS_PER_SECOND_KEY, float)):
+      lowest = None
+      for _, artifacts in self.manifest.groups(*self.const_indices):
+        for artifact in artifacts:
+          value = artifact.get(key)
+          if value is None or value == '':
+            continue
+          try:
+            value = convert(value)
+            if value <= 0:
+              raise ValueError
+          except ValueError:
+            raise ValueError('environment "{}": expected a positive "{}", '
+                             'got "{}"'.format(self.name(), key, value))
+          lowest = value if lowest is None else min(lowest, value)
+      limits.append(lowest)
+    return tuple(limits)
+
   def adjust_suite_name(self, name):
     return self.adjust_name(name)
 
@@ -202,10 +413,12 @@ def test_environments(indexed_docs: parser.IndexedDocs,
     raise Exception('expected at least 1 parameter to convention "tag", got %d: %s'
                     .format(num_params, convention_parameters))
 
-  manifest = sample_manifest.Manifest(ENVIRONMENT_KEY, *convention_parameters) # read only, so don't need a copy
+  manifest = sample_manifest.Manifest(*manifest_indices(convention_parameters)) # read only, so don't need a copy
+  manifest.convention = convention_spec(convention_parameters, manifest_options)
   manifest.from_docs(indexed_docs)
   manifest.index()
-  logging.debug('manifest >>> \n{}\n<<<\n'.format(manifest.string()))
+  if logging.getLogger().isEnabledFor(logging.DEBUG):
+    logging.debug('manifest >>> \n{}\n<<<\n'.format(manifest.string()))
 
 
 
@@ -231,5 +444,21 @@ def test_environments(indexed_docs: parser.IndexedDocs,
   return environments
 
 
+def manifest_indices(convention_parameters):
+  """Returns the manifest indices used for the given convention parameters."""
+  return [ENVIRONMENT_KEY] + list(convention_parameters)
+
+
+def convention_spec(convention_parameters, manifest_options):
+  """Returns the spec of this convention with the given parameters and options.
+
+  This is the spec recorded in compiled manifests. The manifest options not
+  specified are filled in with their defaults, so that equivalent specs match.
+  """
+  options = list(manifest_options or [])
+  options += [INVOCATION_KEY, CHDIR_KEY][len(options):]
+  return 'tag:{}:{}'.format(','.join(convention_parameters), ','.join(options))
+
+
 class InternalInvalidPlaceholderDefinition(Exception):
   pass
@@ -31,10 +31,7 @@ def new(convention_spec: str,
   "NAME:PLAN_ARG,PLAN_ARG,...:MANIFEST_ARG,MANIFEST_ARG,....". The arrays of
   *_ARGs is passed to the NAMEd convention upon initialization.
   """
-  parts = convention_spec.split(":", 2)
-  convention_name = parts[0]
-  testcase_args = parts[1].split(",") if len(parts) > 1 else None
-  manifest_options = parts[2].split(",") if len(parts) > 2 else None
+  convention_name, testcase_args, manifest_options = parse_spec(convention_spec)
 
   registry = Registry()
   registry.add(*convention.generate_environments([convention_name],
@@ -42,6 +39,14 @@ def new(convention_spec: str,
                                                  indexed_docs))
   return registry
 
+def parse_spec(convention_spec: str):
+  """Returns the (name, testcase_args, manifest_options) in `convention_spec`."""
+  parts = convention_spec.split(":", 2)
+  convention_name = parts[0]
+  testcase_args = parts[1].split(",") if len(parts) > 1 else None
+  manifest_options = parts[2].split(",") if len(parts) > 2 else None
+  return convention_name, testcase_args, manifest_options
+
 class Registry:
   """Stores the registered test execution environments."""
 
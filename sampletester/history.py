@@ -0,0 +1,134 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Remembers how long each test case took across runs.
+
+A History is stored in a local SQLite database, with one row per test case
+(keyed by the names of its environment, suite and case) holding a moving
+average of the wall time it took to run and the outcome of its last run. After
+a run, History.record() folds in the durations of the cases that ran, as
+tracked by `testplan.Wrapper.update_times()`. Before a run,
+History.estimate() provides the expected duration of each case, so that the
+cases can be run longest first (`testplan.Manager.order_cases()`) and shards
+can be balanced (`testplan.Manager.shard()`), and History.failed() allows
+running the cases that failed last time first.
+"""
+
+import sqlite3
+import time
+
+from sampletester import testplan
+
+# The weight of the latest duration in the moving average of each test case.
+SMOOTHING = 0.3
+
+OUTCOME_PASSED = 'passed'
+OUTCOME_FAILED = 'failed'
+OUTCOME_ERROR = 'error'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS durations (
+  environment TEXT NOT NULL,
+  suite TEXT NOT NULL,
+  test_case TEXT NOT NULL,
+  seconds REAL NOT NULL,
+  runs INTEGER NOT NULL,
+  outcome TEXT NOT NULL,
+  updated REAL NOT NULL,
+  PRIMARY KEY (environment, suite, test_case)
+)
+"""
+
+
+def case_key(environment: testplan.Environment, suite: testplan.Suite,
+             case: testplan.TestCase):
+  """Returns the key under which a History stores a test case."""
+  return environment.name(), suite.name(), case.name()
+
+
+def outcome(case: testplan.TestCase):
+  """Returns the OUTCOME_* of a test case that ran."""
+  if case.num_errors:
+    return OUTCOME_ERROR
+  return OUTCOME_FAILED if case.num_failures else OUTCOME_PASSED
+
+
+class History:
+  """The durations of test cases, stored in the SQLite database at `path`."""
+
+  def __init__(self, path: str):
+    self.path = path
+    self.connection = sqlite3.connect(path)
+    self.connection.execute(_SCHEMA)
+
+    # durations[case_key] is the (seconds, runs, outcome) of each stored case
+    self.durations = {}
+    for (environment, suite, test_case, seconds, runs,
+         last_outcome) in self.connection.execute(
+             'SELECT environment, suite, test_case, seconds, runs, outcome '
+             'FROM durations'):
+      self.durations[environment, suite, test_case] = (seconds, runs,
+                                                       last_outcome)
+    # The estimate for cases that have not run before: the mean of the others
+    self.default_seconds = (sum(seconds for seconds, _, _
+                                in self.durations.values()) /
+                            len(self.durations)) if self.durations else 0.0
+
+  def close(self):
+    self.connection.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *unused):
+    self.close()
+
+  def estimate(self, environment: testplan.Environment, suite: testplan.Suite,
+               case: testplan.TestCase) -> float:
+    """Returns the expected duration of a test case, in seconds."""
+    stored = self.durations.get(case_key(environment, suite, case))
+    return stored[0] if stored else self.default_seconds
+
+  def failed(self, environment: testplan.Environment, suite: testplan.Suite,
+             case: testplan.TestCase) -> bool:
+    """Returns whether a test case failed (or errored) when it last ran."""
+    stored = self.durations.get(case_key(environment, suite, case))
+    return bool(stored) and stored[2] != OUTCOME_PASSED
+
+  def record(self, manager: testplan.Manager):
+    """Stores the durations of the test cases in `manager` that completed.
+
+    Returns:
+      the number of test cases stored
+    """
+    now = time.time()
+    rows = []
+    for environment in manager.environments:
+      for suite in environment.suites:
+        for case in suite.cases:
+          if not case.completed or not case.start_time or not case.end_time:
+            continue
+          key = case_key(environment, suite, case)
+          seconds = case.duration().total_seconds()
+          previous = self.durations.get(key)
+          runs = 1
+          if previous:
+            seconds = SMOOTHING * seconds + (1 - SMOOTHING) * previous[0]
+            runs += previous[1]
+          self.durations[key] = (seconds, runs, outcome(case))
+          rows.append(key + (seconds, runs, outcome(case), now))
+    with self.connection:
+      self.connection.executemany(
+          'INSERT OR REPLACE INTO durations VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+    return len(rows)
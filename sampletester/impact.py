@@ -0,0 +1,225 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Selects the test cases affected by a set of changed files.
+
+A test case is affected by the changed files if:
+  - its test plan file changed, or
+  - it calls, or interpolates a `{symbol}` of, an artifact that depends on a
+    changed file (see `testenv.Base.get_dependencies()`): the manifest file
+    the artifact is defined in, the file named by its `path`, or the files
+    named by its invocation, or
+  - it looks up an artifact that no longer exists, and a manifest changed, or
+  - it is not known which artifacts it looks up (eg because it runs `code` or
+    `shell` directives, or its environment does not track dependencies), and
+    any file other than a test plan changed.
+
+The artifacts a case looks up are found without running it, from its `call`
+directives and the `{symbol}`s in the messages it formats, the same way the
+test environment resolves them. Literal values are passed through as they
+are, so `{symbol}`s in them refer to nothing.
+"""
+
+import os
+import subprocess
+import sys
+
+from sampletester import caserunner
+from sampletester import testplan
+from sampletester import watch
+
+# The directives whose effects cannot be known without running them.
+OPAQUE_DIRECTIVES = {'code', 'shell'}
+
+# The directives that call an artifact.
+CALL_DIRECTIVES = {'call', 'call_may_fail'}
+
+# The directives whose first parameter is a message, formatted with the
+# `{symbol}`s it names (see `caserunner.TestCase.format_string()`).
+MESSAGE_DIRECTIVES = {'log', 'assert_success', 'assert_failure'}
+
+# The directives that may have a message, formatted likewise, under
+# `caserunner.TestCase.KEY_CONTAINS_MESSAGE` in their first parameter.
+CONTAINS_DIRECTIVES = {'assert_contains', 'assert_contains_any',
+                       'assert_excludes', 'assert_excludes_any',
+                       'assert_not_contains'}
+
+# The kinds of references yielded by case_references().
+REFERENCE_CALL = 'call'
+REFERENCE_SYMBOL = 'symbol'
+REFERENCE_OPAQUE = 'opaque'
+
+
+def changed_files_from(path: str):
+  """Returns the absolute paths of the files listed, one per line, in `path`.
+
+  Relative paths are resolved against the current directory. A `path` of "-"
+  reads from stdin.
+  """
+  if path == '-':
+    lines = sys.stdin.read().splitlines()
+  else:
+    with open(path) as stream:
+      lines = stream.read().splitlines()
+  return {os.path.abspath(line.strip()) for line in lines if line.strip()}
+
+
+def changed_files_since(revision: str):
+  """Returns the absolute paths of the files changed since git `revision`.
+
+  This includes uncommitted changes to files git tracks.
+
+  Raises:
+    ValueError: if git cannot list the changes
+  """
+  def git(*args):
+    try:
+      return subprocess.run(['git'] + list(args), stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE, universal_newlines=True,
+                            check=True).stdout
+    except (OSError, subprocess.CalledProcessError) as e:
+      details = getattr(e, 'stderr', None) or e
+      raise ValueError(f'could not list the files changed since "{revision}": '
+                       f'{str(details).strip()}')
+
+  top_level = git('rev-parse', '--show-toplevel').strip()
+  return {os.path.abspath(os.path.join(top_level, name))
+          for name in git('diff', '--name-only', revision, '--').splitlines()
+          if name}
+
+
+def case_references(environment: testplan.Environment, suite: testplan.Suite,
+                    case: testplan.TestCase):
+  """Yields what `case` refers to in its environment, without running it.
+
+  This walks the setup and teardown of `suite` and the spec of `case`, and
+  yields a (kind, name) pair for each:
+    - REFERENCE_CALL: target of a call directive, as passed to
+      `testenv.Base.get_call()`
+    - REFERENCE_SYMBOL: `{symbol}` interpolated into a message (see
+      `formatted_messages()`), as passed to `testenv.Base.get_symbol()`
+    - REFERENCE_OPAQUE: directive in OPAQUE_DIRECTIVES, which may refer to
+      anything
+  """
+  target_key = environment.config.get_testcase_settings().get('call.target',
+                                                              'target')
+  def visit(spec):
+    for segment in spec or []:
+      if not isinstance(segment, dict):
+        continue
+      for directive, params in segment.items():
+        if directive in OPAQUE_DIRECTIVES:
+          yield REFERENCE_OPAQUE, directive
+          continue
+        if (directive in CALL_DIRECTIVES and isinstance(params, dict) and
+            isinstance(params.get(target_key), str)):
+          yield REFERENCE_CALL, params[target_key]
+        for message in formatted_messages(directive, params):
+          for symbol in caserunner._interpolated_symbol_re.findall(message):
+            yield REFERENCE_SYMBOL, symbol
+
+  for spec in [suite.setup(), case.spec(), suite.teardown()]:
+    yield from visit(spec)
+
+
+def formatted_messages(directive: str, params):
+  """Returns the messages of `directive` that are formatted when it runs.
+
+  These are the only strings of a directive whose `{symbol}`s are
+  interpolated: targets, variable names and literal values are used as they
+  are.
+  """
+  if not isinstance(params, list) or not params:
+    return []
+  first = params[0]
+  if directive in MESSAGE_DIRECTIVES and isinstance(first, str):
+    return [first]
+  if directive in CONTAINS_DIRECTIVES and isinstance(first, dict):
+    message = first.get(caserunner.TestCase.KEY_CONTAINS_MESSAGE)
+    if isinstance(message, str):
+      return [message]
+  return []
+
+
+def case_lookups(environment: testplan.Environment, suite: testplan.Suite,
+                 case: testplan.TestCase):
+  """Returns the keys of the artifacts `case` looks up when run.
+
+  Returns:
+    the set of keys (see `testenv.Base.lookup_key()`), or None if they cannot
+    be determined without running the case
+  """
+  lookups = set()
+  for kind, name in case_references(environment, suite, case):
+    if kind == REFERENCE_OPAQUE:
+      return None
+    key = environment.config.lookup_key(name if kind == REFERENCE_CALL
+                                        else name.split(':')[0])
+    if key is None:
+      return None
+    lookups.add(key)
+  return lookups
+
+
+def select_affected(manager: testplan.Manager, changed_paths):
+  """Deselects the test cases in `manager` not affected by `changed_paths`.
+
+  The deselected test cases are reported as skipped. Suites and environments
+  left without selected test cases are deselected too.
+
+  Returns:
+    the number of test cases deselected
+  """
+  changed_paths = {os.path.abspath(path) for path in changed_paths}
+  testplan_paths = {os.path.abspath(suite.source())
+                    for environment in manager.environments
+                    for suite in environment.suites}
+  other_changes = bool(changed_paths - testplan_paths)
+
+  deselected = 0
+  for environment in manager.environments:
+    dependencies = environment.config.get_dependencies()
+    changed_keys = set()
+    manifest_changed = False
+    if dependencies is not None:
+      for keys, files in dependencies.items():
+        if not files.isdisjoint(changed_paths):
+          changed_keys.add(keys)
+      manifest = getattr(environment.config, 'manifest', None)
+      manifest_changed = manifest is not None and any(
+          os.path.abspath(name) in changed_paths
+          for name in watch.source_names(manifest))
+
+    for suite in environment.suites:
+      suite_changed = os.path.abspath(suite.source()) in changed_paths
+      for case in suite.cases:
+        if suite_changed or not case.selected():
+          continue
+        lookups = (None if dependencies is None
+                   else case_lookups(environment, suite, case))
+        if lookups is None:
+          affected = other_changes
+        else:
+          affected = (not lookups.isdisjoint(changed_keys) or
+                      (manifest_changed and
+                       any(key not in dependencies for key in lookups)))
+        if not affected:
+          case.selected_to_run = False
+          deselected += 1
+      if not any(case.selected() for case in suite.cases):
+        suite.selected_to_run = False
+    if not any(suite.selected() for suite in environment.suites):
+      environment.selected_to_run = False
+  return deselected
+
@@ -19,8 +19,10 @@ import os
 from functools import reduce
 from typing import Set
 
+from sampletester import compiled_manifest
 from sampletester import parser
 from sampletester.parser import SCHEMA_TYPE_ABSENT as UNKNOWN_TYPE
+from sampletester.sample_manifest import COMPILED_TYPE as COMPILED_MANIFEST_TYPE
 from sampletester.sample_manifest import SCHEMA as MANIFEST_SCHEMA
 from sampletester.testplan import SCHEMA as TESTPLAN_SCHEMA
 
@@ -68,7 +70,9 @@ def index_docs(*file_patterns: str) -> parser.IndexedDocs:
   """
   def log_files(indexed_files):
     "Helper to be called before exiting this method"
-    manifest_paths = [doc.path for doc in indexed_files.of_type(MANIFEST_SCHEMA.primary_type)]
+    manifest_paths = [doc.path for doc in
+                      indexed_files.of_type(MANIFEST_SCHEMA.primary_type) +
+                      indexed_files.of_type(COMPILED_MANIFEST_TYPE)]
     testplan_paths = [doc.path for doc in indexed_files.of_type(TESTPLAN_SCHEMA.primary_type)]
     logging.info('manifest files:\n  {}'.format('\n  '.join(manifest_paths)))
     logging.info('testplan files:\n  {}'.format('\n  '.join(testplan_paths)))
@@ -85,7 +89,8 @@ def index_docs(*file_patterns: str) -> parser.IndexedDocs:
   explicit_paths |= files_in_directories
 
   indexed_explicit = create_indexed_docs(*explicit_paths)
-  has_manifests = indexed_explicit.contains(MANIFEST_SCHEMA.primary_type)
+  has_manifests = (indexed_explicit.contains(MANIFEST_SCHEMA.primary_type) or
+                   indexed_explicit.contains(COMPILED_MANIFEST_TYPE))
   has_testplans = indexed_explicit.contains(TESTPLAN_SCHEMA.primary_type)
 
   if (has_manifests and has_testplans):
@@ -111,9 +116,19 @@ def create_indexed_docs(*all_paths: Set[str]) -> parser.IndexedDocs:
   """Returns a parser.IndexedDocs that contains all documents in `all_paths`.
 
   This is a helper for `indexed_docs()`, and is also used heavily in tests.
+
+  Compiled manifests (see `compiled_manifest`) are not parsed, but are
+  registered as documents of type COMPILED_MANIFEST_TYPE with their paths.
   """
+  compiled_paths = {path for path in all_paths
+                    if compiled_manifest.is_compiled(path)}
   indexed_docs = parser.IndexedDocs(resolver=untyped_yaml_resolver)
-  indexed_docs.from_files(*all_paths)
+  indexed_docs.from_files(*[path for path in all_paths
+                            if path not in compiled_paths])
+  indexed_docs.add_documents(
+      *[parser.Document(os.path.abspath(path),
+                        {parser.SCHEMA_TYPE_KEY: COMPILED_MANIFEST_TYPE})
+        for path in sorted(compiled_paths)])
   return indexed_docs
 
 
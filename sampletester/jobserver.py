@@ -0,0 +1,137 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Shares a GNU make jobserver's job slots with the calls test cases make.
+
+When sample-tester runs from a recipe of `make -j N`, make passes the
+jobserver it uses to limit its jobs in MAKEFLAGS: either a pair of pipe file
+descriptors (`--jobserver-auth=R,W`, or `--jobserver-fds=R,W` before make
+4.2) or a named pipe (`--jobserver-auth=fifo:PATH`, since make 4.4). Each
+byte in the pipe is a token for one job slot beyond the one every job has
+implicitly. A Client takes the implicit slot for the first call in flight and
+a token from the pipe for each other one, and writes the token back when the
+call finishes, so that make and sample-tester together run at most N jobs.
+A make running jobs serially (without `-j`, or with `-j1`) passes no
+jobserver, so only its implicit slot is available.
+
+See https://www.gnu.org/software/make/manual/html_node/Job-Slots.html
+"""
+
+import errno
+import logging
+import os
+import select
+import threading
+
+AUTH_FLAGS = ('--jobserver-auth=', '--jobserver-fds=')
+FIFO_PREFIX = 'fifo:'
+
+# How long, in seconds, a call waiting for a token from the pipe waits before
+# checking whether the implicit job slot was freed in the meantime.
+IMPLICIT_SLOT_POLL_INTERVAL = 0.05
+
+
+class Client:
+  """A client of the jobserver reading tokens from `read_fd` and writing them
+  back to `write_fd`.
+
+  Without file descriptors, the Client only has the implicit job slot. If
+  `owns_fds` is set, close() closes the file descriptors.
+  """
+
+  def __init__(self, read_fd: int = None, write_fd: int = None,
+               owns_fds: bool = False):
+    self.read_fd = read_fd
+    self.write_fd = write_fd
+    self.owns_fds = owns_fds
+    self.condition = threading.Condition()
+    self.implicit_slot_free = True
+
+  @classmethod
+  def from_makeflags(cls, makeflags: str):
+    """Returns the Client for the jobserver in `makeflags`.
+
+    Returns:
+      the Client, or None if `makeflags` names no jobserver (in which case
+      make is running jobs serially if `makeflags` is set at all)
+
+    Raises:
+      OSError: if the jobserver's pipe cannot be used, eg because the recipe
+        running sample-tester was not marked as recursive (with `+` or by
+        using `$(MAKE)`), so make did not pass it down
+    """
+    auth = None
+    for word in (makeflags or '').split():
+      for flag in AUTH_FLAGS:
+        if word.startswith(flag):
+          auth = word[len(flag):]
+    if not auth:
+      return None
+    if auth.startswith(FIFO_PREFIX):
+      # O_RDWR does not wait for a writer to open the fifo, and O_NONBLOCK
+      # keeps reads from blocking if make takes the token first
+      fd = os.open(auth[len(FIFO_PREFIX):], os.O_RDWR | os.O_NONBLOCK)
+      return cls(fd, fd, owns_fds=True)
+    try:
+      read_fd, write_fd = (int(fd) for fd in auth.split(','))
+    except ValueError:
+      raise OSError(errno.EINVAL, f'unrecognized jobserver "{auth}"')
+    for fd in (read_fd, write_fd):
+      os.fstat(fd)
+    return cls(read_fd, write_fd)
+
+  def close(self):
+    if self.owns_fds:
+      os.close(self.read_fd)
+      self.owns_fds = False
+
+  def acquire(self):
+    """Blocks until a job slot is free, and takes it.
+
+    The implicit slot is taken if it is free, or if it is freed while waiting
+    for a token from the pipe.
+
+    Returns:
+      the token to pass to release() once the call finishes
+    """
+    while True:
+      with self.condition:
+        if self.read_fd is None:
+          self.condition.wait_for(lambda: self.implicit_slot_free)
+        if self.implicit_slot_free:
+          self.implicit_slot_free = False
+          return None
+      readable, _, _ = select.select([self.read_fd], [], [],
+                                     IMPLICIT_SLOT_POLL_INTERVAL)
+      if not readable:
+        continue
+      try:
+        token = os.read(self.read_fd, 1)
+      except (BlockingIOError, InterruptedError):
+        continue  # eg make took the token first
+      if token:
+        return token
+      raise OSError(errno.EPIPE, 'the jobserver closed its pipe')
+
+  def release(self, token, overloaded: bool = False):
+    """Frees the job slot taken with `token`."""
+    if token is None:
+      with self.condition:
+        self.implicit_slot_free = True
+        self.condition.notify()
+      return
+    try:
+      os.write(self.write_fd, token)
+    except OSError as e:
+      logging.warning(f'could not return a token to the jobserver: {e}')
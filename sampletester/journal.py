@@ -0,0 +1,126 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Journals the test cases of a run as they finish, so the run can resume.
+
+A Journal is a file with one JSON object per line, appended and flushed as
+each test case finishes, so that it survives the run being interrupted. Each
+line holds the names of the environment, suite and case, the position of the
+case in the test plan (as test cases run in parallel may finish in any order),
+and the `history.OUTCOME_*` of the case. A run resuming from the journal of an
+interrupted run skips the test cases it lists (see Journal.skip_finished()),
+and keeps appending to it.
+"""
+
+import json
+import logging
+
+from sampletester import history
+from sampletester import testplan
+
+
+class Journal:
+  """The journal of a run, in the file at `path`.
+
+  If `resume` is set, the test cases already in the file are read into
+  `finished`, and the file is appended to; otherwise, the file is truncated.
+  """
+
+  def __init__(self, path: str, resume: bool = False):
+    self.path = path
+
+    # finished[history.case_key] is the outcome of each finished test case
+    self.finished = {}
+    if resume:
+      try:
+        with open(path) as stream:
+          for line in stream:
+            try:
+              entry = json.loads(line)
+              self.finished[entry['environment'], entry['suite'],
+                            entry['case']] = entry['outcome']
+            except (ValueError, KeyError):
+              # eg a line cut short by the interruption
+              logging.warning(f'ignoring malformed journal line: {line}')
+      except FileNotFoundError:
+        pass
+    self.stream = open(path, 'a' if resume else 'w')
+
+  def close(self):
+    self.stream.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *unused):
+    self.close()
+
+  def record(self, environment: testplan.Environment, suite: testplan.Suite,
+             case: testplan.TestCase, index: int):
+    """Appends the finished test `case`, the `index`th of the plan."""
+    environment_name, suite_name, case_name = history.case_key(environment,
+                                                               suite, case)
+    self.stream.write(json.dumps({'environment': environment_name,
+                                  'suite': suite_name,
+                                  'case': case_name,
+                                  'index': index,
+                                  'outcome': history.outcome(case)}) + '\n')
+    self.stream.flush()
+
+  def skip_finished(self, manager: testplan.Manager):
+    """Deselects the test cases in `manager` that are in the journal.
+
+    The deselected test cases are reported as skipped.
+
+    Returns:
+      the outcomes of the test cases deselected
+    """
+    outcomes = []
+    for environment in manager.environments:
+      for suite in environment.suites:
+        for case in suite.cases:
+          outcome = self.finished.get(history.case_key(environment, suite,
+                                                       case))
+          if outcome and case.selected():
+            case.selected_to_run = False
+            outcomes.append(outcome)
+    return outcomes
+
+
+class Visitor(testplan.Visitor):
+  """Records each test case in a Journal as it finishes.
+
+  This must follow the runner.Visitor in a testplan.MultiVisitor.
+  """
+
+  def __init__(self, journal: Journal):
+    self.journal = journal
+    self.environment = None
+    self.suite = None
+
+    # the position in the test plan of the next test case visited
+    self.index = 0
+
+  def visit_environment(self, environment: testplan.Environment, doit: bool):
+    self.environment = environment
+    return self.visit_suite, None
+
+  def visit_suite(self, idx: int, suite: testplan.Suite, doit: bool):
+    self.suite = suite
+    return self.visit_testcase
+
+  def visit_testcase(self, idx: int, tcase: testplan.TestCase, doit: bool):
+    if doit and tcase.completed:
+      self.journal.record(self.environment, self.suite, tcase, self.index)
+    self.index += 1
@@ -0,0 +1,161 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Load-tests the services behind a sample by running one test case at length.
+
+run() runs a test case over and over for a duration, on `concurrency` worker
+threads and optionally at a target rate of iterations per second. Each
+iteration is a full run of the test case (setup, spec and teardown) by a
+caserunner.TestCase of its own, so its calls resolve as usual and its
+assertions still validate each iteration; an iteration fails if the test case
+fails or errs. summarize() reports the throughput, error rate and latency of
+the iterations, overall and per time window of the run.
+"""
+
+import collections
+import concurrent.futures
+import time
+
+from sampletester import benchmark
+from sampletester import runner
+from sampletester import testplan
+from sampletester import throttle
+
+# An iteration of the load test: when it `start`ed, relative to the start of
+# the run, and how long it took, in seconds, and whether it `failed`.
+Iteration = collections.namedtuple('Iteration', ['start', 'latency',
+                                                 'failed'])
+
+
+def find_case(manager: testplan.Manager, name: str):
+  """Returns the only selected test case of `manager` named `name`.
+
+  Returns:
+    the (environment, suite, index in the suite, case) of the test case
+
+  Raises:
+    ValueError: if no selected test case, or more than one, is named `name`
+  """
+  found = [(environment, suite, idx, case)
+           for environment in manager.environments if environment.selected()
+           for suite in environment.suites if suite.selected()
+           for idx, case in enumerate(suite.cases)
+           if case.selected() and case.name() == name]
+  if len(found) != 1:
+    raise ValueError('{} selected test cases are named "{}"{}'.format(
+        len(found), name,
+        '; select one with --envs and --suites' if found else ''))
+  return found[0]
+
+
+def run(environment: testplan.Environment, suite: testplan.Suite, idx: int,
+        tcase: testplan.TestCase, duration: float, concurrency: int = 1,
+        rate: float = None, clock=time.monotonic, sleep=time.sleep):
+  """Runs `tcase` repeatedly for `duration` seconds.
+
+  Up to `concurrency` iterations run at once, and if `rate` is set, at most
+  `rate` iterations start per second. Iterations in flight when `duration`
+  elapses run to completion. The environment is set up before the first
+  iteration and torn down after the last. Time is read from `clock`, and
+  waited for, to keep to `rate`, with `sleep`.
+
+  Returns:
+    the Iterations run, in the order they finished, and the
+    caserunner.TestCase of the first that failed, or None
+  """
+  bucket = (throttle.TokenBucket(rate, capacity=1, clock=clock, sleep=sleep)
+            if rate else None)
+  iterations = []
+  failures = []
+  start = clock()
+  deadline = start + duration
+
+  def work():
+    while True:
+      if bucket:
+        bucket.acquire()
+      began = clock()
+      if began >= deadline:
+        return
+      case_runner = runner.new_case_runner(environment, suite, idx, tcase)
+      runner.run_case(case_runner, environment, suite)
+      failed = bool(case_runner.failures or case_runner.errors)
+      # list.append() is atomic, so the workers need no lock
+      iterations.append(Iteration(began - start, clock() - began, failed))
+      if failed:
+        failures.append(case_runner)
+
+  environment.config.setup()
+  try:
+    with concurrent.futures.ThreadPoolExecutor(
+        max_workers=concurrency, thread_name_prefix='load') as executor:
+      for future in [executor.submit(work) for _ in range(concurrency)]:
+        future.result()
+  finally:
+    environment.config.teardown()
+  return iterations, failures[0] if failures else None
+
+
+def summarize_iterations(iterations, seconds: float):
+  """Returns a dict describing `iterations` run over `seconds`."""
+  latency = benchmark.summarize([iteration.latency
+                                 for iteration in iterations])
+  failed = sum(iteration.failed for iteration in iterations)
+  return {
+      'iterations': len(iterations),
+      'failed': failed,
+      'error_rate': failed / len(iterations) if iterations else 0.0,
+      'throughput': len(iterations) / seconds if seconds else 0.0,
+      'latency': latency._asdict() if latency else None,
+  }
+
+
+def summarize(iterations, duration: float, window: float):
+  """Returns the report of the `iterations` of a run of `duration` seconds.
+
+  The report is a dict summarizing all of `iterations` (see
+  summarize_iterations()), with the summaries of those started in each
+  `window` seconds of the run under 'windows'.
+  """
+  by_window = collections.defaultdict(list)
+  for iteration in iterations:
+    by_window[int(iteration.start // window)].append(iteration)
+  windows = []
+  for number in range(max(1, int(-(-duration // window)))):
+    start = number * window
+    windows.append({'start': start,
+                    **summarize_iterations(by_window[number],
+                                           min(window, duration - start))})
+  return {'duration': duration, 'window': window,
+          **summarize_iterations(iterations, duration), 'windows': windows}
+
+
+def describe_summary(summary):
+  """Returns a line describing a summary of iterations."""
+  line = '{} iterations ({:.1f}/s), {} failed ({:.1%})'.format(
+      summary['iterations'], summary['throughput'], summary['failed'],
+      summary['error_rate'])
+  if summary['latency']:
+    line += '; latency ' + benchmark.describe_stats(summary['latency'])
+  return line
+
+
+def describe(report):
+  """Returns a human-readable rendering of the report of summarize()."""
+  lines = ['Load test over {:.1f}s: {}'.format(report['duration'],
+                                              describe_summary(report))]
+  for window in report['windows']:
+    lines.append('  {:6.1f}s: {}'.format(window['start'],
+                                         describe_summary(window)))
+  return '\n'.join(lines)
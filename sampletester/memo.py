@@ -0,0 +1,72 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Runs identical cacheable calls once per run.
+
+Calls are only memoized when marked cacheable, either by the directive making
+them (`cacheable: true`) or by the artifact they call (see
+testenv.Base.is_cacheable()), since only calls without side effects whose
+output does not change during a run can be safely shared. A Memo keys each
+call by its environment, command and working directory. The first call with a
+key runs; later calls with the same key, from any test case, get its exit code
+and output, and calls made while it is still running (by test cases running in
+parallel) wait for it instead of running too.
+"""
+
+import concurrent.futures
+import os
+import threading
+
+from sampletester import tracing
+
+
+class Memo:
+  """The results of the cacheable calls of a run."""
+
+  def __init__(self):
+    self.lock = threading.Lock()
+    # results[key] is the Future of the (exit code, output) of each call
+    self.results = {}
+
+  def call(self, environment: str, command: str, cwd: str, run):
+    """Returns the result of the call of `command`, running it if needed.
+
+    Args:
+      run: the function running the call, returning its (exit code, output)
+
+    Returns:
+      a triple of the exit code, the output, and whether the result was
+      reused from an earlier or concurrent call
+    """
+    key = (environment, command, os.path.abspath(cwd or os.curdir))
+    with self.lock:
+      result = self.results.get(key)
+      reused = result is not None
+      if not reused:
+        result = self.results[key] = concurrent.futures.Future()
+    if reused:
+      tracing.count('call memo' + tracing.HITS_SUFFIX)
+      return result.result() + (True,)
+
+    tracing.count('call memo' + tracing.MISSES_SUFFIX)
+    try:
+      return_code, output = run()
+    except BaseException as e:
+      # let later calls try again
+      with self.lock:
+        del self.results[key]
+      result.set_exception(e)
+      raise
+    result.set_result((return_code, output))
+    return return_code, output, False
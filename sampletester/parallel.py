@@ -0,0 +1,168 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Runs the test cases of a test plan in parallel.
+
+A Scheduler sets up the selected environments and starts running the selected
+test cases, in test plan order, on a pool of worker threads. A runner.Visitor
+given the Scheduler then visits the test plan as usual, waiting for each test
+case to finish in turn, so that results are reported in the same order as in
+sequential runs.
+
+The calls the test cases make are admitted by a throttle.Throttle, whose
+limits come from the command line and from the environments themselves (see
+testenv.Base.get_limits()), and which may also take job slots from a GNU make
+jobserver (see jobserver.Client).
+"""
+
+import concurrent.futures
+import logging
+import threading
+
+from sampletester import memo
+from sampletester import runner
+from sampletester import testplan
+from sampletester import throttle
+
+
+def new_throttle(manager: testplan.Manager, jobs: int = 1,
+                 concurrency: int = None, calls_per_second: float = None,
+                 environment_concurrency=None,
+                 environment_calls_per_second=None, adaptive: bool = False,
+                 jobserver=None):
+  """Returns the throttle.Throttle for the selected environments of `manager`.
+
+  The limits of each environment are those it specifies itself, overridden by
+  those in `environment_concurrency` and `environment_calls_per_second`, which
+  map environment names to limits. If `adaptive` is set and there is no global
+  `concurrency` limit, the global limit adapts between 1 and `jobs`. If
+  `jobserver` (a jobserver.Client) is set, each call also takes one of its job
+  slots.
+
+  Returns:
+    the Throttle, or None if there are no limits and no `jobserver`
+  """
+  environment_concurrency = environment_concurrency or {}
+  environment_calls_per_second = environment_calls_per_second or {}
+  if adaptive and not concurrency:
+    concurrency = jobs
+  environment_limits = {}
+  for environment in manager.environments:
+    if not environment.selected():
+      continue
+    name = environment.name()
+    own_concurrency, own_calls_per_second = environment.config.get_limits()
+    limits = (environment_concurrency.get(name, own_concurrency),
+              environment_calls_per_second.get(name, own_calls_per_second))
+    if limits != (None, None):
+      environment_limits[name] = limits
+  if not (concurrency or calls_per_second or environment_limits or jobserver):
+    return None
+  return throttle.Throttle(concurrency, calls_per_second, environment_limits,
+                           adaptive, jobserver)
+
+
+class Scheduler:
+  """Runs the selected test cases of `manager` on `jobs` worker threads.
+
+  Use a Scheduler as a context manager: entering it sets up the environments
+  and starts the test cases, and exiting it stops starting new ones (the test
+  cases already running finish first) and tears down the environments that
+  the runner.Visitor did not. The cacheable calls of all the test cases share
+  their results, concurrent ones included (see `memo`).
+
+  Args:
+    throttle: the throttle.Throttle admitting the calls of the test cases, or
+      None
+    fail_fast: whether to stop starting test cases once any fails
+    calls: the cassette.Cassette recording or replaying the calls of the test
+      cases, or None
+    repeat, warmup: how many times to run each test case, timing its calls,
+      after running it `warmup` times (see runner.run_repeatedly()); calls
+      are not shared when test cases run more than once
+  """
+
+  def __init__(self, manager: testplan.Manager, jobs: int,
+               throttle=None, fail_fast: bool = False, calls=None,
+               repeat: int = 1, warmup: int = 0):
+    self.manager = manager
+    self.jobs = jobs
+    self.throttle = throttle
+    self.fail_fast = fail_fast
+    self.calls = calls
+    self.repeat = repeat
+    self.warmup = warmup
+    self.memo = memo.Memo() if repeat + warmup == 1 else None
+    self.stopped = threading.Event()
+    self.executor = None
+
+    # futures[id(case)] is the Future of the caserunner.TestCase of each case
+    self.futures = {}
+    self.environments_set_up = []
+
+  def __enter__(self):
+    self.start()
+    return self
+
+  def __exit__(self, *unused):
+    self.close()
+
+  def start(self):
+    self.executor = concurrent.futures.ThreadPoolExecutor(
+        max_workers=self.jobs, thread_name_prefix='sampletester')
+    for environment in self.manager.environments:
+      if not environment.selected():
+        continue
+      environment.config.setup()
+      self.environments_set_up.append(environment)
+      for suite in environment.suites:
+        if not suite.selected():
+          continue
+        for idx, case in enumerate(suite.cases):
+          if case.selected():
+            self.futures[id(case)] = self.executor.submit(
+                self._run, environment, suite, idx, case)
+    logging.info('running {} test cases on {} workers'.format(
+        len(self.futures), self.jobs))
+
+  def close(self):
+    self.stopped.set()
+    if self.executor:
+      for future in self.futures.values():
+        future.cancel()
+      self.executor.shutdown(wait=True)
+      self.executor = None
+    for environment in self.environments_set_up:
+      if not environment.completed:
+        environment.config.teardown()
+    self.environments_set_up = []
+
+  def _run(self, environment: testplan.Environment, suite: testplan.Suite,
+           idx: int, case: testplan.TestCase):
+    if self.stopped.is_set():
+      return None
+    case_runner = runner.run_repeatedly(
+        environment, suite, idx, case, self.repeat, self.warmup,
+        throttle=self.throttle, calls=self.calls, call_memo=self.memo)
+    if self.fail_fast and (case_runner.failures or case_runner.errors):
+      self.stopped.set()
+    return case_runner
+
+  def result(self, case: testplan.TestCase):
+    """Waits for `case` to finish, and returns its caserunner.TestCase.
+
+    Since test cases start in test plan order, a test case is only left
+    unstarted under `fail_fast` if one before it failed.
+    """
+    return self.futures[id(case)].result()
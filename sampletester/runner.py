@@ -16,15 +16,86 @@ import logging
 import yaml
 
 from sampletester import caserunner
+from sampletester import memo
 from sampletester import testplan
+from sampletester import tracing
+
+
+def new_case_runner(environment: testplan.Environment, suite: testplan.Suite,
+                    idx: int, tcase: testplan.TestCase, throttle=None,
+                    calls=None, call_memo=None):
+  """Returns the caserunner.TestCase that runs `tcase`.
+
+  Its calls are admitted by `throttle` and, if `calls` (a cassette.Cassette)
+  is set, recorded in or replayed from it. Its cacheable calls share their
+  results through `call_memo` (a memo.Memo).
+  """
+  case_cassette = (calls.for_case(environment.name(), suite.name(),
+                                  tcase.name()) if calls else None)
+  return caserunner.TestCase(environment.config, idx, tcase.name(),
+                             suite.setup(), tcase.spec(), suite.teardown(),
+                             throttle=throttle, cassette=case_cassette,
+                             memo=call_memo)
+
+
+def run_case(case_runner: caserunner.TestCase,
+             environment: testplan.Environment, suite: testplan.Suite):
+  """Runs `case_runner` in a tracing span."""
+  with tracing.span(case_runner.label, tracing.CATEGORY_CASE,
+                    environment=environment.name(), suite=suite.name()):
+    case_runner.run()
 
 
-class Visitor(testplan.Visitor):
+def run_repeatedly(environment: testplan.Environment, suite: testplan.Suite,
+                   idx: int, tcase: testplan.TestCase, repeat: int = 1,
+                   warmup: int = 0, **runner_args):
+  """Runs `tcase` `warmup` times, and then `repeat` times, timing its calls.
+
+  Each run has a caserunner.TestCase of its own (see new_case_runner(), which
+  is passed `runner_args`), and the runs stop at the first that fails. The
+  usage of the calls of the runs after the warmup ones is appended to
+  `tcase.call_usage`.
+
+  Returns:
+    the caserunner.TestCase of the last run
+  """
+  for run in range(warmup + repeat):
+    case_runner = new_case_runner(environment, suite, idx, tcase,
+                                  **runner_args)
+    run_case(case_runner, environment, suite)
+    if run >= warmup:
+      tcase.call_usage.extend(case_runner.call_usage)
+    if case_runner.failures or case_runner.errors:
+      break
+  return case_runner
+
 
-  def __init__(self, fail_fast=False):
+class Visitor(testplan.Visitor):
+  """Runs the test cases visited, and tallies their results.
+
+  If `scheduler` (a parallel.Scheduler) is set, it has set up the environments
+  and is running the test cases already; this waits for each test case, in
+  turn, to finish. Otherwise, the calls of the test cases are recorded in or
+  replayed from `calls` (a cassette.Cassette), if set, and their cacheable
+  calls share their results for the whole visit. Each test case runs as set
+  by `repeat` and `warmup` (see run_repeatedly()); when it runs more than
+  once, its calls are not shared, so that each is timed.
+  """
+
+  def __init__(self, fail_fast=False, scheduler=None, calls=None, repeat=1,
+               warmup=0):
     self.run_passed = True
     self.fail_fast = fail_fast
     self.encountered_failure = False
+    self.scheduler = scheduler
+    self.calls = calls
+    self.repeat = repeat
+    self.warmup = warmup
+    self.memo = memo.Memo() if repeat + warmup == 1 else None
+
+    # open tracing spans for the environments and suites being visited, keyed
+    # by the id of the corresponding testplan.Wrapper
+    self.spans = {}
 
   def start_visit(self):
     logging.info("========== Running test!")
@@ -40,7 +111,10 @@ class Visitor(testplan.Visitor):
       return None, None
 
     environment.attempted = True
-    environment.config.setup()
+    self.spans[id(environment)] = tracing.TRACER.begin(
+        environment.name(), tracing.CATEGORY_ENVIRONMENT)
+    if not self.scheduler:
+      environment.config.setup()
     return (lambda idx, suite, do_suite: self.visit_suite(idx, suite, do_suite, environment),
             lambda idx, suite, do_suite: self.visit_suite_end(idx, suite, do_suite, environment))
 
@@ -55,6 +129,9 @@ class Visitor(testplan.Visitor):
       return None
 
     suite.attempted = True
+    self.spans[id(suite)] = tracing.TRACER.begin(
+        suite.name(), tracing.CATEGORY_SUITE,
+        environment=environment.name(), source=suite.source())
     logging.info(
         "\n==== SUITE {}:{}:{} START  =========================================="
         .format(environment.name(), idx, suite.name()))
@@ -73,11 +150,13 @@ class Visitor(testplan.Visitor):
       return
 
     tcase.attempted = True
-    case_runner = caserunner.TestCase(environment.config, idx, tcase.name(),
-                                      suite.setup(), tcase.spec(),
-                                      suite.teardown())
+    if self.scheduler:
+      case_runner = self.scheduler.result(tcase)
+    else:
+      case_runner = run_repeatedly(environment, suite, idx, tcase,
+                                   self.repeat, self.warmup, calls=self.calls,
+                                   call_memo=self.memo)
     tcase.runner = case_runner
-    case_runner.run()
     num_failures = len(case_runner.failures)
     tcase.num_failures += num_failures
     suite.num_failures += tcase.num_failures
@@ -97,6 +176,8 @@ class Visitor(testplan.Visitor):
 
   def visit_suite_end(self, idx, suite: testplan.Suite,
                       do_suite: bool, environment: testplan.Environment):
+    tracing.TRACER.end(self.spans.pop(id(suite), None),
+                       failures=suite.num_failures, errors=suite.num_errors)
     if suite.success():
       logging.info(
           "==== SUITE {}:{}:{} SUCCESS ========================================"
@@ -123,6 +204,9 @@ class Visitor(testplan.Visitor):
       self.run_passed = False
     environment.completed = True
     environment.config.teardown()
+    tracing.TRACER.end(self.spans.pop(id(environment), None),
+                       failures=environment.num_failures,
+                       errors=environment.num_errors)
 
   def end_visit(self):
     logging.info("========== Finished running test")
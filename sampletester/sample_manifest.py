@@ -12,12 +12,16 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import collections.abc
+import concurrent.futures
 import io
 import logging
+import os
 import os.path
 import yaml
 
 from sampletester import parser
+from sampletester import tracing
 
 from typing import Iterable
 
@@ -74,21 +78,62 @@ class Manifest:
       indices: An optional list of labels by which to index the manifest read in
         from various sources
     """
+    # These are module-level functions rather than methods so that sources can
+    # be resolved in worker processes (see index()).
     self.interpreter = {
-        '1': self.index_source_v1,
-        '2': self.index_source_v2,
-        '3': self.index_source_v3
+        '1': resolve_source_v1,
+        '2': resolve_source_v2,
+        '3': resolve_source_v3
     }
 
-    # tags[key1][key2]...[keyn] == [metadata, metadata, ...]
+    # entries[(key1, key2, ..., keyn)] == [metadata, metadata, ...]
     # eg with self.indices == ["language", "sample"]:
-    #    tags["python"]["analyze_sentiment"] = [ sentiment_john_meta, sentiment_mary_meta ]
-    self.tags = {}
-
-    # sources is a list of (name, parsed-yaml, interpreter) tuples, set by
-    # read_sources() and used by index()
+    #    entries[("python", "analyze_sentiment")] = [ sentiment_john_meta, sentiment_mary_meta ]
+    self.entries = {}
+
+    # next_keys[k][(key1, ..., keyk)] == {key(k+1): None, ...} for k < n, ie
+    # the distinct values of the next index for all the entries starting with
+    # the given keys, in the order they were first indexed. This answers
+    # get_keys() without walking the entries. Each level k is only built (and
+    # from then on maintained) once get_keys() is called with k keys, since
+    # most levels are never queried.
+    # eg next_keys[0][()] = {"python": None, "java": None}
+    self.next_keys = {}
+
+    # sources is a list of (name, parsed-yaml, interpreter, implicit-tags)
+    # tuples, set by read_sources() and used by index()
     self.sources = []
 
+    # source_entries[i] is the part of `entries` that came from sources[i], ie
+    # {(key1, ..., keyn): [metadata, ...]}, so that a single source can be
+    # re-indexed by replace_source()
+    self.source_entries = []
+
+    # the number of elements indexed by index()
+    self.num_elements = 0
+
+    # the parsed tag values shared by all the sources indexed by index()
+    self.templates = TemplateCache()
+
+    # the strings used in the indexed elements, so that each distinct tag name
+    # and value is stored only once (see share_common_tags())
+    self.strings = {}
+
+    # the number of `strings` when they were last all used by the indexed
+    # elements; replace_source() prunes them once they grow well beyond it
+    self.num_live_strings = 0
+
+    # the paths of compiled manifests to load instead of indexing sources (see
+    # `compiled_manifest`), and the loaded compiled manifest, if any. Lookups
+    # are delegated to the latter.
+    self.compiled_sources = []
+    self.compiled = None
+
+    # the spec of the convention using this manifest (eg "tag:sample"), if
+    # known. It is recorded in compiled manifests, and those compiled for
+    # another convention are refused.
+    self.convention = None
+
     self.set_indices(*indices)
 
   def set_indices(self, *indices: str):
@@ -97,6 +142,8 @@ class Manifest:
   def from_docs(self, indexed_docs: parser.IndexedDocs):
     """Ingests the manifests in `indexed_docs`"""
     self.read_sources(from_indexed_docs(indexed_docs))
+    self.compiled_sources.extend(
+        doc.path for doc in indexed_docs.of_type(COMPILED_TYPE))
 
   def read_sources(self, sources):
     """Reads a sample manifest from a single YAML document.
@@ -111,9 +158,21 @@ class Manifest:
     Returns:
       the list of sources successfully read
     """
+    sources_read, interpreted = self._select_interpreters(sources)
+    self.sources.extend(interpreted)
+    return sources_read
+
+  def _select_interpreters(self, sources):
+    """Helper for read_sources() and replace_source().
+
+    Returns:
+      the names of the sources read, and the (name, manifest, interpreter,
+      implicit_tags) tuple for each of the non-empty sources
+    """
     err_no_version = []
     err_no_interpreter = []
     sources_read = []
+    interpreted = []
     for name, manifest, implicit_tags in sources:
       logging.debug('reading manifest "{}"'.format(name))
       if not manifest:
@@ -130,7 +189,7 @@ class Manifest:
       if not interpreter:
         err_no_interpreter.append(name)
         continue
-      self.sources.append((name, manifest, interpreter, implicit_tags))
+      interpreted.append((name, manifest, interpreter, implicit_tags))
 
     error = []
     if len(err_no_version) > 0:
@@ -143,109 +202,367 @@ class Manifest:
       error_msg = 'error reading manifest data:\n {}'.format('\n'.join(error))
       logging.error(error_msg)
       raise ReadManifestError(error_msg)
-    return sources_read
+    return sources_read, interpreted
 
   def string(self):
     return '\n'.join([f'{element}' for element in self.get_all_elements()])
 
-  def index(self):
-    """Indexes all items in self.sources using appropriate interpreters."""
-    self.tags = {}
+  def index(self, processes: int = None):
+    """Indexes all items in self.sources using appropriate interpreters.
+
+    Args:
+      processes: the number of worker processes in which to resolve the
+        sources, which are then merged into the index here in their original
+        order. If not specified, a pool is only used for manifests with
+        several sources and at least PARALLEL_INDEX_MIN_ELEMENTS elements, on
+        machines with more than one CPU. With 1 (or fewer), the sources are
+        resolved in this process.
+    """
+    self.entries = {}
+    self.next_keys = {}
+    self.source_entries = []
+    self.num_elements = 0
+    self.templates = TemplateCache()
+    self.strings = {}
+    self.num_live_strings = 0
+    self.compiled = None
+    if self.compiled_sources:
+      if len(self.compiled_sources) > 1 or self.sources:
+        raise ReadManifestError(
+            'a compiled manifest cannot be combined with other manifests: '
+            '"{}"'.format('", "'.join(self.compiled_sources +
+                                      [name for name, *_ in self.sources])))
+      self.load_compiled(self.compiled_sources[0])
+      return
+
+    if processes is None:
+      processes = index_processes(self.sources)
+    with tracing.phase('index manifest') as counts:
+      if processes > 1:
+        resolved = self._resolve_in_pool(processes)
+        counts['processes'] = processes
+      else:
+        resolved = self._resolve_serially()
+      for elements in resolved:
+        self.source_entries.append(self._index_elements(elements))
+      self.num_live_strings = len(self.strings)
+      counts['sources'] = len(self.sources)
+      counts['elements'] = self.num_elements
+      if processes <= 1:
+        # each worker process has a TemplateCache of its own
+        counts['distinct templates'] = len(self.templates.templates)
+
+  def _resolve_serially(self):
+    """Generator that yields the resolved elements of each source in turn."""
     for name, manifest, interpreter, implicit_tags in self.sources:
       try:
-        interpreter(manifest, implicit_tags)
+        elements = interpreter(manifest, implicit_tags, self.templates)
       except Exception as e:
-        logging.error('error parsing manifest source "{}": {}'.format(name, e))
+        log_source_error(name, e)
         raise
+      yield elements
+
+  def _resolve_in_pool(self, processes: int):
+    """Generator that yields the resolved elements of each source in turn.
+
+    The sources are resolved concurrently in a pool of `processes` worker
+    processes, each returning its elements already in the compact form of
+    share_common_tags(), which keeps the results cheap to send back; their
+    strings are then deduplicated with those of the other sources. The
+    results are nonetheless yielded in the order of self.sources, so the index
+    is the same as when resolving serially, and the first source (in that
+    order) that fails is the one whose error is raised.
+    """
+    with concurrent.futures.ProcessPoolExecutor(processes) as executor:
+      futures = [executor.submit(resolve_source_compactly, interpreter,
+                                 manifest, implicit_tags)
+                 for _, manifest, interpreter, implicit_tags in self.sources]
+      for (name, *_), future in zip(self.sources, futures):
+        try:
+          elements, hits, misses = future.result()
+        except Exception as e:
+          log_source_error(name, e)
+          for pending in futures:
+            pending.cancel()
+          raise
+        self.templates.hits += hits
+        self.templates.misses += misses
+        tracing.count(TEMPLATE_CACHE_COUNTER + tracing.HITS_SUFFIX, hits)
+        tracing.count(TEMPLATE_CACHE_COUNTER + tracing.MISSES_SUFFIX, misses)
+        yield share_strings(elements, self.strings) if elements else elements
+
+  def load_compiled(self, path: str):
+    """Uses the compiled manifest at `path` instead of indexing sources.
+
+    The compiled manifest must have been indexed with the same indices as this
+    manifest, for the same convention if both are known, and must be newer than
+    all the manifest files it was compiled from.
+    """
+    from sampletester import compiled_manifest
 
-  def index_source_v1(self, input, implicit_tags):
-    self._index_elements(
-        extend_all_with(implicit_tags,
-                        check_tag_names(
-                            get_flattened_elements_v1_v2(input))))
-
-  def index_source_v2(self, input, implicit_tags):
-    # v2 is an additive change over v1. It merely involves interpreting tags
-    # included within other tags via curly braces
-    self._index_elements(
-        resolve_inclusions(
-            extend_all_with(implicit_tags,
-                            check_tag_names(
-                                get_flattened_elements_v1_v2(input)))))
-
-  def index_source_v3(self, input, implicit_tags):
-    self._index_elements(
-        resolve_inclusions(
-            extend_all_with(implicit_tags,
-                            check_tag_names(
-                                get_elements_v3(input)))))
+    with tracing.phase('load compiled manifest') as counts:
+      try:
+        compiled = compiled_manifest.CompiledManifest(path)
+      except compiled_manifest.CompiledManifestError as e:
+        raise ReadManifestError(str(e))
+      if list(compiled.indices) != list(self.indices):
+        raise ReadManifestError(
+            'compiled manifest "{}" is indexed by {}, but {} was expected; '
+            'recompile it'.format(path, compiled.indices, list(self.indices)))
+      if (self.convention and compiled.convention and
+          compiled.convention != self.convention):
+        raise ReadManifestError(
+            'compiled manifest "{}" was compiled for convention "{}", but "{}" '
+            'is used; recompile it'.format(path, compiled.convention,
+                                           self.convention))
+      stale = compiled.stale_sources()
+      if stale:
+        raise ReadManifestError(
+            'compiled manifest "{}" is out of date with "{}"; recompile it'
+            .format(path, '", "'.join(stale)))
+      self.compiled = compiled
+      self.num_elements = compiled.num_elements
+      counts['elements'] = compiled.num_elements
+
+  def compile(self, path: str):
+    """Writes this indexed manifest to `path` as a compiled manifest.
 
-  def _index_elements(self, all_elements):
-    if not all_elements:
-      return
+    Returns:
+      the number of elements written
+    """
+    from sampletester import compiled_manifest
 
-    max_idx = len(self.indices) - 1
-    for element in all_elements:
+    with tracing.phase('compile manifest') as counts:
+      counts['elements'] = compiled_manifest.write(
+          path, self.indices, self.groups(),
+          [name for name, *_ in self.sources], self.convention or '')
+    return counts['elements']
+
+  def replace_source(self, name: str, sources):
+    """Re-indexes the source `name` from `sources`, updating the index in place.
 
-      # first resolve all the indices, so that we end up with tags referring to the
-      # non-index list
-      tags = self.tags
-      for idx_num, idx_key in enumerate(self.indices):
-        idx_value = element.get(idx_key, '')
-        tags = get_or_create(tags, idx_value,
-                             [] if idx_num >= max_idx else {})
-      tags.append(element) # appending to the  non-indexed list
+    Only the elements of the new source are resolved; those of the other
+    sources are kept as they are. The resulting index has the same entries as
+    if all the sources had been indexed anew with the new source in place of
+    the old one, except that any keys that were not indexed before come after
+    all the others (in get_keys() and groups()). If this raises an error, the
+    index is left unchanged.
+
+    Args:
+      name: the name of the source to replace, typically the path of a manifest
+        file. All the sources with this name (one per YAML document in the
+        file) are replaced. If there are none, the new source is added after
+        all the others.
+      sources: the new (name, manifest, implicit_tags) tuples for the source,
+        as for read_sources(). These may be empty, to remove the source.
+
+    Returns:
+      the set of the keys (tuples of index values) of the entries whose
+      elements changed, ie were added, removed or modified
+    """
+    if self.compiled:
+      raise ReadManifestError(
+          'cannot replace source "{}" of compiled manifest "{}"'
+          .format(name, self.compiled.path))
+    _, interpreted = self._select_interpreters(sources)
+
+    with tracing.phase('reindex manifest source') as counts:
+      new_entries = []
+      for source_name, manifest, interpreter, implicit_tags in interpreted:
+        try:
+          elements = interpreter(manifest, implicit_tags, self.templates)
+        except Exception as e:
+          log_source_error(source_name, e)
+          raise
+        new_entries.append(self._entries_by_key(elements))
+
+      positions = [idx for idx, (source_name, *_) in enumerate(self.sources)
+                   if source_name == name]
+      first = positions[0] if positions else len(self.sources)
+      old_entries = [self.source_entries[idx] for idx in positions]
+      for idx in reversed(positions):
+        del self.sources[idx]
+        del self.source_entries[idx]
+      self.sources[first:first] = interpreted
+      self.source_entries[first:first] = new_entries
+
+      old_counts = {}
+      for by_key in old_entries:
+        for key, elements in by_key.items():
+          old_counts[key] = old_counts.get(key, 0) + len(elements)
+      replaced = set(old_counts)
+      for by_key in new_entries:
+        replaced.update(by_key)
+
+      entries = self.entries
+      removed = False
+      changed = set()
+      for key in replaced:
+        if len(entries.get(key, ())) == old_counts.get(key, 0):
+          # no other source has elements with this key (the usual case, since
+          # keys are typically unique), so there is nothing to merge
+          elements = [element for by_key in new_entries
+                      for element in by_key.get(key, ())]
+        else:
+          elements = [element for by_key in self.source_entries
+                      for element in by_key.get(key, ())]
+        if elements == entries.get(key, []):
+          continue
+        changed.add(key)
+        self.num_elements += len(elements) - len(entries.get(key, ()))
+        if elements:
+          if key not in entries:
+            for length, level in self.next_keys.items():
+              get_or_create(level, key[:length], {})[key[length]] = None
+          entries[key] = elements
+        elif key in entries:
+          del entries[key]
+          removed = True
+      if removed:
+        # rebuilt lazily by get_keys(), since the removed keys' prefixes may
+        # be shared by other keys
+        self.next_keys = {}
+      if len(self.strings) > 2 * self.num_live_strings:
+        self._prune_strings()
+      counts['sources'] = len(interpreted)
+      counts['changed entries'] = len(changed)
+    return changed
+
+  def _prune_strings(self):
+    """Drops the `strings` no longer used by the elements of any source.
+
+    The strings of the elements of replaced sources would otherwise be kept
+    for as long as the manifest, eg while watching for changes.
+    """
+    strings = {}
+    keep = strings.setdefault
+    bases = set()
+    for by_key in self.source_entries:
+      for elements in by_key.values():
+        for element in elements:
+          if type(element) is not Element:
+            continue
+          keep(element.names, element.names)
+          for name in element.names:
+            keep(name, name)
+          if id(element.base) not in bases:
+            bases.add(id(element.base))
+            for value in element.base.values():
+              if type(value) is str:
+                keep(value, value)
+    self.strings = strings
+    self.num_live_strings = len(strings)
+
+  def _index_elements(self, all_elements):
+    """Adds `all_elements` to the index.
+
+    Returns:
+      the elements grouped by key, as stored in `source_entries`
+    """
+    by_key = self._entries_by_key(all_elements)
+    entries = self.entries
+    next_keys = self.next_keys
+    for key, elements in by_key.items():
+      matches = entries.get(key)
+      if matches is None:
+        matches = entries[key] = []
+        for length, level in next_keys.items():
+          get_or_create(level, key[:length], {})[key[length]] = None
+      matches.extend(elements)
+      self.num_elements += len(elements)
 
     logging.debug('indexed elements')
+    return by_key
+
+  def _entries_by_key(self, all_elements):
+    """Returns compacted `all_elements` grouped by their index values."""
+    if not all_elements:
+      return {}
+
+    all_elements = share_common_tags(all_elements, self.strings)
+    indices = self.indices
+    by_key = {}
+    for element in all_elements:
+      key = tuple([element.get(idx_key, '') for idx_key in indices])
+      matches = by_key.get(key)
+      if matches is None:
+        matches = by_key[key] = []
+      matches.append(element)
+    return by_key
 
   def get_all_elements(self):
     """Generator that yields each element in the (indexed) manifest."""
-    yield from self._get_element(self.tags, idx_num = 0)
+    if self.compiled:
+      yield from self.compiled.get_all_elements()
+      return
+    for _, elements in self.groups():
+      yield from elements
 
-  def _get_element(self, tags, idx_num):
-    """Recursive helper function for get_all_elements.
+  def groups(self, *prefix):
+    """Generator that yields (index values, elements) for each index entry.
 
-    Traverses each index level to retrieve each list item individually.
+    The entries are grouped by their successive index values, each in the order
+    first indexed. If `prefix` is specified, only the entries whose index
+    values start with it are yielded.
     """
-    idx_end = len(self.indices)
-    if idx_num >= idx_end:
-      # base case: we're done with indices, so just yield all the elements in the non-index list
-      for element in tags:
-        yield element
+    yield from self._get_group(tuple(prefix))
+
+  def _get_group(self, prefix):
+    """Recursive helper function for groups.
+
+    Traverses each index level after `prefix` to retrieve each entry.
+    """
+    if len(prefix) >= len(self.indices):
+      # base case: we're done with indices
+      elements = (self.compiled.get(*prefix) if self.compiled
+                  else self.entries.get(prefix))
+      if elements is not None:
+        yield prefix, elements
       return
 
     # recurse to the next index level
-    for key, subtag  in tags.items():
-      yield from self._get_element(subtag, idx_num+1)
+    for key in self.get_keys(*prefix):
+      yield from self._get_group(prefix + (key,))
 
   #TODO: add test
   def get_keys(self, *specified_keys):
     """Returns the keys at the next level after specified_keys have been resolved"""
 
+    if self.compiled:
+      return self.compiled.get_keys(*specified_keys)
     if self.indices == [None]:  # no indices
       return []
     if len(specified_keys) >= len(self.indices):
       return []
-    tags = self.tags
-    for key in specified_keys:
-      tags = tags.get(key, None)
-      if not tags:
-        return []
-    return list(tags.keys())
+    length = len(specified_keys)
+    level = self.next_keys.get(length)
+    if level is None:
+      level = self.next_keys[length] = {}
+      for key in self.entries:
+        get_or_create(level, key[:length], {})[key[length]] = None
+    return list(level.get(specified_keys, ()))
 
   def get(self, *keys, **filters):
-    """Returns the list of artifacts associated with these keys and filters"""
-    keys = keys or [None]
-    try:
-      tags = self.tags
-      for idx in range(0, len(self.indices)):
-        tags = tags[keys[idx]]
-      return [element
-              for element in tags
-              if all(tag_filter in element.items()
-                     for tag_filter in filters.items())]
-    except Exception as e:
+    """Returns the list of artifacts associated with these keys and filters.
+
+    Returns None if no artifacts are indexed under `keys` (including if fewer
+    keys than indices are given). Errors, such as unhashable keys, are raised.
+    """
+    if self.compiled:
+      return self.compiled.get(*keys, **filters)
+    keys = keys or (None,)
+    num_indices = len(self.indices)
+    if len(keys) < num_indices:
       return None
+    elements = self.entries.get(tuple(keys[:num_indices]))
+    if elements is None:
+      return None
+    if not filters:
+      return elements.copy()
+    return [element
+            for element in elements
+            if all(tag_filter in element.items()
+                   for tag_filter in filters.items())]
 
   def get_one(self, *keys, **filters):
     """Returns the single artifact associated with these keys and filters, or None otherwise"""
@@ -259,6 +576,83 @@ class Manifest:
     return values[0]
 
 
+### Interpreters
+
+# Manifests with fewer elements than this (over all their sources) are indexed
+# in a single process by default, since starting worker processes, and sending
+# the sources to them and the elements back, costs more than resolving fewer
+# elements. See Manifest.index().
+PARALLEL_INDEX_MIN_ELEMENTS = 10000
+
+def index_processes(sources) -> int:
+  """Returns the default number of processes in which to index `sources`.
+
+  Args:
+    sources: the (name, manifest, interpreter, implicit_tags) tuples to index,
+      as in `Manifest.sources`
+  """
+  cpus = os.cpu_count() or 1
+  if cpus < 2 or len(sources) < 2:
+    return 1
+  size = sum(approximate_size(manifest) for _, manifest, *_ in sources)
+  if size < PARALLEL_INDEX_MIN_ELEMENTS:
+    return 1
+  return min(len(sources), cpus)
+
+def approximate_size(manifest) -> int:
+  """Returns roughly how many elements `manifest` has, without resolving it."""
+  size = 0
+  for value in manifest.values():
+    if not isinstance(value, list):
+      continue
+    size += len(value)
+    for item in value:  # the sets of v1 and v2 manifests
+      if isinstance(item, dict):
+        items = item.get(Manifest.ELEMENTS_KEY_v1v2)
+        if isinstance(items, list):
+          size += len(items)
+  return size
+
+def resolve_source_v1(input, implicit_tags, templates=None):
+  """Returns the elements of a v1 manifest source, with implicit tags added."""
+  return extend_all_with(implicit_tags,
+                         check_tag_names(get_flattened_elements_v1_v2(input)))
+
+def resolve_source_v2(input, implicit_tags, templates=None):
+  """Returns the resolved elements of a v2 manifest source.
+
+  v2 is an additive change over v1. It merely involves interpreting tags
+  included within other tags via curly braces.
+  """
+  return resolve_inclusions(
+      extend_all_with(implicit_tags,
+                      check_tag_names(get_flattened_elements_v1_v2(input))),
+      templates)
+
+def resolve_source_v3(input, implicit_tags, templates=None):
+  """Returns the resolved elements of a v3 manifest source."""
+  return resolve_inclusions(
+      extend_all_with(implicit_tags,
+                      check_tag_names(get_elements_v3(input))),
+      templates)
+
+def resolve_source_compactly(interpreter, input, implicit_tags):
+  """Resolves a manifest source in a worker process of Manifest.index().
+
+  Returns:
+    the elements returned by `interpreter`, as compact Elements, and the
+    numbers of hits and misses in the TemplateCache used to resolve them
+  """
+  templates = TemplateCache()
+  elements = interpreter(input, implicit_tags, templates)
+  if elements:
+    elements = share_common_tags(elements, {})
+  return elements, templates.hits, templates.misses
+
+def log_source_error(name, error):
+  logging.error('error parsing manifest source "{}": {}'.format(name, error))
+
+
 ### Helpers for V3
 
 def get_elements_v3(input):
@@ -325,52 +719,145 @@ class CycleError(Exception):
   pass
 
 
-def resolve_inclusions(all_elements):
-  """Resolves tag inclusions in each element"""
+def resolve_inclusions(all_elements, templates: 'TemplateCache' = None):
+  """Resolves tag inclusions in each element
+
+  Args:
+    all_elements: the elements whose tags are to be resolved in place
+    templates: the TemplateCache to use, so that it can be shared across
+      calls. If not specified, a new one is used for `all_elements`.
+  """
   if not all_elements:
     return None
+  if templates is None:
+    templates = TemplateCache()
+  hits, misses = templates.hits, templates.misses
   for element in all_elements:
-    resolve_element_inclusions(element)
+    resolve_element_inclusions(element, templates)
+  tracing.count(TEMPLATE_CACHE_COUNTER + tracing.HITS_SUFFIX,
+                templates.hits - hits)
+  tracing.count(TEMPLATE_CACHE_COUNTER + tracing.MISSES_SUFFIX,
+                templates.misses - misses)
   logging.debug('resolved inclusions')
   return all_elements
 
-def resolve_element_inclusions(element):
+def resolve_element_inclusions(element, templates: 'TemplateCache' = None):
   """Resolves tag inclusions in element tags"""
-  resolved=set()
-  for tag_name in element.keys():
-    resolve_tag_inclusion(element, tag_name, history=set(), resolved=resolved,
-                          original_element = element.copy(), original_tag = tag_name)
+  if templates is None:
+    templates = TemplateCache()
+  parsed = {tag_name: templates.inclusions(value, element, tag_name)
+            for tag_name, value in element.items()}
+  for tag_name in templates.order(element, parsed):
+    element[tag_name] = parsed[tag_name].resolve(element)
+  return element
 
-def resolve_tag_inclusion (element, tag_name, history,
-                           resolved, original_element, original_tag):
-    """Recursive helper function for resolve_element_inclusions
+def resolution_order(element, parsed):
+  """Returns the order in which to resolve the tags of `element`.
+
+  Args:
+    element: the element whose tags we are to resolve, used for reporting
+       errors
+    parsed: a map of each tag name in `element` to the `Inclusions` for its
+       value, or to None if the value is a plain literal
+
+  Returns:
+    the list of names of the tags that need resolving, each one after all the
+    tags it includes
+  """
+  order = []
+  resolved = set()
+  for tag_name in parsed.keys():
+    add_to_resolution_order(tag_name, parsed, history=set(), resolved=resolved,
+                            order=order, element=element, original_tag=tag_name)
+  return order
+
+def add_to_resolution_order(tag_name, parsed, history, resolved, order,
+                            element, original_tag):
+    """Recursive helper function for resolution_order
 
     Args:
-       element: the element whose tags we are to resolve
-       tag_name: the tag to resolve in this invocation
+       tag_name: the tag to add to `order` after its inclusions
+       parsed: the map of tag names to `Inclusions`, as in resolution_order
        history: the tags that we have attempted to resolve in the process of
           resolving original_tag. Used to check for cycles.
-       original_element: a copy of the element before any tag inclusions, for
-          reporting errors
+       resolved: the tags already placed in the resolution order (or which
+          need no resolution)
+       order: the resolution order being built
+       element: the element before any tag inclusions, for reporting errors
        original_tag: the original tag we are trying to resolve, for
           reporting errors
     """
     if tag_name in resolved:
-      return element
+      return
     if tag_name in history:
       raise CycleError(
           'resolution of tag "{}"" creates a loop at included tag "{}" in item {}'
-          .format(original_tag, tag_name, original_element))
-
-    new_history = history.copy()
-    new_history.add(tag_name)
-    inclusion = Inclusions.determine(element[tag_name], element, tag_name)
-    for child_tag_name in inclusion.needs.keys():
-      resolve_tag_inclusion(element, child_tag_name, new_history, resolved,
-                            original_element, original_tag)
-    element[tag_name] = inclusion.resolve(element)
+          .format(original_tag, tag_name, element))
+
+    inclusion = parsed[tag_name]
+    if inclusion is not None:
+      new_history = history.copy()
+      new_history.add(tag_name)
+      for child_tag_name in inclusion.needs.keys():
+        add_to_resolution_order(child_tag_name, parsed, new_history, resolved,
+                                order, element, original_tag)
+      order.append(tag_name)
     resolved.add(tag_name)
-    return element
+
+
+# The name of the `tracing` counters for TemplateCache hits and misses.
+TEMPLATE_CACHE_COUNTER = 'manifest template cache'
+
+class TemplateCache:
+  """Shares parsed tag values and resolution orders across manifest elements.
+
+  In factored manifests, most elements share the same tag values (typically via
+  a YAML anchor), so the same strings would otherwise be parsed for inclusions
+  over and over. This caches the `Inclusions` for each distinct raw tag value,
+  and the resolution order for each distinct combination of tag names and
+  included tag names, so that resolving a manifest costs roughly one parse per
+  distinct template rather than one per tag of every element.
+  """
+
+  def __init__(self):
+    # raw tag value -> Inclusions
+    self.templates = {}
+
+    # tuple of (tag name, Inclusions.dependencies or None) -> list of tag names
+    self.orders = {}
+
+    self.hits = 0
+    self.misses = 0
+
+  def inclusions(self, value, element, tag_name):
+    """Returns the (shared) Inclusions for `value`.
+
+    Returns None if `value` is a literal that needs no resolution, including
+    any value that is not a string (eg a list).
+    """
+    if not isinstance(value, str):
+      return None
+    if '{' not in value and '}' not in value:
+      return None
+    inclusions = self.templates.get(value)
+    if inclusions is None:
+      self.misses += 1
+      inclusions = Inclusions.determine(value, element, tag_name)
+      self.templates[value] = inclusions
+    else:
+      self.hits += 1
+    return inclusions
+
+  def order(self, element, parsed):
+    """Returns the (shared) resolution_order for `element`."""
+    key = tuple((tag_name,
+                 None if inclusions is None else inclusions.dependencies)
+                for tag_name, inclusions in parsed.items())
+    order = self.orders.get(key)
+    if order is None:
+      order = resolution_order(element, parsed)
+      self.orders[key] = order
+    return order
 
 
 class Inclusions:
@@ -380,7 +867,8 @@ class Inclusions:
     # a list of strings where each even-indexed string is a literal, and
     # each odd-index string is the name of a key. The inclusions are resolved
     # by substituting the values of the keys (with a map that is passed to
-    # resolve())
+    # resolve()). This list is not modified by resolve(), so that a single
+    # Inclusions can be shared by all the tags with the same value.
     self.parts = parts
 
     # a map of keys to a list of indices in self.parts where that value of that
@@ -390,12 +878,21 @@ class Inclusions:
       needed_where = get_or_create(self.needs, self.parts[idx], [])
       needed_where.append(idx)
 
+    # the names of the included keys, which determine where this tag goes in
+    # the resolution order of an element (see TemplateCache.order())
+    self.dependencies = tuple(self.needs.keys())
+
   def resolve(self, values):
     """Resolves `self` by substituting inclusions with items from `values`."""
+    parts = self.parts.copy()
     for tag, locs in self.needs.items():
+      if not isinstance(values[tag], str):
+        raise ManifestSyntaxError(
+            'cannot include tag "{}", which is not a string, in item {}'
+            .format(tag, values))
       for idx in locs:
-        self.parts[idx] = values[tag]
-    return ''.join(self.parts)
+        parts[idx] = values[tag]
+    return ''.join(parts)
 
   def determine(value, element, tag_name):
     """Static method to instantiate Inclusions for tag_name in element"""
@@ -495,6 +992,128 @@ def extend_all_with(src, dst):
   return dst # to allow for composition
 
 
+### Helpers for compact elements
+
+class Element(collections.abc.Mapping):
+  """A read-only manifest element, stored as shared tags plus its own tags.
+
+  In large manifests, most tags have the same value for every element of a
+  source: the tags in a YAML `&common` block, and the implicit tags. These are
+  stored once, in a `base` dict shared by all those elements, and only the
+  remaining tags are stored in each element's own `overrides` dict, which
+  takes precedence. The tag names, in their original order, are kept in a
+  tuple that is likewise shared by all elements with the same tag names. An
+  Element otherwise reads like the dict it replaces.
+  """
+  __slots__ = ('names', 'base', 'overrides')
+
+  def __init__(self, names, base, overrides):
+    self.names = names
+    self.base = base
+    self.overrides = overrides
+
+  def __getitem__(self, key):
+    if key in self.overrides:
+      return self.overrides[key]
+    return self.base[key]
+
+  def get(self, key, default=None):
+    if key in self.overrides:
+      return self.overrides[key]
+    return self.base.get(key, default)
+
+  def __contains__(self, key):
+    return key in self.overrides or key in self.base
+
+  def __iter__(self):
+    return iter(self.names)
+
+  def __len__(self):
+    return len(self.names)
+
+  def __repr__(self):
+    return repr(dict(self))
+
+  def __reduce__(self):
+    # Much faster to pickle and unpickle than the default for __slots__, which
+    # matters when elements are sent back from the workers of Manifest.index().
+    return Element, (self.names, self.base, self.overrides)
+
+
+# Shared by all the Elements with no tags of their own.
+_NO_OVERRIDES = {}
+
+def share_common_tags(elements, strings):
+  """Replaces each dict in `elements`, in place, with a compact Element.
+
+  The tags with the same value in every element of `elements` are stored once,
+  in a base dict shared by all the Elements. Tag names, the string values in
+  the base dict, and the tuples of tag names are deduplicated via `strings`, a
+  dict mapping each to its canonical instance that should be shared by all the
+  calls for a manifest. (The remaining values are typically unique to each
+  element, so deduplicating them would cost more than it saves.)
+
+  Returns:
+    `elements`, to allow for composition
+  """
+  dicts = [element for element in elements if type(element) is dict]
+  if not dicts:
+    return elements
+  common = dicts[0].copy()
+  for element in dicts:
+    if common.items() <= element.items():
+      continue
+    for name, value in list(common.items()):
+      if name not in element or element[name] != value:
+        del common[name]
+
+  canonical = strings.setdefault
+  base = {canonical(name, name): (canonical(value, value)
+                                  if type(value) is str else value)
+          for name, value in common.items()}
+  for idx, element in enumerate(elements):
+    if type(element) is not dict:
+      continue
+    overrides = {canonical(name, name): value
+                 for name, value in element.items() if name not in base}
+    names = tuple(element)
+    elements[idx] = Element(canonical(names, names), base,
+                            overrides or _NO_OVERRIDES)
+  return elements
+
+def share_strings(elements, strings):
+  """Deduplicates the strings of the Elements in `elements` via `strings`.
+
+  This replaces each Element, in place, with one using the canonical instances
+  in `strings` of its tag names, of the string values of its base dict, and of
+  its tuple of tag names, as share_common_tags() does. It is meant for Elements
+  that were compacted in another process (see resolve_source_compactly()), and
+  whose strings are thus not shared with the rest of the manifest.
+
+  Returns:
+    `elements`, to allow for composition
+  """
+  canonical = strings.setdefault
+  # id(original base) -> (original base, canonical base); the original is kept
+  # so that its id is not reused while this runs
+  bases = {}
+  for idx, element in enumerate(elements):
+    if type(element) is not Element:
+      continue
+    shared = bases.get(id(element.base))
+    if shared is None:
+      shared = bases[id(element.base)] = (
+          element.base,
+          {canonical(name, name): (canonical(value, value)
+                                   if type(value) is str else value)
+           for name, value in element.base.items()})
+    overrides = {canonical(name, name): value
+                 for name, value in element.overrides.items()}
+    elements[idx] = Element(canonical(element.names, element.names), shared[1],
+                            overrides or _NO_OVERRIDES)
+  return elements
+
+
 ### Low-level helpers
 
 def get_or_create(d, key, empty_value):
@@ -538,6 +1157,9 @@ def check_tag_names(src):
                               ' '.join(['"{}"'.format(name) for name in invalid])))
   return src # to allow for composition
 
+# The document type under which `inputs` registers compiled manifest files.
+COMPILED_TYPE = 'compiled-manifest'
+
 class ItemNotUniqueError(Exception):
   pass
 
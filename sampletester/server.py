@@ -0,0 +1,296 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Serves test runs from a daemon that keeps its inputs loaded.
+
+`sample-tester serve` starts a Server listening on a Unix domain socket. Each
+connection sends one run request and receives the output of the run as it is
+produced (see `client` for the protocol). The Server keeps the inputs of
+recent runs loaded (the parsed test plans, and the environments with their
+indexed manifests), keyed by the working directory, convention and files of
+the request. Before each run, the loaded inputs are revalidated by the status
+of their files, and only the changed files are re-read (see `watch.Watcher`).
+Repeated runs thus skip Python start-up, importing conventions, parsing YAML
+and indexing manifests.
+
+Runs are served one at a time, in the working directory and with the
+environment variables of the client.
+"""
+
+import collections
+import contextlib
+import io
+import json
+import logging
+import os
+import socket
+import socketserver
+
+from sampletester import build
+from sampletester import client
+from sampletester import history
+from sampletester import impact
+from sampletester import runner
+from sampletester import summary
+from sampletester import testplan
+from sampletester import tracing
+from sampletester import watch
+from sampletester import xunit
+
+# The keys of a run request, and their values if not specified. These mirror
+# the flags of `sample-tester`.
+REQUEST_DEFAULTS = {
+    'cwd': None,
+    'env': None,
+    'files': [],
+    'convention': None,
+    'envs': None,
+    'suites': None,
+    'cases': None,
+    'shard': None,
+    'balance_shards': False,
+    'history': None,
+    'failed_first': False,
+    'build_cache': None,
+    'changed_files': None,
+    'fail_fast': False,
+    'verbosity': summary.Detail.BRIEF.name,
+    'show_errors': True,
+    'xunit': None,
+}
+
+# The number of distinct sets of inputs kept loaded, least recently used first.
+MAX_LOADED_INPUTS = 8
+
+
+def parse_request(line: bytes):
+  """Returns the run request in `line`, with defaults for unspecified keys."""
+  try:
+    request = json.loads(line)
+  except ValueError as e:
+    raise ValueError(f'malformed request: {e}')
+  if not isinstance(request, dict):
+    raise ValueError(f'malformed request: {request}')
+  unknown = set(request) - set(REQUEST_DEFAULTS)
+  if unknown:
+    raise ValueError('unknown request keys: "{}"'
+                     .format('", "'.join(sorted(unknown))))
+  for key in ['cwd', 'convention']:
+    if not request.get(key):
+      raise ValueError(f'no "{key}" specified in request')
+  return dict(REQUEST_DEFAULTS, **request)
+
+
+@contextlib.contextmanager
+def client_environment(env):
+  """Context manager replacing os.environ with `env` in its body.
+
+  Does nothing if `env` is None.
+  """
+  if env is None:
+    yield
+    return
+  saved = dict(os.environ)
+  os.environ.clear()
+  os.environ.update(env)
+  try:
+    yield
+  finally:
+    os.environ.clear()
+    os.environ.update(saved)
+
+
+class ClientStream(io.TextIOBase):
+  """A text stream whose writes are sent to the client as `name` messages."""
+
+  def __init__(self, connection, name: str):
+    self.connection = connection
+    self.name = name
+
+  def writable(self):
+    return True
+
+  def write(self, text: str):
+    if text:
+      send(self.connection, {self.name: text})
+    return len(text)
+
+
+def send(connection, message):
+  connection.write((json.dumps(message) + '\n').encode('utf-8'))
+  connection.flush()
+
+
+class Server(socketserver.UnixStreamServer):
+  """Serves test runs over the Unix domain socket at `socket_path`."""
+
+  def __init__(self, socket_path: str):
+    super().__init__(socket_path, RequestHandler)
+
+    # (cwd, convention, files) -> the watch.Watcher holding those inputs
+    self.loaded = collections.OrderedDict()
+
+    # the builds of requests without a `build_cache` of their own
+    self.build_cache = build.Cache()
+
+  def inputs(self, request):
+    """Returns the up-to-date watch.Watcher holding the inputs of `request`."""
+    key = (request['cwd'], request['convention'], tuple(request['files']))
+    # Popped, so that inputs that fail to update are dropped.
+    inputs = self.loaded.pop(key, None)
+    if inputs is None:
+      inputs = watch.Watcher(request['files'], request['convention'],
+                             artifacts=False)
+      inputs.load()
+    else:
+      changed = inputs.poll()
+      if changed:
+        logging.info('reloading changed inputs: {}'.format(changed))
+        if inputs.update(changed) is None:
+          inputs.load()
+    self.loaded[key] = inputs
+    while len(self.loaded) > MAX_LOADED_INPUTS:
+      self.loaded.popitem(last=False)
+    return inputs
+
+  def run(self, request, stdout, stderr):
+    """Runs the tests in `request`, writing the output to stdout and stderr.
+
+    The tests run with the environment variables in the request, if any, and
+    the timings of earlier requests are discarded.
+
+    Returns:
+      one of the client.RESULT_* values
+    """
+    tracing.reset()
+    with client_environment(request['env']):
+      return self.run_tests(request, stdout, stderr)
+
+  def run_tests(self, request, stdout, stderr):
+    """Runs the tests in `request` in the current environment; see `run()`."""
+    try:
+      os.chdir(request['cwd'])
+      inputs = self.inputs(request)
+      manager = testplan.Manager(inputs.registry,
+                                 inputs.suites(request['suites'],
+                                               request['cases']),
+                                 request['envs'])
+      if request['changed_files'] is not None:
+        impact.select_affected(manager, request['changed_files'])
+      durations = (history.History(request['history']) if request['history']
+                   else None)
+      if request['shard']:
+        manager.shard(*testplan.parse_shard(request['shard']),
+                      durations.estimate
+                      if durations and request['balance_shards'] else None)
+      if durations:
+        manager.order_cases(durations.estimate,
+                            durations.failed if request['failed_first']
+                            else None)
+      verbosity = summary.Detail[request['verbosity']]
+      failures = [result for result in build.build_all(
+                      build.steps_for(manager),
+                      (build.Cache(request['build_cache'])
+                       if request['build_cache'] else self.build_cache))
+                  if result.error]
+    except Exception as e:
+      logging.error(f'fatal error: {repr(e)}')
+      print(f'\nERROR: could not run tests because {e}\n', file=stdout)
+      return client.RESULT_ERROR
+    if failures:
+      print(build.describe(failures), file=stdout)
+      return client.RESULT_ERROR
+
+    quiet = verbosity == summary.Detail.NONE
+    visitor = testplan.MultiVisitor(
+        runner.Visitor(request['fail_fast']),
+        summary.SummaryVisitor(verbosity, request['show_errors'],
+                               progress_out=stderr))
+    with contextlib.redirect_stdout(stdout), \
+         contextlib.redirect_stderr(stderr):
+      success = manager.accept(visitor)
+
+    if durations:
+      try:
+        with durations:
+          durations.record(manager)
+      except Exception as e:
+        print('could not record test case durations in {}: {}'
+              .format(request['history'], e), file=stdout)
+
+    if not quiet or (not success and request['show_errors']):
+      print('\nTests passed' if success else '\nTests failed', file=stdout)
+
+    if request['xunit']:
+      try:
+        output = manager.accept(xunit.Visitor())
+        if request['xunit'] == '-':
+          stdout.write(output)
+        else:
+          with open(request['xunit'], 'w') as xunit_output:
+            xunit_output.write(output)
+          if not quiet:
+            print('xUnit output written to "{}"'.format(request['xunit']),
+                  file=stdout)
+      except Exception as e:
+        print('could not write xunit output to {}: {}'
+              .format(request['xunit'], e), file=stdout)
+        return client.RESULT_ERROR
+
+    return client.RESULT_PASSED if success else client.RESULT_FAILED
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+
+  def handle(self):
+    line = self.rfile.readline()
+    if not line.strip():
+      return  # eg serve() checking whether a server is listening
+    try:
+      try:
+        request = parse_request(line)
+      except ValueError as e:
+        send(self.wfile, {'stdout': f'ERROR: {e}\n'})
+        send(self.wfile, {'result': client.RESULT_ERROR})
+        return
+      logging.info('running request: {}'.format(
+          {key: value for key, value in request.items() if key != 'env'}))
+      result = self.server.run(request,
+                               ClientStream(self.wfile, 'stdout'),
+                               ClientStream(self.wfile, 'stderr'))
+      send(self.wfile, {'result': result})
+    except (BrokenPipeError, ConnectionResetError):
+      logging.warning('client disconnected during the run')
+
+
+def serve(socket_path: str):
+  """Serves runs on `socket_path` until interrupted.
+
+  Raises:
+    OSError: if another server is already listening on `socket_path`
+  """
+  if os.path.exists(socket_path):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+      try:
+        probe.connect(socket_path)
+      except OSError:
+        os.remove(socket_path)  # left behind by a server that died
+      else:
+        raise OSError(f'a server is already listening on "{socket_path}"')
+
+  with Server(socket_path) as server:
+    try:
+      server.serve_forever()
+    finally:
+      os.remove(socket_path)
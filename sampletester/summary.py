@@ -16,6 +16,7 @@ from enum import Enum
 import os
 import sys
 
+from sampletester import caserunner
 from sampletester import testplan
 
 class Detail(Enum):
@@ -69,6 +70,10 @@ class SummaryVisitor(testplan.Visitor):
     status = self.status_str(tcase, doit)
     if not status:
       return
+    if status == 'FAILED' and runner and not runner.errors and all(
+        failure[0] == caserunner.BUDGET_FAILURE
+        for failure in runner.failures):
+      status = 'OVER BUDGET'
 
     self.append_lines(self.indent * 2 + '{}: Test case: "{}"'
                       .format(status, name))
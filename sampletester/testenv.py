@@ -46,6 +46,63 @@ class Base:
     logging.fatal(
         'get_symbol() invoked on Base (should be overridden)')
 
+  def get_files(self):
+    """Returns the files run by the artifacts in this environment.
+
+    The result maps the path of each file to the set of the keys of the
+    artifacts running it. It is empty if the environment does not know which
+    files its artifacts run.
+    """
+    return {}
+
+  def get_dependencies(self):
+    """Returns the files that the artifacts in this environment depend on.
+
+    The result maps the key of each artifact to the set of paths of the files
+    it depends on, or is None if the environment does not know them.
+    """
+    return None
+
+  def lookup_key(self, artifact: str):
+    """Returns the key of the artifact named `artifact` in get_dependencies().
+
+    This is None if the environment does not know its artifacts' keys.
+    """
+    return None
+
+  def is_cacheable(self, artifact: str):
+    """Returns whether calls of the artifact named `artifact` are cacheable.
+
+    Identical cacheable calls in a run are only made once (see `memo`).
+    """
+    return False
+
+  def get_budgets(self, artifact: str):
+    """Returns the budgets of the calls of the artifact named `artifact`.
+
+    The result maps each `budget` measure limited to its limit, in seconds or
+    bytes.
+    """
+    return {}
+
+  def get_builds(self):
+    """Returns the build steps of the artifacts in this environment.
+
+    The result maps the key of each artifact (see lookup_key()) to the
+    build.Steps to run before calling it. It is empty if the artifacts need no
+    building.
+    """
+    return {}
+
+  def get_limits(self):
+    """Returns the limits on the calls made in this environment.
+
+    The result is a pair of the maximum number of calls in flight at once and
+    the maximum number of calls started per second, either of which is None if
+    not limited.
+    """
+    return None, None
+
   def get_testcase_settings(self):
     """Returns testenv parameters to be used by the test runner"""
     return {}
@@ -115,6 +115,8 @@ class TestCase(Wrapper):
     super().__init__()
     self.config = copy.deepcopy(test_config)
     self.runner = None
+    # the caserunner.CallUsage of each call made by the timed runs of the case
+    self.call_usage = []
     self.selected_to_run = passes_filter(case_filter, self.name())
 
   def name(self):
@@ -273,6 +275,103 @@ class Manager:
 
     return visitor.end_visit()
 
+  def keep_cases(self, keep):
+    """Removes the test cases for which `keep` returns False.
+
+    Suites and environments left without test cases are removed too.
+
+    Args:
+      keep: a function called with the Environment, Suite and TestCase of
+        each test case
+    """
+    for environment in self.environments:
+      for suite in environment.suites:
+        suite.cases = [case for case in suite.cases
+                       if keep(environment, suite, case)]
+      environment.suites = [suite for suite in environment.suites
+                            if suite.cases]
+    self.environments = [environment for environment in self.environments
+                         if environment.suites]
+
+  def shard(self, index: int, count: int, duration=None):
+    """Keeps only the test cases in shard `index` of `count` shards.
+
+    The test cases that are selected to run are dealt round-robin, in order,
+    into the shards, so that each one is in exactly one shard. If `duration`
+    is given, they are instead dealt longest first, each into the shard with
+    the least total duration so far, so that the shards take about as long as
+    each other. The test cases that are not selected to run are removed.
+
+    The shards depend only on the current order of the test cases and on
+    `duration`, so every shard of a run must see the same order and the same
+    durations.
+
+    Args:
+      duration: a function returning the expected duration of a test case,
+        called with its Environment, Suite and TestCase
+    """
+    selected = [(environment, suite, case)
+                for environment in self.environments
+                for suite in environment.suites
+                for case in suite.cases
+                if environment.selected() and suite.selected() and
+                case.selected()]
+    if duration is None:
+      shards = {id(case): position % count
+                for position, (_, _, case) in enumerate(selected)}
+    else:
+      durations = [duration(*selected_case) for selected_case in selected]
+      totals = [0] * count
+      shards = {}
+      for position in sorted(range(len(selected)),
+                             key=lambda position: -durations[position]):
+        shard = min(range(count), key=lambda shard: totals[shard])
+        totals[shard] += durations[position]
+        shards[id(selected[position][2])] = shard
+    self.keep_cases(
+        lambda environment, suite, case: shards.get(id(case)) == index)
+
+  def order_cases(self, duration, first=None):
+    """Orders the environments, suites and test cases longest first.
+
+    Args:
+      duration: a function returning the expected duration of a test case,
+        called with its Environment, Suite and TestCase
+      first: if given, a function called like `duration` returning whether a
+        test case is to be run before all those for which it does not. The
+        suites and environments with such test cases then also go first.
+    """
+    first = first or (lambda environment, suite, case: False)
+    # id(wrapper) -> (not first, -duration) of each environment, suite and case
+    order = {}
+    def combine(wrappers):
+      keys = [order[id(wrapper)] for wrapper in wrappers]
+      return (min((key[0] for key in keys), default=True),
+              sum(key[1] for key in keys))
+
+    for environment in self.environments:
+      for suite in environment.suites:
+        for case in suite.cases:
+          order[id(case)] = (not first(environment, suite, case),
+                             -duration(environment, suite, case))
+        suite.cases.sort(key=lambda case: order[id(case)])
+        order[id(suite)] = combine(suite.cases)
+      environment.suites.sort(key=lambda suite: order[id(suite)])
+      order[id(environment)] = combine(environment.suites)
+    self.environments.sort(key=lambda environment: order[id(environment)])
+
+
+def parse_shard(shard: str):
+  """Returns the (index, count) in a shard specification "INDEX/COUNT"."""
+  try:
+    index, count = [int(part) for part in shard.split('/')]
+  except ValueError:
+    raise ValueError(f'invalid shard "{shard}": expected "INDEX/COUNT"')
+  if count < 1 or not 0 <= index < count:
+    raise ValueError(f'invalid shard "{shard}": INDEX must be at least 0 and '
+                     'less than COUNT')
+  return index, count
+
 
 SCHEMA = parser.SchemaDescriptor('test','samples', 1)
 
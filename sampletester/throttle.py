@@ -0,0 +1,249 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Limits the calls that test cases run in parallel make to their samples.
+
+A Limiter bounds the number of calls in flight at once and, optionally, the
+rate at which they start (through a TokenBucket). An adaptive Limiter adjusts
+its concurrency limit as calls finish, following the additive-increase,
+multiplicative-decrease (AIMD) scheme of TCP congestion control: the limit
+grows by about one call per "round" of calls that finish promptly, and is
+halved when a call could not be made (eg its process could not be spawned) or
+takes much longer than calls usually do, so that parallel runs back off from
+backends that are being overloaded. Calls whose samples exit with an error are
+not signs of overload: test cases often expect them to.
+
+A Throttle holds a global Limiter and one Limiter per environment; each call
+made by a test case is admitted by the Limiter of its environment, then by the
+global one and then, if there is one, by a jobserver.Client sharing the job
+slots of the GNU make running sample-tester.
+"""
+
+import math
+import threading
+import time
+
+# An adaptive Limiter halves its concurrency limit when a call takes longer
+# than LATENCY_SPIKE times the moving average of the latency of its calls.
+LATENCY_SPIKE = 3.0
+
+# The weight of the latest latency in the moving average of an adaptive
+# Limiter.
+SMOOTHING = 0.2
+
+# The factor by which an adaptive Limiter decreases its concurrency limit.
+DECREASE = 0.5
+
+# The shortfall from a whole token that a TokenBucket ignores.
+_TOKEN_EPSILON = 1e-9
+
+
+class TokenBucket:
+  """Admits `rate` acquisitions per second, in bursts of up to `capacity`."""
+
+  def __init__(self, rate: float, capacity: float = None,
+               clock=time.monotonic, sleep=time.sleep):
+    if rate <= 0:
+      raise ValueError(f'expected a positive rate, got {rate}')
+    self.rate = rate
+    self.capacity = capacity or max(1.0, rate)
+    self.tokens = self.capacity
+    self.clock = clock
+    self.sleep = sleep
+    self.updated = clock()
+    self.lock = threading.Lock()
+
+  def acquire(self):
+    """Blocks until a token is available, and takes it."""
+    while True:
+      with self.lock:
+        now = self.clock()
+        self.tokens = min(self.capacity,
+                          self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        # tolerate rounding errors, or waits too short to advance the clock
+        if self.tokens >= 1 - _TOKEN_EPSILON:
+          self.tokens = max(0.0, self.tokens - 1)
+          return
+        wait = (1 - self.tokens) / self.rate
+      self.sleep(wait)
+
+
+class Limiter:
+  """Admits calls up to a concurrency limit and a rate.
+
+  Args:
+    concurrency: the maximum number of calls in flight, or None for no limit
+    calls_per_second: the maximum rate at which calls start, or None for no
+      limit
+    adaptive: whether to adjust the concurrency limit, between 1 and
+      `concurrency`, as calls finish (see the module docstring). This has no
+      effect without a `concurrency`.
+  """
+
+  def __init__(self, concurrency: int = None, calls_per_second: float = None,
+               adaptive: bool = False, clock=time.monotonic):
+    if concurrency is not None and concurrency < 1:
+      raise ValueError(f'expected a concurrency of at least 1, got '
+                       f'{concurrency}')
+    self.max_concurrency = concurrency
+    self.limit = float(concurrency) if concurrency else None
+    self.adaptive = adaptive and concurrency is not None
+    self.bucket = (TokenBucket(calls_per_second, clock=clock)
+                   if calls_per_second else None)
+    self.clock = clock
+    self.in_flight = 0
+    self.condition = threading.Condition()
+
+    # the moving average of the latency of calls, for adaptive limiters
+    self.mean_latency = None
+    self.last_decrease = -math.inf
+
+  def acquire(self):
+    """Blocks until a call may start.
+
+    Returns:
+      the token to pass to release() once the call finishes
+    """
+    with self.condition:
+      while self.limit is not None and self.in_flight >= int(self.limit):
+        self.condition.wait()
+      self.in_flight += 1
+    if self.bucket:
+      try:
+        self.bucket.acquire()
+      except BaseException:  # eg KeyboardInterrupt
+        self.cancel()
+        raise
+    return self.clock()
+
+  def cancel(self):
+    """Records that a call admitted by acquire() was not made after all."""
+    with self.condition:
+      self.in_flight -= 1
+      self.condition.notify_all()
+
+  def release(self, token, overloaded: bool = False):
+    """Records that the call admitted with `token` finished.
+
+    Args:
+      overloaded: whether the call could not be made for lack of resources
+        (eg its process could not be spawned)
+    """
+    now = self.clock()
+    with self.condition:
+      self.in_flight -= 1
+      if self.adaptive:
+        self._adapt(now - token, overloaded, now)
+      self.condition.notify_all()
+
+  def _adapt(self, latency: float, overloaded: bool, now: float):
+    spike = (self.mean_latency is not None and
+             latency > LATENCY_SPIKE * self.mean_latency)
+    self.mean_latency = (latency if self.mean_latency is None else
+                         SMOOTHING * latency +
+                         (1 - SMOOTHING) * self.mean_latency)
+    if overloaded or spike:
+      # Decrease at most once per typical call, since the calls in flight
+      # when a backend is overloaded will tend to fail together.
+      if now - self.last_decrease >= self.mean_latency:
+        self.limit = max(1.0, self.limit * DECREASE)
+        self.last_decrease = now
+    else:
+      self.limit = min(float(self.max_concurrency), self.limit + 1 / self.limit)
+
+
+class Throttle:
+  """The global and per-environment Limiters of a run.
+
+  Args:
+    concurrency: the global concurrency limit, or None
+    calls_per_second: the global rate limit, or None
+    environment_limits: maps the name of each environment to its
+      (concurrency, calls_per_second) limits, either of which may be None
+    adaptive: whether the Limiters with a concurrency limit are adaptive
+    jobserver: a jobserver.Client to take a job slot from for each call, or
+      None
+  """
+
+  def __init__(self, concurrency: int = None, calls_per_second: float = None,
+               environment_limits=None, adaptive: bool = False,
+               jobserver=None):
+    self.limiter = Limiter(concurrency, calls_per_second, adaptive)
+    self.jobserver = jobserver
+    self.environments = {
+        name: Limiter(environment_concurrency, environment_rate, adaptive)
+        for name, (environment_concurrency, environment_rate)
+        in (environment_limits or {}).items()}
+
+  def acquire(self, environment: str):
+    """Blocks until a call in `environment` may start.
+
+    Returns:
+      the token to pass to release() once the call finishes
+    """
+    limiter = self.environments.get(environment)
+    limiters = ([limiter] if limiter else []) + [self.limiter]
+    admitted = []
+    try:
+      for each in limiters:
+        each.acquire()
+        admitted.append(each)
+      job_token = self.jobserver.acquire() if self.jobserver else None
+    except BaseException:  # eg OSError from the jobserver, KeyboardInterrupt
+      for each in reversed(admitted):
+        each.cancel()
+      raise
+    # The call starts only once all of them admit it, so the time spent
+    # waiting for the later ones must not count as latency in the earlier.
+    tokens = [(each, each.clock()) for each in limiters]
+    if self.jobserver:
+      tokens.append((self.jobserver, job_token))
+    return tokens
+
+  def release(self, tokens, overloaded: bool = False):
+    """Records that the call admitted with `tokens` finished.
+
+    See Limiter.release().
+    """
+    for limiter, token in reversed(tokens):
+      limiter.release(token, overloaded)
+
+
+def parse_limits(values, convert, flag: str):
+  """Parses the `[ENVIRONMENT=]LIMIT` values of the command-line `flag`.
+
+  Returns:
+    a pair of the global limit (or None) and a dict mapping environment names
+    to their limits, each converted by `convert`
+
+  Raises:
+    ValueError: if any value cannot be parsed
+  """
+  global_limit = None
+  limits = {}
+  for value in values or []:
+    name, _, limit = value.rpartition('=')
+    try:
+      limit = convert(limit)
+      if limit <= 0:
+        raise ValueError
+    except ValueError:
+      raise ValueError(f'expected {flag} [ENVIRONMENT=]LIMIT with a positive '
+                       f'LIMIT, got "{value}"')
+    if name:
+      limits[name] = limit
+    else:
+      global_limit = limit
+  return global_limit, limits
@@ -0,0 +1,277 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+import contextlib
+import json
+import logging
+import os
+import threading
+import time
+
+# Categories used for the spans emitted by sample-tester itself.
+CATEGORY_PHASE = 'phase'
+CATEGORY_ENVIRONMENT = 'environment'
+CATEGORY_SUITE = 'suite'
+CATEGORY_CASE = 'case'
+CATEGORY_CALL = 'call'
+CATEGORY_BUILD = 'build'
+
+# The suffixes of the pairs of counters from which `Timings` derives hit rates.
+HITS_SUFFIX = '.hits'
+MISSES_SUFFIX = '.misses'
+
+# A span that has been started but not yet ended.
+OpenSpan = collections.namedtuple('OpenSpan',
+                                  ['name', 'category', 'args', 'start', 'lane'])
+
+
+class Tracer:
+  """Records timed spans and exports them in the Chrome trace-event format.
+
+  Each span is recorded as a "complete" event when it ends. Spans are placed on
+  a lane per thread, so that spans run by different workers show up on
+  different rows of the timeline, and spans nested in time on the same thread
+  show up nested. The output can be loaded in chrome://tracing or in Perfetto.
+
+  A disabled Tracer (the default) records nothing, so that instrumented code
+  paths cost next to nothing when tracing was not requested.
+  """
+
+  def __init__(self, enabled: bool = False):
+    self.enabled = enabled
+    self.events = []
+    # the (thread name, lane) of each thread that recorded a span
+    self._lanes = []
+    # the lane of the current thread; unlike thread idents, which are reused
+    # once threads exit, this is new in each thread
+    self._thread = threading.local()
+    self._lock = threading.Lock()
+    self._origin = time.perf_counter()
+
+  def enable(self):
+    self.enabled = True
+
+  def reset(self):
+    """Discards the spans recorded so far."""
+    with self._lock:
+      self.events = []
+      self._lanes = []
+      self._thread = threading.local()
+      self._origin = time.perf_counter()
+
+  def begin(self, name: str, category: str, **args):
+    """Starts a span and returns a token to pass to `end()`.
+
+    Returns None if the tracer is disabled.
+    """
+    if not self.enabled:
+      return None
+    return OpenSpan(name, category, args, self._now(), self._lane())
+
+  def end(self, span: OpenSpan, **args):
+    """Ends `span`, recording it. Any `args` are added to the span's args."""
+    if span is None:
+      return
+    all_args = dict(span.args)
+    all_args.update(args)
+    event = {
+        'name': span.name,
+        'cat': span.category,
+        'ph': 'X',
+        'ts': span.start,
+        'dur': self._now() - span.start,
+        'pid': os.getpid(),
+        'tid': span.lane,
+    }
+    if all_args:
+      event['args'] = all_args
+    with self._lock:
+      self.events.append(event)
+
+  @contextlib.contextmanager
+  def span(self, name: str, category: str, **args):
+    """Context manager recording a span around its body."""
+    token = self.begin(name, category, **args)
+    try:
+      yield token
+    finally:
+      self.end(token)
+
+  def trace_events(self):
+    """Returns the recorded events, preceded by the lane name metadata."""
+    with self._lock:
+      metadata = [{'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(),
+                   'tid': lane, 'args': {'name': thread_name}}
+                  for thread_name, lane in self._lanes]
+      return metadata + sorted(self.events, key=lambda event: event['ts'])
+
+  def write(self, path: str):
+    """Writes the recorded trace as JSON to the file at `path`."""
+    with open(path, 'w') as stream:
+      json.dump({'traceEvents': self.trace_events(),
+                 'displayTimeUnit': 'ms'},
+                stream)
+
+  def _now(self):
+    """Returns the microseconds elapsed since this tracer was created."""
+    return (time.perf_counter() - self._origin) * 1e6
+
+  def _lane(self):
+    """Returns the lane for the current thread, allocating it if needed."""
+    lane = getattr(self._thread, 'lane', None)
+    if lane is None:
+      with self._lock:
+        lane = len(self._lanes) + 1
+        self._lanes.append((threading.current_thread().name, lane))
+      self._thread.lane = lane
+    return lane
+
+
+# A phase that has finished, with the counts recorded while it ran.
+Phase = collections.namedtuple('Phase', ['name', 'depth', 'seconds', 'counts'])
+
+
+class Timings:
+  """Accumulates the durations of the coarse phases of a run, plus counters.
+
+  Unlike `Tracer`, this is always on: it is meant for a handful of phases per
+  run (loading inputs, indexing the manifest, building the test plan, ...), so
+  the cost of recording them is negligible.
+
+  Counters whose names end in HITS_SUFFIX and MISSES_SUFFIX are paired up to
+  report hit rates (eg for caches).
+
+  Phases and counters may be recorded from any thread.
+  """
+
+  def __init__(self):
+    self.phases = []
+    self.counters = collections.Counter()
+    self._depth = threading.local()
+    self._lock = threading.Lock()
+
+  def reset(self):
+    """Discards the phases and counters recorded so far."""
+    with self._lock:
+      self.phases = []
+      self.counters = collections.Counter()
+
+  @contextlib.contextmanager
+  def phase(self, name: str):
+    """Context manager timing its body as the phase `name`.
+
+    Yields a dict in which the body may record counts (eg number of documents
+    processed) to report along with the phase duration.
+    """
+    depth = getattr(self._depth, 'value', 0)
+    self._depth.value = depth + 1
+    counts = {}
+
+    # Reserve this phase's slot now so that phases are listed in the order in
+    # which they started, with nested phases after their parents.
+    running = Phase(name, depth, None, counts)
+    with self._lock:
+      phases = self.phases
+      slot = len(phases)
+      phases.append(running)
+    start = time.perf_counter()
+    try:
+      yield counts
+    finally:
+      seconds = time.perf_counter() - start
+      self._depth.value = depth
+      with self._lock:
+        # not recorded if the timings were reset while the phase ran
+        phases[slot] = Phase(name, depth, seconds, counts)
+      logging.debug('phase "{}" took {:.3f}s {}'.format(name, seconds, counts))
+
+  def count(self, name: str, value: int = 1):
+    """Adds `value` to the counter `name`."""
+    with self._lock:
+      self.counters[name] += value
+
+  def hit_rates(self):
+    """Returns a dict mapping counter prefixes to (hits, misses, rate)."""
+    rates = {}
+    with self._lock:
+      counters = dict(self.counters)
+    for name, hits in counters.items():
+      if not name.endswith(HITS_SUFFIX):
+        continue
+      prefix = name[:-len(HITS_SUFFIX)]
+      misses = counters.get(prefix + MISSES_SUFFIX, 0)
+      total = hits + misses
+      rates[prefix] = (hits, misses, hits / total if total else 0.0)
+    return rates
+
+  def summary(self):
+    """Returns a human-readable summary of the phases and counters."""
+    lines = ['Timings:']
+    with self._lock:
+      phases = list(self.phases)
+      counters = dict(self.counters)
+    for phase in phases:
+      if phase.seconds is None:  # still running
+        continue
+      counts = ''.join(f', {name}: {value}'
+                       for name, value in phase.counts.items())
+      lines.append('{}{}: {:.3f}s{}'.format('  ' * (phase.depth + 1),
+                                             phase.name, phase.seconds, counts))
+    rates = self.hit_rates()
+    for name, value in sorted(counters.items()):
+      if name.endswith(HITS_SUFFIX) or name.endswith(MISSES_SUFFIX):
+        continue
+      lines.append(f'  {name}: {value}')
+    for name, (hits, misses, rate) in sorted(rates.items()):
+      lines.append(f'  {name}: {hits} hits, {misses} misses ({rate:.1%})')
+    return '\n'.join(lines)
+
+
+# The tracer used throughout sample-tester. It is enabled by the CLI when a
+# trace is requested.
+TRACER = Tracer()
+
+# The phase timings for this run.
+TIMINGS = Timings()
+
+
+def reset():
+  """Discards what `TRACER` and `TIMINGS` have recorded, eg between runs."""
+  TRACER.reset()
+  TIMINGS.reset()
+
+
+def span(name: str, category: str, **args):
+  """Returns a context manager recording a span on `TRACER`."""
+  return TRACER.span(name, category, **args)
+
+
+@contextlib.contextmanager
+def phase(name: str):
+  """Context manager timing a phase on `TIMINGS` and tracing it on `TRACER`.
+
+  Yields the dict of counts for the phase; see `Timings.phase()`.
+  """
+  token = TRACER.begin(name, CATEGORY_PHASE)
+  with TIMINGS.phase(name) as counts:
+    try:
+      yield counts
+    finally:
+      TRACER.end(token, **counts)
+
+
+def count(name: str, value: int = 1):
+  """Adds `value` to the counter `name` on `TIMINGS`."""
+  TIMINGS.count(name, value)
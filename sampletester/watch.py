@@ -0,0 +1,377 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Re-runs the test cases affected by changes to their input files.
+
+A Watcher loads the test plans and manifests once and runs all the test cases.
+It then polls the manifest and test plan files, and the files run by the
+manifest artifacts (their `path` tags), by their status, so that no extra
+dependencies are needed. When any of them change, it re-reads only the changed
+files, updating the indexed manifest in place (see
+`Manifest.replace_source()`), and re-runs only the test cases whose
+configuration, or any of whose looked-up artifacts, changed.
+
+Environments that record the artifacts each test case looks up (see
+`tag.ManifestEnvironment.lookups`) allow narrowing down the cases affected by
+manifest changes. For other environments, every case is re-run whenever a
+manifest or artifact changes. Before each run, the build steps of the cases to
+run are run unless the build Cache has them current (see `build.build_all()`).
+Changes that alter the set of environments lead to reloading all the inputs.
+Files created after the inputs were (re)loaded are not watched.
+"""
+
+import logging
+import os
+import time
+
+from sampletester import build
+from sampletester import environment_registry
+from sampletester import inputs
+from sampletester import runner
+from sampletester import sample_manifest
+from sampletester import summary
+from sampletester import testplan
+from sampletester import tracing
+
+# The default number of seconds between polls of the watched files.
+POLL_INTERVAL = 1.0
+
+
+def file_status(path: str):
+  """Returns the (mtime_ns, size) of `path`, or None if it does not exist."""
+  try:
+    stat = os.stat(path)
+  except OSError:
+    return None
+  return stat.st_mtime_ns, stat.st_size
+
+
+def case_id(environment: testplan.Environment, suite: testplan.Suite,
+            case: testplan.TestCase):
+  """Returns the key under which a Watcher tracks a test case."""
+  return environment.name(), suite.source(), suite.name(), case.name()
+
+
+def fingerprint(suite: testplan.Suite, case: testplan.TestCase):
+  """Returns a value that changes whenever the configuration of a case does.
+
+  This includes the configuration of its suite (eg its setup).
+  """
+  return repr((suite.config, case.config))
+
+
+def source_names(manifest: sample_manifest.Manifest):
+  """Returns the names of the files `manifest` was read from."""
+  return {name for name, *_ in manifest.sources} | set(manifest.compiled_sources)
+
+
+class Watcher:
+  """Runs test cases, and re-runs them as their input files change."""
+
+  def __init__(self, file_patterns, convention_spec, env_filter=None,
+               suite_filter=None, case_filter=None, fail_fast=False,
+               verbosity=summary.Detail.BRIEF, show_errors=True, debug=False,
+               artifacts=True, build_cache=None):
+    """Initializes Watcher.
+
+    Args:
+      artifacts: whether to watch the files run by the artifacts, in addition
+        to the test plan and manifest files
+      build_cache: the build.Cache of the builds run before each run; if None,
+        one is kept in memory across runs
+    """
+    self.file_patterns = file_patterns
+    self.convention_spec = convention_spec
+    self.env_filter = env_filter
+    self.suite_filter = suite_filter
+    self.case_filter = case_filter
+    self.fail_fast = fail_fast
+    self.verbosity = verbosity
+    self.show_errors = show_errors
+    self.debug = debug
+    self.artifacts = artifacts
+    self.build_cache = build_cache or build.Cache()
+
+    self.registry = None
+    self.manifests = []
+
+    # testplan_docs[path] is the list of test plan documents in file `path`
+    self.testplan_docs = {}
+
+    # the paths of the files of all the manifests
+    self.manifest_paths = set()
+
+    # artifact_files[path] is the set of keys of the artifacts running `path`
+    self.artifact_files = {}
+
+    # status[path] is the file_status() of each watched file when last polled
+    self.status = {}
+
+    # lookups[case_id] is the set of keys of the artifacts that the case looked
+    # up when last run, or None if that is not known
+    self.lookups = {}
+
+    # fingerprints[case_id] is the fingerprint() of each case when last run
+    self.fingerprints = {}
+
+    # whether the test cases run last passed
+    self.passed = True
+
+  def load(self):
+    """(Re)loads all the inputs, so that all test cases are considered new."""
+    with tracing.phase('load inputs') as counts:
+      indexed_docs = inputs.index_docs(*self.file_patterns)
+      self.registry = environment_registry.new(self.convention_spec,
+                                               indexed_docs)
+      self.testplan_docs = {}
+      for doc in indexed_docs.of_type(testplan.SCHEMA.primary_type):
+        self.testplan_docs.setdefault(doc.path, []).append(doc)
+      self.manifests = list({id(env.manifest): env.manifest
+                             for env in self.registry.list()
+                             if hasattr(env, 'manifest')}.values())
+      self.lookups = {}
+      self.fingerprints = {}
+      self.refresh_files()
+      counts['watched files'] = len(self.status)
+
+  def refresh_files(self):
+    """Updates the set of watched files from the loaded inputs."""
+    self.artifact_files = {}
+    for env in self.registry.list() if self.artifacts else []:
+      for path, keys in env.get_files().items():
+        self.artifact_files.setdefault(path, set()).update(keys)
+    self.manifest_paths = set()
+    for manifest in self.manifests:
+      self.manifest_paths |= source_names(manifest)
+
+    paths = (set(self.testplan_docs) | self.manifest_paths |
+             set(self.artifact_files))
+    self.status = {path: (self.status[path] if path in self.status
+                          else file_status(path))
+                   for path in paths}
+
+  def poll(self):
+    """Returns the watched files that changed since the last poll."""
+    changed = []
+    for path, status in self.status.items():
+      current = file_status(path)
+      if current != status:
+        self.status[path] = current
+        changed.append(path)
+    return changed
+
+  def update(self, changed_paths):
+    """Re-reads the `changed_paths`, updating the loaded inputs.
+
+    Returns:
+      the set of keys of the manifest artifacts that changed, or None if all
+      the inputs need to be reloaded
+    """
+    changed_keys = set()
+    with tracing.phase('update inputs') as counts:
+      for path in changed_paths:
+        if path in self.manifest_paths:
+          keys = self.update_manifest(path)
+          if keys is None:
+            return None
+          changed_keys |= keys
+        elif path in self.testplan_docs:
+          if not self.update_testplan(path):
+            return None
+        changed_keys |= self.artifact_files.get(path, set())
+      self.refresh_files()
+      counts['changed files'] = len(changed_paths)
+      counts['changed artifacts'] = len(changed_keys)
+    return changed_keys
+
+  def update_manifest(self, path: str):
+    """Re-reads the manifest file `path`.
+
+    Returns:
+      the keys of the artifacts that changed, or None if all the inputs need
+      to be reloaded
+    """
+    indexed_docs = inputs.create_indexed_docs(path)
+    if indexed_docs.of_type(testplan.SCHEMA.primary_type):
+      return None
+    changed_keys = set()
+    for manifest in self.manifests:
+      if path not in source_names(manifest):
+        continue
+      if manifest.compiled:
+        return None
+      environments = set(manifest.get_keys())
+      changed_keys |= manifest.replace_source(
+          path, list(sample_manifest.from_indexed_docs(indexed_docs)))
+      if set(manifest.get_keys()) != environments:
+        return None
+    return changed_keys
+
+  def update_testplan(self, path: str):
+    """Re-reads the test plan file `path`.
+
+    Returns:
+      whether the file could be updated on its own (ie it does not now contain
+      manifests)
+    """
+    indexed_docs = inputs.create_indexed_docs(path)
+    if (indexed_docs.of_type(sample_manifest.SCHEMA.primary_type) or
+        indexed_docs.of_type(sample_manifest.COMPILED_TYPE)):
+      return False
+    self.testplan_docs[path] = indexed_docs.of_type(
+        testplan.SCHEMA.primary_type)
+    return True
+
+  def suites(self, suite_filter: str = None, case_filter: str = None):
+    """Returns new testplan.Suites for the loaded test plans."""
+    return testplan.suites_from_doc_list(
+        [doc for docs in self.testplan_docs.values() for doc in docs],
+        suite_filter, case_filter)
+
+  def affected(self, case: tuple, case_fingerprint: str, changed_keys):
+    """Returns whether the case with id `case` needs to be run."""
+    if changed_keys is None or self.fingerprints.get(case) != case_fingerprint:
+      return True
+    lookups = self.lookups.get(case)
+    if lookups is None:
+      return bool(changed_keys)
+    return not lookups.isdisjoint(changed_keys)
+
+  def run(self, changed_keys=None):
+    """Runs the test cases affected by changes to the artifacts `changed_keys`.
+
+    Test cases that are new or whose configuration changed since they last
+    ran are also run. If `changed_keys` is None, all the test cases are run.
+    They are not run if building the artifacts they call fails.
+
+    Returns:
+      the testplan.Manager of the test cases run, or None if none were
+      affected. `self.passed` is set to whether they passed.
+    """
+    manager = testplan.Manager(self.registry,
+                               self.suites(self.suite_filter,
+                                           self.case_filter),
+                               self.env_filter)
+
+    fingerprints = {}
+    to_run = []
+    def affected(environment, suite, case):
+      this_case = case_id(environment, suite, case)
+      fingerprints[this_case] = fingerprint(suite, case)
+      if not self.affected(this_case, fingerprints[this_case], changed_keys):
+        return False
+      to_run.append((this_case, environment, suite, case))
+      return True
+    manager.keep_cases(affected)
+
+    # Forget the cases that no longer exist, and remember those that ran (or
+    # were not selected to run) until they are affected by a change.
+    self.fingerprints = {this_case: self.fingerprints[this_case]
+                         for this_case in fingerprints
+                         if this_case in self.fingerprints}
+    self.lookups = {this_case: self.lookups[this_case]
+                    for this_case in fingerprints
+                    if this_case in self.lookups}
+    if not to_run:
+      return None
+
+    steps = build.steps_for(manager)
+    if steps:
+      failures = [result for result in build.build_all(steps, self.build_cache)
+                  if result.error]
+      if failures:
+        # the cases keep their old fingerprints, so that they run again on the
+        # next change
+        print(build.describe(failures))
+        self.passed = False
+        return manager
+
+    visitor = testplan.MultiVisitor(
+        Visitor(self.fail_fast, self.lookups),
+        summary.SummaryVisitor(self.verbosity, self.show_errors,
+                               debug=self.debug))
+    with tracing.phase('run') as counts:
+      self.passed = manager.accept(visitor)
+      counts['cases'] = len(to_run)
+    for this_case, environment, suite, case in to_run:
+      if case.attempted or not (environment.selected() and suite.selected()
+                                and case.selected()):
+        self.fingerprints[this_case] = fingerprints[this_case]
+    return manager
+
+  def watch(self, interval: float = POLL_INTERVAL):
+    """Runs all the test cases, then re-runs them as their inputs change.
+
+    This returns only if interrupted (eg by a KeyboardInterrupt). Errors
+    reading changed inputs are reported, and the inputs are then reloaded on
+    the next change.
+    """
+    self.load()
+    self.report(self.run())
+    needs_reload = False
+    while True:
+      print('\nwatching {} files for changes (press Ctrl-C to stop)'
+            .format(len(self.status)))
+      changed = []
+      while not changed:
+        time.sleep(interval)
+        changed = self.poll()
+      print('changed: {}'.format(', '.join(sorted(changed))))
+      tracing.TIMINGS.reset()  # so that they report the latest run only
+      try:
+        changed_keys = None if needs_reload else self.update(changed)
+        if changed_keys is None:
+          self.load()
+        self.report(self.run(changed_keys))
+        needs_reload = False
+      except Exception as e:
+        logging.error(f'error updating inputs: {repr(e)}')
+        print(f'\nERROR: could not run tests because {e}')
+        needs_reload = True
+
+  def report(self, manager):
+    if manager is None:
+      print('no test cases affected')
+      return
+    if self.verbosity != summary.Detail.NONE or not self.passed:
+      print()
+      print('Tests passed' if self.passed else 'Tests failed')
+
+
+class Visitor(runner.Visitor):
+  """A runner.Visitor that records the artifacts each test case looks up.
+
+  The lookups are recorded for environments that support it (see
+  `tag.ManifestEnvironment.lookups`), in a dict mapping the case_id() of each
+  case run to the set of artifact keys it looked up.
+  """
+
+  def __init__(self, fail_fast, lookups):
+    super().__init__(fail_fast)
+    self.lookups = lookups
+
+  def visit_testcase(self, idx: int, tcase: testplan.TestCase, do_case: bool,
+                     environment: testplan.Environment, suite: testplan.Suite):
+    config = environment.config
+    recording = hasattr(config, 'lookups')
+    if recording:
+      config.lookups = set()
+    try:
+      super().visit_testcase(idx, tcase, do_case, environment, suite)
+    finally:
+      if tcase.attempted:
+        self.lookups[case_id(environment, suite, tcase)] = (
+            config.lookups if recording else None)
+      if recording:
+        config.lookups = None
@@ -30,7 +30,7 @@ setup(
     author='Victor Chudnovsky',
     author_email='vchudnov+sampletester@google.com',
     url='https://github.com/googleapis/sample-tester',
-    packages=find_packages(exclude=['docs', 'tests']),
+    packages=find_packages(exclude=['benchmarks', 'docs', 'tests']),
     description=('Tool for testing semantically equivalent samples in multiple '
                  'languages and environments'),
     long_description=README,
@@ -43,6 +43,7 @@ setup(
     install_requires=(
         'click',
         'dataclasses;python_version<"3.7"',
+        'importlib_metadata;python_version<"3.8"',
         'pyyaml',
     ),
 
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+from textwrap import dedent
+
+from sampletester import benchmark
+from sampletester import parallel
+from sampletester import runner
+from tests import helpers
+
+MANIFEST = dedent("""\
+    type: manifest/samples
+    schema_version: 3
+    samples:
+    - environment: shell
+      sample: nap
+      invocation: 'sleep 0.05 && echo rested'
+      cacheable: 'true'
+    - environment: shell
+      sample: fail
+      invocation: 'false'
+    """)
+
+TESTPLAN = dedent("""\
+    type: test/samples
+    schema_version: 1
+    test:
+      suites:
+      - name: naps
+        cases:
+        - name: twice
+          spec:
+          - call:
+              sample: nap
+          - call:
+              sample: nap
+        - name: failing
+          spec:
+          - call:
+              sample: nap
+          - call:
+              sample: fail
+    """)
+
+
+class TestStats(unittest.TestCase):
+
+  def test_percentile(self):
+    values = [1, 2, 3, 4, 5]
+    self.assertEqual(3, benchmark.percentile(values, 50))
+    self.assertAlmostEqual(4.6, benchmark.percentile(values, 90))
+    self.assertEqual(5, benchmark.percentile(values, 100))
+    self.assertEqual(7, benchmark.percentile([7], 99))
+
+  def test_summarize(self):
+    self.assertIsNone(benchmark.summarize([]))
+    stats = benchmark.summarize([4, 2, 6])
+    self.assertEqual((3, 4, 2, 4), stats[:4])
+    self.assertEqual(0.0, benchmark.summarize([1]).stddev)
+
+
+class TestRepeat(unittest.TestCase):
+
+  def manager(self):
+    return helpers.new_manager(('samples.manifest.yaml', MANIFEST),
+                               ('naps.yaml', TESTPLAN))
+
+  def check(self, manager):
+    twice, failing = manager.environments[0].suites[0].cases
+    # the calls of the warmup run are not timed, nor reused across runs
+    self.assertEqual(6, len(twice.call_usage))
+    self.assertTrue(all(usage.wall >= 0.05 for usage in twice.call_usage))
+    # the runs of a failing test case stop at the first failure
+    self.assertEqual(0, len(failing.call_usage))
+    self.assertEqual(1, failing.num_errors + failing.num_failures)
+
+    report = manager.accept(benchmark.Visitor(3, 1))
+    environment, = report['environments']
+    self.assertEqual('shell', environment['environment'])
+    self.assertEqual(6, environment['wall']['count'])
+    self.assertEqual(['twice'], [case['case'] for case in environment['cases']])
+    self.assertGreaterEqual(environment['wall']['p50'], 0.05)
+    self.assertIn('Test case "twice" of suite "naps": 6 calls',
+                  benchmark.describe(report))
+
+  def test_sequential(self):
+    manager = self.manager()
+    manager.accept(runner.Visitor(repeat=3, warmup=1))
+    self.check(manager)
+
+  def test_parallel(self):
+    manager = self.manager()
+    with parallel.Scheduler(manager, 2, repeat=3, warmup=1) as scheduler:
+      manager.accept(runner.Visitor(scheduler=scheduler))
+    self.check(manager)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+from benchmarks import micro
+
+
+class TestStatistics(unittest.TestCase):
+
+  def test_percentile(self):
+    values = [1, 2, 3, 4, 5]
+    self.assertEqual(3, micro.percentile(values, 0.5))
+    self.assertEqual(1, micro.percentile(values, 0))
+    self.assertEqual(5, micro.percentile(values, 1))
+    self.assertAlmostEqual(4.6, micro.percentile(values, 0.9))
+    self.assertEqual(0, micro.percentile([], 0.5))
+
+  def test_summarize(self):
+    stats = micro.summarize([3, 1, 2])
+    self.assertEqual(3, stats['repeats'])
+    self.assertEqual(1, stats['min'])
+    self.assertEqual(3, stats['max'])
+    self.assertEqual(2, stats['p50'])
+    self.assertEqual(2, stats['mean'])
+    self.assertEqual(1, stats['stddev'])
+
+
+class TestHarness(unittest.TestCase):
+
+  def test_every_benchmark_runs(self):
+    results = micro.run(warmup=0, repeats=2, min_batch_seconds=0, sizes=[2])
+    self.assertEqual({micro.result_key(bench.name, 2)
+                      for bench in micro.BENCHMARKS},
+                     set(results))
+    for stats in results.values():
+      self.assertEqual(2, stats['repeats'])
+      self.assertEqual(1, stats['calls_per_repeat'])
+
+  def test_filter(self):
+    results = micro.run(r'^tag\.', warmup=0, repeats=1, min_batch_seconds=0,
+                        sizes=[1])
+    self.assertEqual(['tag.insert_into[1]'], list(results))
+
+  def test_compare(self):
+    baseline = {'a[1]': {'p50': 1.0}, 'b[1]': {'p50': 1.0}}
+    current = {'a[1]': {'p50': 1.05}, 'b[1]': {'p50': 1.5},
+               'c[1]': {'p50': 9.0}}
+    regressions = micro.compare(baseline, current, tolerance=0.1)
+    self.assertEqual(1, len(regressions))
+    self.assertTrue(regressions[0].startswith('b[1]'))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import tempfile
+import unittest
+
+from benchmarks import scale
+from benchmarks import synthetic
+from sampletester import inputs
+from sampletester import sample_manifest
+from sampletester import testplan
+
+
+class TestSynthetic(unittest.TestCase):
+
+  def test_generated_inputs_index(self):
+    for version in [1, 2, 3]:
+      scenario = synthetic.Scenario(version=version, artifacts=7, cases=3,
+                                    environments=2, sources=3)
+      with tempfile.TemporaryDirectory() as tmpdir:
+        files = synthetic.generate(tmpdir, scenario)
+        self.assertEqual(2 * 3 + 1, len(files))
+
+        indexed_docs = inputs.create_indexed_docs(*files)
+        manifest = sample_manifest.Manifest('environment', 'sample')
+        manifest.from_docs(indexed_docs)
+        manifest.index()
+        self.assertEqual(2 * 7, manifest.num_elements,
+                         f'version {version}')
+        self.assertEqual([synthetic.environment_name(0),
+                          synthetic.environment_name(1)],
+                         sorted(manifest.get_keys()))
+
+        artifact = manifest.get_one(synthetic.environment_name(1),
+                                    synthetic.sample_id(6))
+        self.assertEqual(os.path.join(tmpdir, synthetic.SAMPLE_NAME),
+                         artifact['path'])
+        if version > 1:
+          self.assertEqual('sh {} @args'.format(artifact['path']),
+                           artifact['invocation'])
+
+        suites = testplan.suites_from(indexed_docs)
+        self.assertEqual(['case_000000', 'case_000001', 'case_000002'],
+                         [case.name() for case in suites[0].cases])
+
+  def test_split(self):
+    self.assertEqual([range(0, 3), range(3, 7)], synthetic.split(7, 2))
+    self.assertEqual([range(0, 1), range(1, 2)], synthetic.split(2, 5))
+    self.assertEqual([range(0, 0)], synthetic.split(0, 3))
+
+
+class TestScale(unittest.TestCase):
+
+  def test_analyze_trace(self):
+    events = [
+        {'ph': 'M', 'name': 'thread_name', 'tid': 1},
+        {'ph': 'X', 'cat': 'phase', 'name': 'run', 'ts': 0, 'dur': 10e6, 'tid': 1},
+        {'ph': 'X', 'cat': 'case', 'name': 'a', 'ts': 1e6, 'dur': 4e6, 'tid': 1},
+        {'ph': 'X', 'cat': 'call', 'name': 'x', 'ts': 2e6, 'dur': 1e6, 'tid': 1},
+        {'ph': 'X', 'cat': 'call', 'name': 'y', 'ts': 3e6, 'dur': 1e6, 'tid': 1},
+        {'ph': 'X', 'cat': 'case', 'name': 'b', 'ts': 5e6, 'dur': 2e6, 'tid': 1},
+        {'ph': 'X', 'cat': 'call', 'name': 'z', 'ts': 5e6, 'dur': 2e6, 'tid': 2},
+    ]
+    metrics = scale.analyze_trace(events)
+    self.assertEqual({'run': 10}, metrics['phases'])
+    self.assertEqual(2, metrics['cases'])
+    self.assertAlmostEqual(4, metrics['case_overhead_seconds'])
+    self.assertAlmostEqual(2, metrics['mean_case_overhead_seconds'])
+
+  def test_compare(self):
+    baseline = {'s': {'phases': {'run': 1.0, 'report': 0.001},
+                      'wall_seconds': 2.0, 'peak_rss_kb': 20000}}
+    current = {'s': {'phases': {'run': 1.5, 'report': 0.005},
+                     'wall_seconds': 2.1, 'peak_rss_kb': 21000},
+               'new': {'wall_seconds': 100}}
+    regressions = scale.compare(baseline, current, tolerance=0.2)
+    self.assertEqual(1, len(regressions))
+    self.assertIn('phase:run', regressions[0])
+    self.assertEqual([], scale.compare(baseline, current, tolerance=0.6))
+
+
+if __name__ == '__main__':
+  unittest.main()
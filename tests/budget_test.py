@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import io
+import unittest
+from textwrap import dedent
+
+from sampletester import budget
+from sampletester import caserunner
+from sampletester import runner
+from sampletester import summary
+from sampletester import testplan
+from sampletester import xunit
+from tests import helpers
+
+MANIFEST = dedent("""\
+    type: manifest/samples
+    schema_version: 3
+    samples:
+    - environment: shell
+      sample: nap
+      invocation: 'sleep 0.1 && echo rested'
+    - environment: shell
+      sample: budgeted_nap
+      invocation: 'sleep 0.1 && echo rested'
+      max_duration: 50ms
+    - environment: shell
+      sample: hog
+      invocation: 'python3 -c "b = bytearray(64 << 20)"'
+    """)
+
+TESTPLAN = dedent("""\
+    type: test/samples
+    schema_version: 1
+    test:
+      suites:
+      - name: budgets
+        cases:
+        - name: within budget
+          spec:
+          - call:
+              sample: nap
+          - assert_duration_below: 2s
+          - assert_cpu_below: {call: 1s}
+          - assert_duration_below: {case: 5s}
+          - code: assert_max_rss_below('1G', case=True)
+        - name: slow call
+          spec:
+          - call:
+              sample: nap
+          - assert_duration_below: {call: 50ms, message: naps are short}
+          - log: [not reached]
+        - name: slow case
+          spec:
+          - call:
+              sample: nap
+          - call:
+              sample: nap
+          - assert_duration_below: 190ms
+          - assert_duration_below: {case: 190ms}
+        - name: manifest budget
+          spec:
+          - call:
+              sample: budgeted_nap
+        - name: memory
+          spec:
+          - call:
+              sample: hog
+          - assert_max_rss_below: 32M
+        - name: malformed
+          spec:
+          - call:
+              sample: nap
+          - assert_cpu_below: soon
+    """)
+
+
+class TestParse(unittest.TestCase):
+
+  def test_seconds(self):
+    self.assertEqual(2.0, budget.parse_seconds(2))
+    self.assertEqual(1.5, budget.parse_seconds('1.5s'))
+    self.assertEqual(0.25, budget.parse_seconds('250ms'))
+    for value in ['0', '-1s', '2m', 'soon', True]:
+      with self.assertRaises(ValueError):
+        budget.parse_seconds(value)
+
+  def test_bytes(self):
+    self.assertEqual(1000, budget.parse_bytes(1000))
+    self.assertEqual(64 << 10, budget.parse_bytes('64K'))
+    self.assertEqual(512 << 20, budget.parse_bytes('512 MiB'))
+    self.assertEqual(2 << 30, budget.parse_bytes('2GB'))
+    with self.assertRaises(ValueError):
+      budget.parse_bytes('2ms')
+
+
+class TestBudgets(unittest.TestCase):
+
+  @classmethod
+  def setUpClass(cls):
+    cls.manager = helpers.new_manager(('samples.manifest.yaml', MANIFEST),
+                                      ('budgets.yaml', TESTPLAN))
+    cls.summary = summary.SummaryVisitor(summary.Detail.BRIEF, False,
+                                         progress_out=io.StringIO())
+    cls.manager.accept(testplan.MultiVisitor(runner.Visitor(), cls.summary))
+    cls.cases = {case.name(): case
+                 for case in cls.manager.environments[0].suites[0].cases}
+
+  def failures(self, name):
+    return self.cases[name].runner.get_failures()
+
+  def test_within_budget(self):
+    self.assertTrue(self.cases['within budget'].success())
+    usage = self.cases['within budget'].runner.last_call_usage
+    self.assertGreaterEqual(usage.wall, 0.1)
+    self.assertGreater(usage.max_rss, 0)
+
+  def test_over_budget(self):
+    (status, message), = self.failures('slow call')
+    self.assertEqual(caserunner.BUDGET_FAILURE, status)
+    self.assertRegex(message, r'^naps are short: duration of the last call '
+                     r'was \d+ms, over the budget of 50ms$')
+    self.assertNotIn('not reached', self.cases['slow call'].runner.output)
+
+    (_, message), = self.failures('slow case')
+    self.assertIn('duration of the test case', message)
+
+    (_, message), = self.failures('manifest budget')
+    self.assertIn('the budget of "budgeted_nap": duration', message)
+
+    (_, message), = self.failures('memory')
+    self.assertIn('peak memory of the last call', message)
+    self.assertIn('over the budget of 32.0M', message)
+
+  def test_malformed_budget(self):
+    runner = self.cases['malformed'].runner
+    self.assertEqual([], runner.failures)
+    self.assertIn('invalid budget', runner.get_errors()[0][1])
+
+  def test_reports(self):
+    output = self.summary.output()
+    self.assertIn('OVER BUDGET: Test case: "slow call"', output)
+    self.assertIn('FAILED: Test case: "malformed"', output)
+    self.assertIn('<failure type="exceeded budget">',
+                  self.manager.accept(xunit.Visitor()))
+
+
+if __name__ == '__main__':
+  unittest.main()
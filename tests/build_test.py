@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import unittest
+
+from sampletester import build
+from sampletester import runner
+from sampletester import testplan
+from tests import helpers
+
+MANIFEST = """
+type: manifest/samples
+schema_version: 3
+base: &compiled
+  environment: compiled
+  chdir: {directory}
+  build: 'echo compiled >> builds.log && cat hello.src > hello.out'
+  build_inputs: ['*.src']
+  build_outputs: hello.out
+samples:
+- <<: *compiled
+  sample: hello
+  invocation: 'cat hello.out'
+- <<: *compiled
+  sample: hello again
+  invocation: 'cat hello.out'
+- environment: compiled
+  sample: unused
+  chdir: {directory}
+  build: 'echo unused >> builds.log'
+  invocation: 'true'
+- environment: compiled
+  sample: broken
+  chdir: {directory}
+  build: 'echo oops && false'
+  invocation: 'true'
+"""
+
+TESTPLAN = """
+type: test/samples
+schema_version: 1
+test:
+  suites:
+  - name: greetings
+    cases:
+    - name: hello
+      spec:
+      - call:
+          sample: hello
+      - assert_contains:
+        - literal: hi there
+    - name: hello again
+      spec:
+      - call:
+          sample: hello again
+    - name: broken
+      spec:
+      - call:
+          sample: broken
+"""
+
+
+class TestBuild(helpers.DirectoryTestCase):
+
+  def setUp(self):
+    super().setUp()
+    self.write('samples.manifest.yaml',
+               MANIFEST.format(directory=self.directory))
+    self.write('greetings.yaml', TESTPLAN)
+    self.write('hello.src', 'hi there')
+    self.load_inputs()
+    self.cache_path = os.path.join(self.directory, 'builds.json')
+
+  def builds(self):
+    """Returns the lines of the log of builds run."""
+    try:
+      with open(os.path.join(self.directory, 'builds.log')) as stream:
+        return stream.read().split()
+    except FileNotFoundError:
+      return []
+
+  def manager(self, case_filter='hello'):
+    manager = testplan.Manager(self.registry, self.suites)
+    manager.keep_cases(lambda environment, suite, case:
+                       case.name().startswith(case_filter))
+    return manager
+
+  def test_steps_for(self):
+    steps = build.steps_for(self.manager())
+    self.assertEqual(1, len(steps))
+    self.assertEqual(('*.src',), steps[0].inputs)
+    self.assertEqual(('hello.out',), steps[0].outputs)
+    self.assertEqual(self.directory, steps[0].chdir)
+
+    manager = self.manager()
+    manager.environments[0].suites[0].cases[0].spec().append(
+        {'code': 'call("unused")'})
+    self.assertEqual(3, len(build.steps_for(manager)))
+
+  def test_inputs(self):
+    config = self.manager().environments[0].config
+    source = os.path.join(self.directory, 'hello.src')
+    self.assertIn(source, config.get_dependencies()[('compiled', 'hello')])
+    self.assertEqual({('compiled', 'hello'), ('compiled', 'hello again')},
+                     config.get_files()[source])
+    with self.assertRaisesRegex(ValueError, 'build_outputs'):
+      config.build_step({'build': 'make', 'build_outputs': {'hello': 1}})
+
+  def test_build_and_run(self):
+    manager = self.manager()
+    results = build.build_all(build.steps_for(manager),
+                              build.Cache(self.cache_path), jobs=2)
+    self.assertEqual([(True, None)],
+                     [(result.built, result.error) for result in results])
+    self.assertEqual(['compiled'], self.builds())
+    self.assertTrue(manager.accept(runner.Visitor()))
+
+  def test_cache(self):
+    def build_hello():
+      results = build.build_all(build.steps_for(self.manager()),
+                                build.Cache(self.cache_path))
+      return [result.built for result in results]
+
+    self.assertEqual([True], build_hello())
+    self.assertEqual([False], build_hello())
+    self.write('hello.src', 'hello there')
+    self.assertEqual([True], build_hello())
+    self.assertEqual([False], build_hello())
+    os.remove(os.path.join(self.directory, 'hello.out'))
+    self.assertEqual([True], build_hello())
+    self.assertEqual(['compiled'] * 3, self.builds())
+
+  def test_no_inputs(self):
+    step = build.Step('echo unused >> builds.log', self.directory, (), ())
+    cache = build.Cache(self.cache_path)
+    for _ in range(2):
+      build.build_all([step], cache)
+    self.assertEqual(['unused', 'unused'], self.builds())
+
+  def test_failure(self):
+    results = build.build_all(build.steps_for(self.manager('broken')))
+    self.assertIsNotNone(results[0].error)
+    report = build.describe([results[0]])
+    self.assertIn('1 build step failed', report)
+    self.assertIn('    | oops', report)
+
+
+if __name__ == '__main__':
+  unittest.main()
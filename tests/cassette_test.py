@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+import unittest
+
+from sampletester import cassette
+from sampletester import parallel
+from sampletester import runner
+from sampletester import testplan
+from tests import helpers
+
+MANIFEST = """
+type: manifest/samples
+schema_version: 3
+samples:
+- environment: shell
+  sample: count
+  chdir: {directory}
+  invocation: 'echo x >> counter && wc -l < counter'
+- environment: shell
+  sample: fail
+  invocation: 'echo "é failed" && false'
+"""
+
+TESTPLAN = """
+type: test/samples
+schema_version: 1
+test:
+  suites:
+  - name: counting
+    cases:
+    - name: once
+      spec:
+      - call:
+          sample: count
+      - assert_contains:
+        - literal: '1'
+    - name: twice
+      spec:
+      - call:
+          sample: count
+      - call:
+          sample: count
+      - assert_contains:
+        - literal: '3'
+      - call_may_fail:
+          sample: fail
+"""
+
+
+class TestCassette(helpers.DirectoryTestCase):
+
+  def setUp(self):
+    super().setUp()
+    self.write('samples.manifest.yaml',
+               MANIFEST.format(directory=self.directory))
+    self.write('counting.yaml', TESTPLAN)
+    self.load_inputs()
+    self.path = os.path.join(self.directory, 'cassette')
+
+  def run_cases(self, calls, jobs=1):
+    manager = testplan.Manager(self.registry, self.suites)
+    if jobs > 1:
+      with parallel.Scheduler(manager, jobs, calls=calls) as scheduler:
+        success = manager.accept(runner.Visitor(scheduler=scheduler))
+    else:
+      success = manager.accept(runner.Visitor(calls=calls))
+    return success, manager.environments[0].suites[0].cases
+
+  def test_record_and_replay(self):
+    with cassette.Cassette(self.path) as calls:
+      success, _ = self.run_cases(calls)
+    self.assertTrue(success)
+    with open(os.path.join(self.path, cassette.INDEX_FILE)) as stream:
+      self.assertEqual(4, len(json.load(stream)))
+
+    # the counter would be at 4 and up if the calls were run again
+    for jobs in [1, 2]:
+      with cassette.Cassette(self.path, replay=True) as calls:
+        success, cases = self.run_cases(calls, jobs)
+        self.assertTrue(success)
+        self.assertEqual(0, calls.misses)
+      self.assertIn('# Replaying:', cases[1].runner.output)
+      self.assertEqual(1, cases[1].runner.last_return_code)
+      self.assertIn('é failed', cases[1].runner.last_call_output)
+    with open(os.path.join(self.directory, 'counter')) as stream:
+      self.assertEqual(3, len(stream.readlines()))
+
+  def test_missing_call(self):
+    with cassette.Cassette(self.path) as calls:
+      self.run_cases(calls)
+    self.write('counting.yaml', TESTPLAN.replace('twice', 'thrice'))
+    self.load_inputs()
+    with cassette.Cassette(self.path, replay=True) as calls:
+      success, cases = self.run_cases(calls)
+      self.assertEqual(1, calls.misses)
+    self.assertFalse(success)
+    self.assertEqual((0, 1), (cases[0].num_errors, cases[1].num_errors))
+    self.assertIn('call not recorded', cases[1].runner.errors[0][1])
+
+  def test_call_key(self):
+    key = cassette.call_key('shell', 'suite', 'case', 0, 'ls', None)
+    self.assertEqual(key,
+                     cassette.call_key('shell', 'suite', 'case', 0, 'ls', None))
+    self.assertNotEqual(key,
+                        cassette.call_key('shell', 'suite', 'case', 1, 'ls',
+                                          None))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+from textwrap import dedent
+
+from sampletester import check
+from sampletester import environment_registry
+from sampletester import parser
+from sampletester import sample_manifest
+from sampletester import testplan
+
+MANIFEST = dedent("""\
+    type: manifest/samples
+    schema_version: 3
+    samples:
+    - environment: shell
+      sample: hello
+      path: hello.sh
+    - environment: shell
+      sample: twice
+      path: twice.sh
+    - environment: shell
+      sample: twice
+      path: again.sh
+    """)
+
+TESTPLAN = dedent("""\
+    type: test/samples
+    schema_version: 1
+    test:
+      suites:
+      - name: greetings
+        setup:
+        - log:
+          - 'greeting with {hello:path}'
+        cases:
+        - name: fine
+          spec:
+          - call:
+              sample: hello
+        - name: broken
+          spec:
+          - call:
+              sample: missing
+          - call_may_fail:
+              sample: twice
+          - log:
+            - 'using {absent:path}'
+          - code: |
+              call('ignored')
+        - name: also broken
+          spec:
+          - call:
+              sample: missing
+        - name: filtered out
+          spec:
+          - call:
+              sample: missing
+    """)
+
+
+class TestCheck(unittest.TestCase):
+
+  def manager(self):
+    indexed_docs = parser.IndexedDocs()
+    indexed_docs.from_strings(('samples.manifest.yaml', MANIFEST),
+                              ('greetings.yaml', TESTPLAN))
+    registry = environment_registry.new('tag:sample', indexed_docs)
+    return testplan.Manager(registry,
+                            testplan.suites_from(indexed_docs,
+                                                 case_filter='broken|fine'))
+
+  def test_check(self):
+    problems = check.check(self.manager())
+    self.assertEqual([('broken', 'call', 'missing'),
+                      ('broken', 'call', 'twice'),
+                      ('broken', 'symbol', 'absent:path'),
+                      ('also broken', 'call', 'missing')],
+                     [(problem.case, problem.kind, problem.name)
+                      for problem in problems])
+    self.assertIsInstance(problems[1].error,
+                          sample_manifest.ItemNotUniqueError)
+    self.assertIn('not defined', str(problems[0].error))
+
+    report = check.describe(problems)
+    self.assertIn('found 4 problems', report)
+    self.assertIn('shell: suite "greetings": case "broken": call "missing"',
+                  report)
+
+  def test_no_problems(self):
+    manager = self.manager()
+    manager.keep_cases(lambda environment, suite, case: case.name() == 'fine')
+    self.assertEqual([], check.check(manager))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import tempfile
+import unittest
+
+from sampletester import compiled_manifest
+from sampletester import inputs
+from sampletester import sample_manifest
+from sampletester.convention import tag
+
+MANIFEST = """
+type: manifest/samples
+schema_version: 3
+base: &common
+  environment: python
+  bin: python3
+  invocation: '{bin} {path} @args'
+samples:
+- <<: *common
+  sample: hello
+  path: 'hello.py'
+- <<: *common
+  sample: goodbye
+  path: 'goodbye.py'
+  retries: '3'
+- <<: *common
+  environment: java
+  sample: hello
+  path: 'Hello.java'
+- <<: *common
+  environment: java
+  sample: hello
+  path: 'HelloAgain.java'
+"""
+
+
+class TestCompiledManifest(unittest.TestCase):
+
+  def setUp(self):
+    self.tmpdir = tempfile.TemporaryDirectory()
+    self.manifest_path = os.path.join(self.tmpdir.name,
+                                      'samples.manifest.yaml')
+    with open(self.manifest_path, 'w') as stream:
+      stream.write(MANIFEST)
+    self.compiled_path = os.path.join(self.tmpdir.name,
+                                      'samples' + compiled_manifest.EXTENSION)
+
+    self.expected = self.new_manifest(self.manifest_path)
+    self.assertEqual(4, self.expected.compile(self.compiled_path))
+
+  def tearDown(self):
+    self.tmpdir.cleanup()
+
+  def new_manifest(self, *paths, convention='tag:sample:invocation,chdir'):
+    manifest = sample_manifest.Manifest('environment', 'sample')
+    manifest.convention = convention
+    manifest.from_docs(inputs.create_indexed_docs(*paths))
+    manifest.index()
+    return manifest
+
+  def test_lookups_match_manifest(self):
+    manifest = self.new_manifest(self.compiled_path)
+    self.assertIsNotNone(manifest.compiled)
+    self.assertEqual(4, manifest.num_elements)
+    self.assertEqual(list(self.expected.get_all_elements()),
+                     list(manifest.get_all_elements()))
+    self.assertEqual(['python', 'java'], manifest.get_keys())
+    self.assertEqual(['hello', 'goodbye'], manifest.get_keys('python'))
+    self.assertEqual([], manifest.get_keys('ruby'))
+    self.assertEqual([], manifest.get_keys('python', 'hello'))
+
+    goodbye = manifest.get_one('python', 'goodbye')
+    self.assertEqual(self.expected.get_one('python', 'goodbye'), goodbye)
+    self.assertEqual('3', goodbye['retries'])
+    self.assertEqual('python3 hello.py @args',
+                     manifest.get_one('python', 'hello')['invocation'])
+    self.assertEqual(self.manifest_path,
+                     goodbye[sample_manifest.IMPLICIT_TAG_SOURCE])
+
+    self.assertIsNone(manifest.get('python', 'nosuchsample'))
+    self.assertIsNone(manifest.get('python'))
+    self.assertEqual([], manifest.get('python', 'hello', path='other.py'))
+    self.assertEqual(2, len(manifest.get('java', 'hello')))
+    self.assertRaises(sample_manifest.ItemNotUniqueError,
+                      manifest.get_one, 'java', 'hello')
+    self.assertEqual('HelloAgain.java',
+                     manifest.get_one('java', 'hello',
+                                      path='HelloAgain.java')['path'])
+
+  def test_indices_must_match(self):
+    manifest = sample_manifest.Manifest('environment', 'path')
+    manifest.from_docs(inputs.create_indexed_docs(self.compiled_path))
+    self.assertRaises(sample_manifest.ReadManifestError, manifest.index)
+
+  def test_convention_must_match(self):
+    compiled = compiled_manifest.CompiledManifest(self.compiled_path)
+    self.assertEqual('tag:sample:invocation,chdir', compiled.convention)
+    compiled.close()
+    self.assertEqual(compiled.convention,
+                     tag.convention_spec(['sample'], None))
+    with self.assertRaisesRegex(sample_manifest.ReadManifestError,
+                                'compiled for convention'):
+      self.new_manifest(self.compiled_path,
+                        convention='tag:sample:command,chdir')
+
+  def test_cannot_mix_with_manifests(self):
+    manifest = sample_manifest.Manifest('environment', 'sample')
+    manifest.from_docs(inputs.create_indexed_docs(self.compiled_path,
+                                                  self.manifest_path))
+    self.assertRaises(sample_manifest.ReadManifestError, manifest.index)
+
+  def test_stale(self):
+    stat = os.stat(self.manifest_path)
+    os.utime(self.manifest_path, ns=(stat.st_atime_ns,
+                                     stat.st_mtime_ns + 10**9))
+    compiled = compiled_manifest.CompiledManifest(self.compiled_path)
+    self.assertEqual([self.manifest_path], compiled.stale_sources())
+    compiled.close()
+    self.assertRaises(sample_manifest.ReadManifestError,
+                      self.new_manifest, self.compiled_path)
+
+  def test_not_compiled(self):
+    self.assertTrue(compiled_manifest.is_compiled(self.compiled_path))
+    self.assertFalse(compiled_manifest.is_compiled(self.manifest_path))
+    self.assertRaises(compiled_manifest.CompiledManifestError,
+                      compiled_manifest.CompiledManifest, self.manifest_path)
+
+  def test_encoding(self):
+    for value in ['', 'tea', 3, 2.5, True, None, ['a', 1], {'b': [2]}]:
+      self.assertEqual(value,
+                       compiled_manifest.decode(
+                           compiled_manifest.encode(value)))
+    self.assertNotEqual(compiled_manifest.encode('3'),
+                        compiled_manifest.encode(3))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import subprocess
+import sys
+import tempfile
+import textwrap
+import unittest
+
+from sampletester import convention
+
+_ABS_FILE = os.path.abspath(__file__)
+_REPO_DIR = os.path.dirname(os.path.dirname(os.path.dirname(_ABS_FILE)))
+
+
+def import_times(module: str, path: str = _REPO_DIR):
+  """Returns the cumulative `python -X importtime` of what `module` imports.
+
+  The result maps the name of each module imported, directly or not, to the
+  microseconds it took, including its own imports.
+  """
+  env = dict(os.environ, PYTHONPATH=path)
+  process = subprocess.run(
+      [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+      stderr=subprocess.PIPE, universal_newlines=True, env=env, check=True)
+  times = {}
+  for line in process.stderr.splitlines():
+    if not line.startswith('import time:') or 'cumulative' in line:
+      continue
+    _, cumulative, name = line[len('import time:'):].split('|')
+    times[name.strip()] = int(cumulative)
+  return times
+
+
+class TestConventions(unittest.TestCase):
+
+  def setUp(self):
+    self.creators = dict(convention.environment_creators)
+    self.loaded_entry_points = convention._loaded_entry_points
+
+  def tearDown(self):
+    convention.environment_creators.clear()
+    convention.environment_creators.update(self.creators)
+    convention._loaded_entry_points = self.loaded_entry_points
+
+  def test_cli_imports_no_conventions(self):
+    times = import_times('sampletester.cli')
+    self.assertIn('sampletester.convention', times)
+    imported = [name for name in times
+                if name.startswith('sampletester.convention.')]
+    self.assertEqual([], imported,
+                     'importing the CLI ({} us) imported conventions'
+                     .format(times.get('sampletester.cli')))
+
+  def test_get_creator(self):
+    from sampletester.convention import tag
+    self.assertIs(tag.test_environments, convention.get_creator('tag'))
+    self.assertIs(tag.test_environments, convention.environment_creators['tag'])
+    with self.assertRaisesRegex(ValueError, 'not implemented'):
+      convention.get_creator('nonexistent')
+
+  def test_broken_convention(self):
+    convention.register('broken', 'sampletester.convention.nonexistent')
+    with self.assertRaisesRegex(ValueError, 'could not load convention'):
+      convention.get_creator('broken')
+    # other conventions are unaffected
+    self.assertTrue(callable(convention.get_creator('tag')))
+
+  def test_entry_points(self):
+    with tempfile.TemporaryDirectory() as directory:
+      dist_info = os.path.join(directory, 'myconvention-1.0.dist-info')
+      os.mkdir(dist_info)
+      with open(os.path.join(dist_info, 'METADATA'), 'w') as metadata:
+        metadata.write('Metadata-Version: 2.1\nName: myconvention\n'
+                       'Version: 1.0\n')
+      with open(os.path.join(dist_info, 'entry_points.txt'), 'w') as points:
+        points.write(textwrap.dedent(f'''\
+            [{convention.ENTRY_POINT_GROUP}]
+            mine = sampletester.convention.tag:test_environments
+            tag = sampletester.convention.nonexistent
+            '''))
+      convention._loaded_entry_points = False
+      sys.path.insert(0, directory)
+      try:
+        self.assertIn('mine', convention.names())
+      finally:
+        sys.path.remove(directory)
+
+    from sampletester.convention import tag
+    self.assertIs(tag.test_environments, convention.get_creator('mine'))
+    # built-in conventions are not overridden
+    self.assertIs(tag.test_environments, convention.get_creator('tag'))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,96 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Fixtures shared by the tests."""
+
+import os
+import tempfile
+import threading
+import unittest
+
+from sampletester import environment_registry
+from sampletester import inputs
+from sampletester import parser
+from sampletester import testplan
+
+
+def new_manager(*documents, env_filter=None, convention='tag:sample'):
+  """Returns a testplan.Manager for the (name, YAML content) `documents`."""
+  indexed_docs = parser.IndexedDocs()
+  indexed_docs.from_strings(*documents)
+  registry = environment_registry.new(convention, indexed_docs)
+  return testplan.Manager(registry, testplan.suites_from(indexed_docs),
+                          env_filter)
+
+
+class DirectoryTestCase(unittest.TestCase):
+  """A TestCase writing its files to a temporary `directory`.
+
+  The directory is created anew for each test, and removed after it.
+  """
+
+  def setUp(self):
+    self.tmpdir = tempfile.TemporaryDirectory()
+    self.directory = self.tmpdir.name
+
+  def tearDown(self):
+    self.tmpdir.cleanup()
+
+  def write(self, name, content):
+    """Writes `content` to the file `name` in `directory`.
+
+    A file that is rewritten is given a later modification time, so that the
+    change is seen even on file systems with coarse times.
+
+    Returns:
+      the path of the file
+    """
+    path = os.path.join(self.directory, name)
+    try:
+      mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+      mtime = None
+    with open(path, 'w') as stream:
+      stream.write(content)
+    if mtime is not None:
+      os.utime(path, ns=(mtime + 10**9, mtime + 10**9))
+    return path
+
+  def load_inputs(self, convention='tag:sample'):
+    """Sets `registry` and `suites` from the files in `directory`."""
+    indexed_docs = inputs.index_docs(self.directory)
+    self.registry = environment_registry.new(convention, indexed_docs)
+    self.suites = testplan.suites_from(indexed_docs)
+
+
+class FakeClock:
+  """A clock that advances by `step` each time it is read, and when slept on.
+
+  It may be read from several threads.
+  """
+
+  def __init__(self, step=0.0):
+    self.now = 0.0
+    self.step = step
+    self.lock = threading.Lock()
+
+  def __call__(self):
+    with self.lock:
+      now = self.now
+      self.now += self.step
+      return now
+
+  def sleep(self, seconds):
+    with self.lock:
+      self.now += seconds
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import datetime
+import os
+import tempfile
+import unittest
+from textwrap import dedent
+
+from sampletester import environment_registry
+from sampletester import history
+from sampletester import parser
+from sampletester import testenv
+from sampletester import testplan
+
+TESTPLAN = dedent("""\
+    type: test/samples
+    schema_version: 1
+    test:
+      suites:
+      - name: greetings
+        cases:
+        - name: hello
+        - name: goodbye
+        - name: new
+    """)
+
+
+class TestHistory(unittest.TestCase):
+
+  def setUp(self):
+    self.tmpdir = tempfile.TemporaryDirectory()
+    self.path = os.path.join(self.tmpdir.name, 'history.sqlite')
+    indexed_docs = parser.IndexedDocs()
+    indexed_docs.from_strings(('greetings.yaml', TESTPLAN))
+    self.suites = testplan.suites_from(indexed_docs)
+    self.registry = environment_registry.Registry()
+    self.registry.add(testenv.Base('shell'))
+
+  def tearDown(self):
+    self.tmpdir.cleanup()
+
+  def run_cases(self, seconds):
+    """Returns a Manager whose cases ran for the given `seconds`, by name."""
+    manager = testplan.Manager(self.registry, self.suites)
+    start = datetime.datetime(2019, 1, 1)
+    for suite in manager.environments[0].suites:
+      for case in suite.cases:
+        if case.name() in seconds:
+          case.update_times(start,
+                            start + datetime.timedelta(
+                                seconds=seconds[case.name()]))
+          case.completed = True
+          case.num_failures = 1 if case.name() == 'goodbye' else 0
+    return manager
+
+  def estimates(self, durations):
+    manager = testplan.Manager(self.registry, self.suites)
+    environment = manager.environments[0]
+    suite = environment.suites[0]
+    return {case.name(): durations.estimate(environment, suite, case)
+            for case in suite.cases}
+
+  def test_record(self):
+    with history.History(self.path) as durations:
+      self.assertEqual({'hello': 0, 'goodbye': 0, 'new': 0},
+                       self.estimates(durations))
+      self.assertEqual(2, durations.record(self.run_cases({'hello': 10,
+                                                           'goodbye': 2})))
+
+    with history.History(self.path) as durations:
+      self.assertEqual({'hello': 10, 'goodbye': 2, 'new': 6},
+                       self.estimates(durations))
+      self.assertEqual((2, 1, history.OUTCOME_FAILED),
+                       durations.durations['shell', 'greetings', 'goodbye'])
+      durations.record(self.run_cases({'hello': 20}))
+
+    with history.History(self.path) as durations:
+      self.assertAlmostEqual(13, self.estimates(durations)['hello'])
+      self.assertEqual(2, durations.durations['shell', 'greetings',
+                                              'hello'][1])
+
+
+if __name__ == '__main__':
+  unittest.main()
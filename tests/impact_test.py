@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import subprocess
+import unittest
+
+from sampletester import impact
+from sampletester import testplan
+from tests import helpers
+
+MANIFEST = """
+type: manifest/samples
+schema_version: 3
+base: &common
+  environment: shell
+  chdir: {directory}
+samples:
+- <<: *common
+  sample: hello
+  path: hello.sh
+  invocation: 'sh {{path}} @args'
+- <<: *common
+  sample: goodbye
+  invocation: 'sh goodbye.sh common.sh @args'
+"""
+
+OTHER_MANIFEST = """
+type: manifest/samples
+schema_version: 3
+samples:
+- environment: shell
+  sample: other
+  path: other.sh
+  chdir: {directory}
+"""
+
+TESTPLAN = """
+type: test/samples
+schema_version: 1
+test:
+  suites:
+  - name: greetings
+    cases:
+    - name: hello
+      spec:
+      - call:
+          sample: hello
+      - assert_excludes:
+        - message: 'hello.sh {{hello:path}} reported an error'
+        - literal: '{{"error": 1}}'
+    - name: goodbye
+      spec:
+      - log:
+        - 'running {{goodbye:path}}'
+      - call_may_fail:
+          sample: goodbye
+    - name: other
+      spec:
+      - call:
+          sample: other
+    - name: code
+      spec:
+      - code: |
+          call('hello')
+"""
+
+
+class TestImpact(helpers.DirectoryTestCase):
+
+  def setUp(self):
+    super().setUp()
+    self.manifest = self.write('samples.manifest.yaml', MANIFEST)
+    self.other_manifest = self.write('other.manifest.yaml', OTHER_MANIFEST)
+    self.testplan = self.write('greetings.yaml', TESTPLAN)
+    self.load_inputs()
+
+  def write(self, name, content):
+    return super().write(name, content.format(directory=self.directory))
+
+  def path(self, name):
+    return os.path.join(self.directory, name)
+
+  def selected(self, *changed):
+    """Returns the names of the cases selected to run after `changed`."""
+    manager = testplan.Manager(self.registry, self.suites)
+    impact.select_affected(manager, changed)
+    return sorted(case.name()
+                  for environment in manager.environments
+                  if environment.selected()
+                  for suite in environment.suites
+                  if suite.selected()
+                  for case in suite.cases
+                  if case.selected())
+
+  def test_case_lookups(self):
+    manager = testplan.Manager(self.registry, self.suites)
+    environment = manager.environments[0]
+    suite = environment.suites[0]
+    lookups = {case.name(): impact.case_lookups(environment, suite, case)
+               for case in suite.cases}
+    self.assertEqual({'hello': {('shell', 'hello')},
+                      'goodbye': {('shell', 'goodbye')},
+                      'other': {('shell', 'other')},
+                      'code': None},
+                     lookups)
+
+  def test_select_affected(self):
+    self.assertEqual([], self.selected())
+    self.assertEqual(['code', 'hello'], self.selected(self.path('hello.sh')))
+    self.assertEqual(['code', 'goodbye'],
+                     self.selected(self.path('common.sh')))
+    self.assertEqual(['code', 'goodbye', 'hello'],
+                     self.selected(self.manifest))
+    self.assertEqual(['code', 'other'], self.selected(self.other_manifest))
+    self.assertEqual(['code', 'goodbye', 'hello', 'other'],
+                     self.selected(self.testplan))
+    self.assertEqual(['code'], self.selected(self.path('unrelated.txt')))
+
+  def test_missing_artifact(self):
+    self.write('other.manifest.yaml', OTHER_MANIFEST.replace('other', 'new'))
+    self.load_inputs()
+    self.assertEqual(['code', 'other'], self.selected(self.other_manifest))
+
+  def test_changed_files_since(self):
+    def git(*args):
+      subprocess.run(['git', '-c', 'user.name=test',
+                      '-c', 'user.email=test@example.com'] + list(args),
+                     cwd=self.directory, check=True,
+                     stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    cwd = os.getcwd()
+    try:
+      git('init', '-q')
+      git('add', '.')
+      git('commit', '-q', '-m', 'initial')
+      self.write('greetings.yaml', TESTPLAN + '\n')
+      os.chdir(self.directory)
+      self.assertEqual({os.path.realpath(self.testplan)},
+                       {os.path.realpath(path)
+                        for path in impact.changed_files_since('HEAD')})
+      with self.assertRaises(ValueError):
+        impact.changed_files_since('nonexistent')
+    finally:
+      os.chdir(cwd)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import tempfile
+import threading
+import unittest
+
+from sampletester import jobserver
+from sampletester import throttle
+
+
+class TestClient(unittest.TestCase):
+
+  def setUp(self):
+    self.read_fd, self.write_fd = os.pipe()
+    os.write(self.write_fd, b'ab')
+
+  def tearDown(self):
+    os.close(self.read_fd)
+    os.close(self.write_fd)
+
+  def test_from_makeflags(self):
+    self.assertIsNone(jobserver.Client.from_makeflags(None))
+    self.assertIsNone(jobserver.Client.from_makeflags('-j4 -k'))
+    for flag in ['--jobserver-auth', '--jobserver-fds']:
+      client = jobserver.Client.from_makeflags(
+          f'-kj3 {flag}={self.read_fd},{self.write_fd}')
+      self.assertEqual((self.read_fd, self.write_fd),
+                       (client.read_fd, client.write_fd))
+    with self.assertRaises(OSError):
+      jobserver.Client.from_makeflags('-j3 --jobserver-auth=nonsense')
+
+  def test_slots(self):
+    client = jobserver.Client(self.read_fd, self.write_fd)
+    tokens = [client.acquire() for _ in range(3)]
+    self.assertEqual([None, b'a', b'b'], tokens)
+
+    acquired = []
+    waiter = threading.Thread(target=lambda: acquired.append(client.acquire()))
+    waiter.start()
+    waiter.join(0.1)
+    self.assertEqual([], acquired)
+    client.release(tokens.pop())
+    waiter.join()
+    self.assertEqual([b'b'], acquired)
+
+    client.release(tokens.pop(0))
+    self.assertIsNone(client.acquire())
+
+  def test_implicit_slot_freed(self):
+    client = jobserver.Client(self.read_fd, self.write_fd)
+    tokens = [client.acquire() for _ in range(3)]
+
+    # waiting for a token from the pipe, but the implicit slot frees first
+    acquired = []
+    waiter = threading.Thread(target=lambda: acquired.append(client.acquire()))
+    waiter.start()
+    waiter.join(0.1)
+    self.assertEqual([], acquired)
+    client.release(tokens.pop(0))
+    waiter.join()
+    self.assertEqual([None], acquired)
+    self.assertFalse(client.implicit_slot_free)
+
+  def test_throttle(self):
+    client = jobserver.Client(self.read_fd, self.write_fd)
+    run_throttle = throttle.Throttle(jobserver=client)
+    tokens = [run_throttle.acquire('shell') for _ in range(2)]
+    self.assertFalse(client.implicit_slot_free)
+    for call_tokens in tokens:
+      run_throttle.release(call_tokens)
+    self.assertTrue(client.implicit_slot_free)
+    self.assertEqual(b'ab', bytes(sorted(os.read(self.read_fd, 2))))
+
+
+class TestSerial(unittest.TestCase):
+
+  def test_implicit_slot_only(self):
+    client = jobserver.Client()
+    token = client.acquire()
+    acquired = []
+    waiter = threading.Thread(target=lambda: acquired.append(client.acquire()))
+    waiter.start()
+    waiter.join(0.1)
+    self.assertEqual([], acquired)
+    client.release(token)
+    waiter.join()
+    self.assertEqual([None], acquired)
+
+
+class TestFifo(unittest.TestCase):
+
+  def test_fifo(self):
+    with tempfile.TemporaryDirectory() as directory:
+      path = os.path.join(directory, 'jobserver')
+      os.mkfifo(path)
+      client = jobserver.Client.from_makeflags(f'--jobserver-auth=fifo:{path}')
+      try:
+        os.write(client.write_fd, b'+')
+        self.assertIsNone(client.acquire())
+        self.assertEqual(b'+', client.acquire())
+      finally:
+        client.close()
+
+
+if __name__ == '__main__':
+  unittest.main()
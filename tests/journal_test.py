@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+import tempfile
+import unittest
+from textwrap import dedent
+
+from sampletester import environment_registry
+from sampletester import history
+from sampletester import journal
+from sampletester import parser
+from sampletester import testenv
+from sampletester import testplan
+
+TESTPLAN = dedent("""\
+    type: test/samples
+    schema_version: 1
+    test:
+      suites:
+      - name: greetings
+        cases:
+        - name: hello
+        - name: goodbye
+        - name: later
+    """)
+
+
+class TestJournal(unittest.TestCase):
+
+  def setUp(self):
+    self.tmpdir = tempfile.TemporaryDirectory()
+    self.path = os.path.join(self.tmpdir.name, 'journal')
+    indexed_docs = parser.IndexedDocs()
+    indexed_docs.from_strings(('greetings.yaml', TESTPLAN))
+    registry = environment_registry.Registry()
+    registry.add(testenv.Base('shell'))
+    self.manager = lambda: testplan.Manager(registry,
+                                            testplan.suites_from(indexed_docs))
+
+  def tearDown(self):
+    self.tmpdir.cleanup()
+
+  def test_resume(self):
+    manager = self.manager()
+    environment = manager.environments[0]
+    suite = environment.suites[0]
+    hello, goodbye, _ = suite.cases
+    goodbye.num_failures = 1
+    visitor = journal.Visitor(journal.Journal(self.path))
+    visit_suite, _ = visitor.visit_environment(environment, True)
+    visit_testcase = visit_suite(0, suite, True)
+    for idx, case in enumerate([hello, goodbye]):
+      case.completed = True
+      visit_testcase(idx, case, True)
+    visitor.journal.close()
+    with open(self.path) as stream:
+      self.assertEqual([0, 1], [json.loads(line)['index'] for line in stream])
+    with open(self.path, 'a') as stream:
+      stream.write('{"environment": "shell", "sui')  # cut short
+
+    with journal.Journal(self.path, resume=True) as resumed:
+      self.assertEqual({('shell', 'greetings', 'hello'): history.OUTCOME_PASSED,
+                        ('shell', 'greetings', 'goodbye'):
+                            history.OUTCOME_FAILED},
+                       resumed.finished)
+      manager = self.manager()
+      self.assertEqual([history.OUTCOME_PASSED, history.OUTCOME_FAILED],
+                       resumed.skip_finished(manager))
+      self.assertEqual(['later'],
+                       [case.name()
+                        for case in manager.environments[0].suites[0].cases
+                        if case.selected()])
+
+    with journal.Journal(self.path) as restarted:
+      self.assertEqual({}, restarted.finished)
+    self.assertEqual(0, os.path.getsize(self.path))
+
+
+if __name__ == '__main__':
+  unittest.main()
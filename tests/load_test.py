@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+from textwrap import dedent
+
+from sampletester import load
+from tests import helpers
+
+MANIFEST = dedent("""\
+    type: manifest/samples
+    schema_version: 3
+    samples:
+    - environment: shell
+      sample: nap
+      invocation: 'sleep 0.05 && echo rested'
+    - environment: other
+      sample: nap
+      invocation: 'echo tired'
+    """)
+
+TESTPLAN = dedent("""\
+    type: test/samples
+    schema_version: 1
+    test:
+      suites:
+      - name: naps
+        cases:
+        - name: nap
+          spec:
+          - call:
+              sample: nap
+          - assert_contains:
+            - literal: rested
+    """)
+
+
+class TestLoad(unittest.TestCase):
+
+  def manager(self, env_filter=None):
+    return helpers.new_manager(('samples.manifest.yaml', MANIFEST),
+                               ('naps.yaml', TESTPLAN), env_filter=env_filter)
+
+  def test_find_case(self):
+    with self.assertRaisesRegex(ValueError, '2 selected test cases'):
+      load.find_case(self.manager(), 'nap')
+    with self.assertRaisesRegex(ValueError, '0 selected test cases'):
+      load.find_case(self.manager(), 'snooze')
+    environment, suite, idx, case = load.find_case(self.manager('other'),
+                                                   'nap')
+    self.assertEqual(('other', 'naps', 0, 'nap'),
+                     (environment.name(), suite.name(), idx, case.name()))
+
+  def test_run(self):
+    found = load.find_case(self.manager('shell'), 'nap')
+    iterations, failure = load.run(*found, duration=0.3, concurrency=2,
+                                   clock=helpers.FakeClock(step=0.05))
+    self.assertIsNone(failure)
+    # The clock is read when the run starts, and when each iteration starts
+    # and ends, so the 5 readings before the deadline start 3 iterations
+    # whichever worker makes them.
+    self.assertEqual(3, len(iterations))
+    self.assertTrue(all(iteration.latency > 0 and not iteration.failed
+                        for iteration in iterations))
+
+  def test_rate(self):
+    found = load.find_case(self.manager('shell'), 'nap')
+    clock = helpers.FakeClock()
+    iterations, _ = load.run(*found, duration=0.45, rate=10, clock=clock,
+                             sleep=clock.sleep)
+    self.assertEqual([0.0, 0.1, 0.2, 0.3, 0.4],
+                     [round(iteration.start, 3) for iteration in iterations])
+
+  def test_assertions_validate_iterations(self):
+    found = load.find_case(self.manager('other'), 'nap')
+    iterations, failure = load.run(*found, duration=0.1)
+    self.assertTrue(all(iteration.failed for iteration in iterations))
+    self.assertIn('FAILED ASSERTION', failure.get_failures()[0][0])
+
+  def test_summarize(self):
+    iterations = [load.Iteration(0.1, 0.2, False),
+                  load.Iteration(0.6, 0.4, True),
+                  load.Iteration(1.2, 0.3, False)]
+    report = load.summarize(iterations, duration=1.5, window=1.0)
+    self.assertEqual((3, 1, 2), (report['iterations'], report['failed'],
+                                 report['throughput']))
+    self.assertAlmostEqual(0.3, report['latency']['p50'])
+    first, second = report['windows']
+    self.assertEqual((0, 2, 0.5), (first['start'], first['iterations'],
+                                   first['error_rate']))
+    self.assertEqual((1.0, 1, 2.0), (second['start'], second['iterations'],
+                                     second['throughput']))
+    self.assertIn('3 iterations (2.0/s), 1 failed (33.3%)',
+                  load.describe(report))
+
+
+if __name__ == '__main__':
+  unittest.main()
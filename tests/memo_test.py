@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import threading
+import time
+import unittest
+
+from sampletester import memo
+from sampletester import parallel
+from sampletester import runner
+from sampletester import testplan
+from tests import helpers
+
+MANIFEST = """
+type: manifest/samples
+schema_version: 3
+base: &common
+  chdir: {directory}
+  invocation: 'echo x >> {{sample}}.log && echo @args'
+samples:
+- <<: *common
+  environment: shell
+  sample: products
+  cacheable: 'true'
+- <<: *common
+  environment: shell
+  sample: create
+- <<: *common
+  environment: other
+  sample: products
+  cacheable: 'true'
+- <<: *common
+  environment: other
+  sample: create
+"""
+
+TESTPLAN = """
+type: test/samples
+schema_version: 1
+test:
+  suites:
+  - name: shopping
+    setup:
+    - shell:
+        command: 'echo x >> {directory}/prepare.log'
+        cacheable: true
+    cases:
+    - name: list
+      spec:
+      - call:
+          sample: products
+          args: [{literal: all}]
+      - assert_contains:
+        - literal: all
+      - call:
+          sample: create
+          cacheable: true
+    - name: list again
+      spec:
+      - call:
+          sample: products
+          args: [{literal: all}]
+      - assert_contains:
+        - literal: all
+      - call:
+          sample: products
+          args: [{literal: some}]
+      - call:
+          sample: create
+          cacheable: true
+      - call:
+          sample: products
+          args: [{literal: all}]
+          cacheable: false
+      - assert_contains:
+        - literal: all
+"""
+
+
+class TestMemo(unittest.TestCase):
+
+  def test_call(self):
+    call_memo = memo.Memo()
+    self.assertEqual((0, b'out', False),
+                     call_memo.call('shell', 'ls', None, lambda: (0, b'out')))
+    self.assertEqual((0, b'out', True),
+                     call_memo.call('shell', 'ls', os.curdir,
+                                    lambda: (1, b'other')))
+    self.assertEqual((1, b'other', False),
+                     call_memo.call('python', 'ls', None,
+                                    lambda: (1, b'other')))
+
+  def test_concurrent_calls(self):
+    call_memo = memo.Memo()
+    runs = []
+
+    def run():
+      runs.append(1)
+      time.sleep(0.1)
+      return 0, b'out'
+
+    results = []
+    threads = [threading.Thread(
+        target=lambda: results.append(call_memo.call('shell', 'ls', None,
+                                                     run)))
+               for _ in range(4)]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+    self.assertEqual(1, len(runs))
+    self.assertEqual([False, True, True, True],
+                     sorted(reused for _, _, reused in results))
+
+  def test_failed_call(self):
+    call_memo = memo.Memo()
+
+    def fail():
+      raise OSError('broken')
+
+    with self.assertRaises(OSError):
+      call_memo.call('shell', 'ls', None, fail)
+    self.assertEqual((0, b'out', False),
+                     call_memo.call('shell', 'ls', None, lambda: (0, b'out')))
+
+
+class TestCacheableCalls(helpers.DirectoryTestCase):
+
+  def setUp(self):
+    super().setUp()
+    self.write('samples.manifest.yaml',
+               MANIFEST.format(directory=self.directory))
+    self.write('shopping.yaml',
+               TESTPLAN.replace('{directory}', self.directory))
+    self.load_inputs()
+
+  def calls(self, name):
+    """Returns the number of times the call logging to `name` ran."""
+    try:
+      with open(os.path.join(self.directory, name + '.log')) as stream:
+        return len(stream.readlines())
+    except FileNotFoundError:
+      return 0
+
+  def check(self, run):
+    manager = testplan.Manager(self.registry, self.suites)
+    self.assertTrue(run(manager))
+    # products, in each environment: "all", "some", and "all" uncached
+    self.assertEqual(6, self.calls('products'))
+    self.assertEqual(2, self.calls('create'))
+    # the setup is reused across the cases of each environment
+    self.assertEqual(2, self.calls('prepare'))
+    # when running in parallel, either case may make the shared call first
+    outputs = [case.runner.output
+               for case in manager.environments[0].suites[0].cases]
+    self.assertTrue(any('# Reusing the result of: echo x >> products.log' in
+                        output for output in outputs))
+
+  def test_sequential(self):
+    self.check(lambda manager: manager.accept(runner.Visitor()))
+
+  def test_parallel(self):
+    def run(manager):
+      with parallel.Scheduler(manager, 4) as scheduler:
+        return manager.accept(runner.Visitor(scheduler=scheduler))
+    self.check(run)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+from textwrap import dedent
+
+from sampletester import parallel
+from sampletester import runner
+from sampletester import throttle
+from tests import helpers
+
+MANIFEST = dedent("""\
+    type: manifest/samples
+    schema_version: 3
+    samples:
+    - environment: shell
+      sample: nap
+      invocation: 'sleep 0.3 && echo rested'
+      {limits}
+    - environment: shell
+      sample: fail
+      invocation: 'false'
+    """)
+
+TESTPLAN = dedent("""\
+    type: test/samples
+    schema_version: 1
+    test:
+      suites:
+      - name: naps
+        cases:
+        - name: first
+          spec:
+          - call:
+              sample: nap
+        - name: second
+          spec:
+          - call:
+              sample: nap
+        - name: failing
+          spec:
+          - call:
+              sample: fail
+        - name: third
+          spec:
+          - call:
+              sample: nap
+        - name: fourth
+          spec:
+          - call:
+              sample: nap
+    """)
+
+
+class CountingThrottle(throttle.Throttle):
+  """A Throttle that records the most calls it had in flight at once."""
+
+  def __init__(self, *args, **kwargs):
+    super().__init__(*args, **kwargs)
+    self.most_in_flight = 0
+
+  def acquire(self, environment: str):
+    tokens = super().acquire(environment)
+    with self.limiter.condition:
+      self.most_in_flight = max(self.most_in_flight, self.limiter.in_flight)
+    return tokens
+
+
+class TestParallel(unittest.TestCase):
+
+  def manager(self, limits=''):
+    return helpers.new_manager(
+        ('samples.manifest.yaml', MANIFEST.format(limits=limits)),
+        ('naps.yaml', TESTPLAN))
+
+  def run_cases(self, manager, jobs, run_throttle=None, fail_fast=False):
+    """Runs the cases in `manager`.
+
+    Returns:
+      the most calls in flight at once
+    """
+    run_throttle = run_throttle or CountingThrottle()
+    with parallel.Scheduler(manager, jobs, run_throttle,
+                            fail_fast) as scheduler:
+      manager.accept(runner.Visitor(fail_fast, scheduler))
+    return run_throttle.most_in_flight
+
+  def outcomes(self, manager):
+    return [(case.name(), case.completed, case.num_failures)
+            for case in manager.environments[0].suites[0].cases]
+
+  def test_run(self):
+    manager = self.manager()
+    self.assertGreater(self.run_cases(manager, 5), 1)
+    self.assertEqual([('first', True, 0), ('second', True, 0),
+                      ('failing', True, 1), ('third', True, 0),
+                      ('fourth', True, 0)],
+                     self.outcomes(manager))
+    self.assertIn('rested',
+                  manager.environments[0].suites[0].cases[0].runner.output)
+
+  def test_fail_fast(self):
+    manager = self.manager()
+    self.run_cases(manager, 1, fail_fast=True)
+    self.assertEqual([('first', True, 0), ('second', True, 0),
+                      ('failing', True, 1), ('third', False, 0),
+                      ('fourth', False, 0)],
+                     self.outcomes(manager))
+
+  def test_manifest_limits(self):
+    manager = self.manager(limits="concurrency: '1'")
+    self.assertEqual((1, None), manager.environments[0].config.get_limits())
+    run_throttle = parallel.new_throttle(manager, 5)
+    self.assertEqual((1, None), (
+        run_throttle.environments['shell'].max_concurrency,
+        run_throttle.environments['shell'].bucket))
+    counting_throttle = CountingThrottle(
+        environment_limits={'shell': manager.environments[0].config
+                            .get_limits()})
+    self.assertEqual(1, self.run_cases(manager, 5, counting_throttle))
+
+    run_throttle = parallel.new_throttle(manager, 5,
+                                         environment_concurrency={'shell': 4})
+    self.assertEqual(4, run_throttle.environments['shell'].max_concurrency)
+
+    manager = self.manager(limits='concurrency: none')
+    with self.assertRaisesRegex(ValueError, 'concurrency'):
+      manager.environments[0].config.get_limits()
+
+  def test_no_limits(self):
+    self.assertIsNone(parallel.new_throttle(self.manager(), 5))
+    adaptive = parallel.new_throttle(self.manager(), 5, adaptive=True)
+    self.assertEqual(5, adaptive.limiter.max_concurrency)
+    self.assertTrue(adaptive.limiter.adaptive)
+
+
+if __name__ == '__main__':
+  unittest.main()
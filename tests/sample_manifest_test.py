@@ -137,6 +137,26 @@ who: dan
     self.assertEqual([], manifest.get_keys('zoe'))
     self.assertEqual([], manifest.get_keys('python', 'zoe'))
 
+    # the keys of elements indexed later are also returned
+    manifest._index_elements([{'language': 'python', 'sample': 'zoe'},
+                              {'language': 'java', 'sample': 'alice'}])
+    self.assertEqual(['python', '', 'java'], manifest.get_keys())
+    self.assertEqual(['alice', 'robert', 'zoe'], manifest.get_keys('python'))
+    self.assertEqual(['alice'], manifest.get_keys('java'))
+
+  def test_get_misses_and_errors(self):
+    manifest_source, _ = self.get_manifest_source()
+
+    manifest = sample_manifest.Manifest('language', 'sample')
+    manifest.read_sources([manifest_source])
+    manifest.index()
+
+    self.assertIsNone(manifest.get('python'))
+    self.assertIsNone(manifest.get())
+    self.assertIsNone(manifest.get('python', 'zoe'))
+    self.assertRaises(TypeError, manifest.get, ['python'], 'alice')
+    self.assertRaises(TypeError, manifest.get_keys, ['python'])
+
 
   def test_get_one(self):
     manifest_source, (expect_alice, expect_bob, expect_carol,
@@ -437,6 +457,29 @@ who: dan
     manifest.read_sources([('erroring manifest', manifest_content, {})])
     self.assertRaises(sample_manifest.ManifestSyntaxError, manifest.index)
 
+  def test_non_string_values(self):
+    list_name = 'mysamples'
+    def manifest_with(**tags):
+      manifest = sample_manifest.Manifest('greetings')
+      manifest.read_sources([('manifest', {
+          sample_manifest.SCHEMA.type_key:
+              '{}/{}'.format(sample_manifest.SCHEMA.primary_type, list_name),
+          sample_manifest.SCHEMA.version_key: 3,
+          list_name: [dict(greetings='teatime', drinks=['tea', 'coffee'],
+                           cups=2, **tags)],
+      }, {})])
+      return manifest
+
+    manifest = manifest_with()
+    manifest.index()
+    element = manifest.get_one('teatime')
+    self.assertEqual((['tea', 'coffee'], 2),
+                     (element['drinks'], element['cups']))
+
+    manifest = manifest_with(form='Some {drinks}?')
+    self.assertRaisesRegex(sample_manifest.ManifestSyntaxError,
+                           'not a string', manifest.index)
+
   def test_braces_error_loop(self):
     list_name = 'mysamples'
     manifest_content = {
@@ -460,6 +503,220 @@ who: dan
     manifest.read_sources([('erroring manifest', manifest_content, {})])
     self.assertRaises(sample_manifest.CycleError, manifest.index)
 
+  def test_braces_shared_templates(self):
+    list_name = 'mysamples'
+    common = {
+        'base_drink': 'tea',
+        'drink': '{base_drink} with milk',
+        'form': 'Would you like some {drink}, {name}?',
+    }
+    manifest_content = {
+        sample_manifest.SCHEMA.type_key:
+            '{}/{}'.format(sample_manifest.SCHEMA.primary_type,
+                           list_name),
+        sample_manifest.SCHEMA.version_key: 3,
+        list_name: [
+            dict(common, name='Mary'),
+            dict(common, name='John'),
+            dict(common, name='Ann', base_drink='coffee'),
+        ]
+    }
+    manifest = sample_manifest.Manifest('name')
+    manifest.read_sources([('manifest with shared templates',
+                            manifest_content, {})])
+    manifest.index()
+
+    self.assertEqual('Would you like some tea with milk, Mary?',
+                     manifest.get_one('Mary')['form'])
+    self.assertEqual('Would you like some tea with milk, John?',
+                     manifest.get_one('John')['form'])
+    self.assertEqual('Would you like some coffee with milk, Ann?',
+                     manifest.get_one('Ann')['form'])
+
+    # Each distinct template is parsed once, and each element after the
+    # first reuses the first element's resolution order.
+    self.assertEqual(2, manifest.templates.misses)
+    self.assertEqual(4, manifest.templates.hits)
+    self.assertEqual(1, len(manifest.templates.orders))
+
+  def test_index_in_processes(self):
+    list_name = 'mysamples'
+    def source(name, *people, drink='{base_drink} with milk'):
+      return (name,
+              {
+                  sample_manifest.SCHEMA.type_key:
+                      '{}/{}'.format(sample_manifest.SCHEMA.primary_type,
+                                     list_name),
+                  sample_manifest.SCHEMA.version_key: 3,
+                  list_name: [{'language': 'english',
+                               'name': person,
+                               'base_drink': 'tea',
+                               'drink': drink,
+                               'form': 'Some {drink}, {name}?'}
+                              for person in people]
+              },
+              sample_manifest.create_implicit_tags(source=name))
+    # (Indexing resolves the elements in place, so each manifest gets its own.)
+    def sources():
+      return [source('first', 'Mary', 'John'),
+              source('second', 'Ann', 'Mary'),
+              source('third', 'Bob')]
+
+    serial = sample_manifest.Manifest('language', 'name')
+    serial.read_sources(sources())
+    serial.index(processes=1)
+    parallel = sample_manifest.Manifest('language', 'name')
+    parallel.read_sources(sources())
+    parallel.index(processes=2)
+
+    self.assertEqual(list(serial.get_all_elements()),
+                     list(parallel.get_all_elements()))
+    self.assertEqual(['Mary', 'John', 'Ann', 'Bob'],
+                     parallel.get_keys('english'))
+    self.assertEqual(['first', 'second'],
+                     [element[sample_manifest.IMPLICIT_TAG_SOURCE]
+                      for element in parallel.get('english', 'Mary')])
+    self.assertEqual('Some tea with milk, Ann?',
+                     parallel.get_one('english', 'Ann')['form'])
+    # The strings of the elements from different workers are shared.
+    first, second = parallel.get('english', 'Mary')
+    self.assertIs(first.names, second.names)
+    self.assertIs(first.names, parallel.strings[first.names])
+    # Each worker has its own template cache, but all lookups are counted.
+    self.assertEqual(serial.templates.hits + serial.templates.misses,
+                     parallel.templates.hits + parallel.templates.misses)
+
+    # Errors are reported for the first source that fails, as when indexing
+    # serially.
+    for error, drink in [(sample_manifest.CycleError, '{form}'),
+                         (sample_manifest.ManifestSyntaxError, '{base_drink')]:
+      manifest = sample_manifest.Manifest('language', 'name')
+      manifest.read_sources([source('first', 'Mary'),
+                             source('second', 'Ann', drink=drink),
+                             source('third', 'Bob', drink='{')])
+      with self.assertLogs(level='ERROR') as logs:
+        self.assertRaises(error, manifest.index, processes=2)
+      self.assertEqual(1, len(logs.output))
+      self.assertIn('manifest source "second"', logs.output[0])
+
+  def test_replace_source(self):
+    list_name = 'mysamples'
+    def source(name, *people, drink='tea'):
+      return (name,
+              {
+                  sample_manifest.SCHEMA.type_key:
+                      '{}/{}'.format(sample_manifest.SCHEMA.primary_type,
+                                     list_name),
+                  sample_manifest.SCHEMA.version_key: 3,
+                  list_name: [{'language': 'english',
+                               'name': person,
+                               'drink': drink,
+                               'form': 'Some {drink}, {name}?'}
+                              for person in people]
+              },
+              {})
+    def new_manifest(*sources):
+      manifest = sample_manifest.Manifest('language', 'name')
+      manifest.read_sources(sources)
+      manifest.index()
+      return manifest
+
+    # the people and drink of each source, in order
+    contents = {'first': (['Mary', 'John'], 'tea'),
+                'second': (['Ann', 'Mary'], 'tea'),
+                'third': (['Bob'], 'tea')}
+    def current_sources():
+      return [source(name, *people, drink=drink)
+              for name, (people, drink) in contents.items()]
+
+    manifest = new_manifest(*current_sources())
+    self.assertEqual(['Mary', 'John', 'Ann', 'Bob'],
+                     manifest.get_keys('english'))
+
+    for name, people, drink, expected_changes in [
+        # same keys
+        ('second', ['Ann', 'Mary'], 'coffee', {'Ann', 'Mary'}),
+        # added and removed keys
+        ('second', ['Zoe', 'Bob'], 'coffee', {'Ann', 'Mary', 'Zoe', 'Bob'}),
+        # removed source
+        ('first', None, None, {'Mary', 'John'}),
+        # new source
+        ('fourth', ['Ann'], 'tea', {'Ann'}),
+        # unchanged source
+        ('third', ['Bob'], 'tea', set()),
+    ]:
+      if people:
+        contents[name] = (people, drink)
+        replacement = [source(name, *people, drink=drink)]
+      else:
+        del contents[name]
+        replacement = []
+      changed = manifest.replace_source(name, replacement)
+      self.assertEqual({('english', person) for person in expected_changes},
+                       changed)
+      self.assertEqual(list(contents), [name for name, *_ in manifest.sources])
+
+      # The entries are the same as when indexing all the sources anew.
+      expected = new_manifest(*current_sources())
+      self.assertEqual(dict(expected.groups()), dict(manifest.groups()))
+      self.assertEqual(sorted(expected.get_keys('english')),
+                       sorted(manifest.get_keys('english')))
+      self.assertEqual(expected.num_elements, manifest.num_elements)
+
+    # Keys are kept in the order first indexed, with new keys at the end.
+    self.assertEqual(['Bob', 'Zoe', 'Ann'], manifest.get_keys('english'))
+
+    self.assertEqual(['Some coffee, Bob?', 'Some tea, Bob?'],
+                     [element['form']
+                      for element in manifest.get('english', 'Bob')])
+    self.assertEqual(1, len(manifest.get('english', 'Ann')))
+
+    # The strings of replaced sources are eventually dropped.
+    for count in range(20):
+      manifest.replace_source('third',
+                              [source('third', 'Bob', drink=f'juice {count}')])
+    self.assertNotIn('juice 0', manifest.strings)
+    self.assertIn('juice 19', manifest.strings)
+
+    # A failing replacement leaves the index unchanged.
+    groups = list(manifest.groups())
+    self.assertRaises(sample_manifest.CycleError, manifest.replace_source,
+                      'third', [source('third', 'Bob', drink='{form}')])
+    self.assertEqual(groups, list(manifest.groups()))
+    self.assertEqual(['second', 'third', 'fourth'],
+                     [name for name, *_ in manifest.sources])
+
+  def test_share_common_tags(self):
+    elements = [
+        {'environment': 'python', 'sample': 'alice', 'bin': 'python3'},
+        {'sample': 'bob', 'environment': 'python', 'bin': 'python2'},
+        {'environment': 'python', 'sample': 'carol'},
+        'not an element',
+    ]
+    expected = [dict(element) if isinstance(element, dict) else element
+                for element in elements]
+    strings = {}
+    compact = sample_manifest.share_common_tags(elements, strings)
+    self.assertIs(elements, compact)
+    self.assertEqual(expected, compact)
+    self.assertEqual('not an element', compact[3])
+
+    alice, bob, carol = compact[:3]
+    self.assertEqual({'environment': 'python'}, alice.base)
+    self.assertIs(alice.base, carol.base)
+    self.assertEqual({'sample': 'carol'}, carol.overrides)
+    self.assertIs(alice.names, strings[('environment', 'sample', 'bin')])
+
+    self.assertEqual(str(expected[1]), str(bob))
+    self.assertEqual(3, len(bob))
+    self.assertEqual('python2', bob['bin'])
+    self.assertEqual('python2', bob.get('bin'))
+    self.assertIsNone(carol.get('bin'))
+    self.assertEqual('', carol.get('bin', ''))
+    self.assertNotIn('bin', carol)
+    self.assertRaises(KeyError, lambda: carol['bin'])
+    self.assertIn(('sample', 'bob'), bob.items())
+
   def test_extend_all_with(self):
     manifest = [
       {
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import io
+import os
+import threading
+import unittest
+
+from sampletester import client
+from sampletester import server
+from sampletester import tracing
+from tests import helpers
+
+MANIFEST = """
+type: manifest/samples
+schema_version: 3
+samples:
+- environment: shell
+  sample: hello
+  path: hello.sh
+  invocation: 'sh {path} @args'
+"""
+
+TESTPLAN = """
+type: test/samples
+schema_version: 1
+test:
+  suites:
+  - name: greetings
+    cases:
+    - name: hello
+      spec:
+      - call:
+          sample: hello
+      - assert_contains:
+        - literal: {expected}
+    - name: hello again
+      spec:
+      - call:
+          sample: hello
+"""
+
+
+class TestServer(helpers.DirectoryTestCase):
+
+  def setUp(self):
+    super().setUp()
+    self.cwd = os.getcwd()
+    self.write('hello.sh', 'echo hello')
+    self.write('samples.manifest.yaml', MANIFEST)
+    self.write('greetings.yaml', TESTPLAN.format(expected='hello'))
+    self.socket_path = os.path.join(self.directory, 'server.sock')
+    self.server = server.Server(self.socket_path)
+    self.thread = threading.Thread(target=self.server.serve_forever)
+    self.thread.start()
+
+  def tearDown(self):
+    self.server.shutdown()
+    self.server.server_close()
+    self.thread.join()
+    os.chdir(self.cwd)
+    super().tearDown()
+
+  def run_request(self, **request):
+    """Returns the result and output of running the tests in `request`."""
+    stdout, stderr = io.StringIO(), io.StringIO()
+    request = dict({'cwd': self.directory, 'files': ['.'],
+                    'convention': 'tag:sample', 'verbosity': 'FULL'},
+                   **request)
+    result = client.run(self.socket_path, request, stdout, stderr)
+    return result, stdout.getvalue() + stderr.getvalue()
+
+  def test_run(self):
+    result, output = self.run_request()
+    self.assertEqual(client.RESULT_PASSED, result)
+    self.assertIn('Tests passed', output)
+    self.assertIn('hello again', output)
+    inputs = list(self.server.loaded.values())
+    self.assertEqual(1, len(inputs))
+
+    # the loaded inputs are reused, and updated when their files change
+    self.write('greetings.yaml', TESTPLAN.format(expected='goodbye'))
+    result, output = self.run_request(cases='^hello$')
+    self.assertEqual(client.RESULT_FAILED, result)
+    self.assertIn('Tests failed', output)
+    self.assertEqual(inputs, list(self.server.loaded.values()))
+
+    result, output = self.run_request(shard='1/2', xunit='-')
+    self.assertEqual(client.RESULT_PASSED, result)
+    self.assertIn('<testcase name="hello again:shell"', output)
+    self.assertNotIn('<testcase name="hello:shell"', output)
+
+  def test_environment(self):
+    self.write('hello.sh', 'echo ${GREETING:-hello}')
+    self.write('greetings.yaml', TESTPLAN.format(expected='goodbye'))
+    result, output = self.run_request(
+        cases='^hello$', env=dict(os.environ, GREETING='goodbye'))
+    self.assertEqual(client.RESULT_PASSED, result)
+    self.assertNotIn('GREETING', os.environ)
+
+    # the timings of earlier requests are discarded
+    tracing.count('earlier')
+    result, output = self.run_request(cases='^hello$', env=dict(os.environ))
+    self.assertEqual(client.RESULT_FAILED, result)
+    self.assertNotIn('earlier', tracing.TIMINGS.counters)
+
+  def test_errors(self):
+    result, output = self.run_request(convention='nonexistent')
+    self.assertEqual(client.RESULT_ERROR, result)
+    self.assertIn('could not run tests', output)
+    self.assertEqual({}, self.server.loaded)
+
+    result, output = self.run_request(shard='2/2')
+    self.assertEqual(client.RESULT_ERROR, result)
+    self.assertIn('invalid shard', output)
+
+    result, output = self.run_request(color='blue')
+    self.assertEqual(client.RESULT_ERROR, result)
+    self.assertIn('unknown request keys: "color"', output)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -16,7 +16,9 @@
 import unittest
 from textwrap import dedent
 
+from sampletester import environment_registry
 from sampletester import parser
+from sampletester import testenv
 from sampletester import testplan
 
 
@@ -86,3 +88,53 @@ class TestTestPlan(unittest.TestCase):
                       if suite.selected() and test_case.selected()}
     self.assertEqual({'hadrons'}, selected_suites)
     self.assertEqual({'neutron'}, selected_cases)
+
+  def test_shard(self):
+    registry = environment_registry.Registry()
+    registry.add(testenv.Base('python'), testenv.Base('java'))
+    shards = []
+    for index in range(3):
+      manager = testplan.Manager(
+          registry, testplan.suites_from(self.config, case_filter='^[^m]'))
+      manager.shard(index, 3)
+      shards.append([(environment.name(), case.name())
+                     for environment in manager.environments
+                     for suite in environment.suites
+                     for case in suite.cases])
+    self.assertEqual([[('python', 'proton'), ('python', 'tauon'),
+                       ('java', 'electron')],
+                      [('python', 'neutron'), ('java', 'proton'),
+                       ('java', 'tauon')],
+                      [('python', 'electron'), ('java', 'neutron')]],
+                     shards)
+
+  def test_order_and_balance_by_duration(self):
+    registry = environment_registry.Registry()
+    registry.add(testenv.Base('python'))
+    manager = testplan.Manager(registry, testplan.suites_from(self.config))
+    seconds = {'proton': 1, 'neutron': 2, 'electron': 6, 'muon': 3, 'tauon': 4}
+    duration = lambda environment, suite, case: seconds[case.name()]
+
+    manager.order_cases(duration)
+    self.assertEqual([['electron', 'tauon', 'muon'], ['neutron', 'proton']],
+                     [[case.name() for case in suite.cases]
+                      for suite in manager.environments[0].suites])
+
+    manager.order_cases(duration,
+                        lambda environment, suite, case: case.name() == 'proton')
+    self.assertEqual([['proton', 'neutron'], ['electron', 'tauon', 'muon']],
+                     [[case.name() for case in suite.cases]
+                      for suite in manager.environments[0].suites])
+
+    manager.order_cases(duration)
+    manager.shard(1, 2, duration)
+    self.assertEqual(['tauon', 'muon', 'proton'],
+                     [case.name() for suite in manager.environments[0].suites
+                      for case in suite.cases])
+
+  def test_parse_shard(self):
+    self.assertEqual((1, 4), testplan.parse_shard('1/4'))
+    for shard in ['4/4', '-1/4', '1', '1/0', 'a/b']:
+      with self.assertRaises(ValueError):
+        testplan.parse_shard(shard)
+
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+import time
+import unittest
+
+from sampletester import throttle
+from tests import helpers
+
+
+class TestTokenBucket(unittest.TestCase):
+
+  def test_rate(self):
+    clock = helpers.FakeClock()
+    bucket = throttle.TokenBucket(2, clock=clock, sleep=clock.sleep)
+    for _ in range(6):
+      bucket.acquire()
+    # the first two tokens are the initial burst; the other four take 2s
+    self.assertAlmostEqual(2.0, clock.now)
+
+  def test_rounding(self):
+    clock = helpers.FakeClock()
+    bucket = throttle.TokenBucket(10, capacity=1, clock=clock,
+                                  sleep=clock.sleep)
+    # waits of 0.1s do not add up to whole tokens exactly
+    for _ in range(10):
+      bucket.acquire()
+    self.assertAlmostEqual(0.9, clock.now)
+
+  def test_invalid_rate(self):
+    with self.assertRaises(ValueError):
+      throttle.TokenBucket(0)
+
+
+class TestLimiter(unittest.TestCase):
+
+  def test_concurrency(self):
+    limiter = throttle.Limiter(concurrency=2)
+    lock = threading.Lock()
+    in_flight = [0]
+    most_in_flight = [0]
+
+    def call():
+      token = limiter.acquire()
+      with lock:
+        in_flight[0] += 1
+        most_in_flight[0] = max(most_in_flight[0], in_flight[0])
+      time.sleep(0.02)
+      with lock:
+        in_flight[0] -= 1
+      limiter.release(token)
+
+    threads = [threading.Thread(target=call) for _ in range(8)]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+    self.assertEqual(2, most_in_flight[0])
+    self.assertEqual(0, limiter.in_flight)
+
+  def test_adaptive(self):
+    clock = helpers.FakeClock()
+    limiter = throttle.Limiter(concurrency=8, adaptive=True, clock=clock)
+
+    def call(latency, overloaded=False):
+      token = limiter.acquire()
+      clock.sleep(latency)
+      limiter.release(token, overloaded)
+
+    call(1.0, overloaded=True)
+    self.assertEqual(4.0, limiter.limit)
+    # calls overloaded together back off only once
+    call(0.1, overloaded=True)
+    self.assertEqual(4.0, limiter.limit)
+    call(1.0, overloaded=True)
+    self.assertEqual(2.0, limiter.limit)
+
+    call(1.0)
+    self.assertEqual(2.5, limiter.limit)
+    for _ in range(50):
+      call(1.0)
+    self.assertEqual(8.0, limiter.limit)
+
+    # a latency spike backs off too
+    call(10.0)
+    self.assertEqual(4.0, limiter.limit)
+
+  def test_not_adaptive(self):
+    clock = helpers.FakeClock()
+    limiter = throttle.Limiter(concurrency=8, clock=clock)
+    limiter.release(limiter.acquire(), overloaded=True)
+    self.assertEqual(8.0, limiter.limit)
+
+
+class TestThrottle(unittest.TestCase):
+
+  def test_environments(self):
+    run_throttle = throttle.Throttle(concurrency=3,
+                                     environment_limits={'shell': (1, None)})
+    tokens = run_throttle.acquire('shell')
+    self.assertEqual(1, run_throttle.environments['shell'].in_flight)
+    self.assertEqual(1, run_throttle.limiter.in_flight)
+    run_throttle.release(tokens)
+    self.assertEqual(0, run_throttle.environments['shell'].in_flight)
+    self.assertEqual(0, run_throttle.limiter.in_flight)
+
+    run_throttle.release(run_throttle.acquire('python'))
+    self.assertEqual(0, run_throttle.limiter.in_flight)
+
+  def test_jobserver_failure(self):
+    class BrokenJobserver:
+      def acquire(self):
+        raise OSError('the jobserver closed its pipe')
+
+    run_throttle = throttle.Throttle(concurrency=3,
+                                     environment_limits={'shell': (1, None)},
+                                     jobserver=BrokenJobserver())
+    with self.assertRaises(OSError):
+      run_throttle.acquire('shell')
+    self.assertEqual(0, run_throttle.environments['shell'].in_flight)
+    self.assertEqual(0, run_throttle.limiter.in_flight)
+
+  def test_parse_limits(self):
+    self.assertEqual((None, {}), throttle.parse_limits(None, int, '--flag'))
+    self.assertEqual((4, {'shell': 2, 'a=b': 1}),
+                     throttle.parse_limits(['shell=2', '4', 'a=b=1'], int,
+                                           '--flag'))
+    self.assertEqual((0.5, {}),
+                     throttle.parse_limits(['0.5'], float, '--flag'))
+    for value in ['shell=', 'x', '0', 'shell=-1']:
+      with self.assertRaisesRegex(ValueError, '--flag'):
+        throttle.parse_limits([value], int, '--flag')
+
+
+if __name__ == '__main__':
+  unittest.main()
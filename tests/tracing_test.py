@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+import tempfile
+import threading
+import unittest
+
+from sampletester import tracing
+
+
+class TestTracer(unittest.TestCase):
+
+  def test_disabled_records_nothing(self):
+    tracer = tracing.Tracer()
+    with tracer.span('ignored', tracing.CATEGORY_PHASE) as token:
+      self.assertIsNone(token)
+    tracer.end(tracer.begin('ignored', tracing.CATEGORY_CALL))
+    self.assertEqual([], tracer.events)
+
+  def test_nested_spans(self):
+    tracer = tracing.Tracer(enabled=True)
+    with tracer.span('outer', tracing.CATEGORY_SUITE, source='plan.yaml'):
+      with tracer.span('inner', tracing.CATEGORY_CASE):
+        pass
+    inner, outer = tracer.events
+    self.assertEqual('inner', inner['name'])
+    self.assertEqual('outer', outer['name'])
+    self.assertEqual('X', outer['ph'])
+    self.assertEqual({'source': 'plan.yaml'}, outer['args'])
+    self.assertNotIn('args', inner)
+    self.assertEqual(outer['tid'], inner['tid'])
+    self.assertLessEqual(outer['ts'], inner['ts'])
+    self.assertGreaterEqual(outer['ts'] + outer['dur'],
+                            inner['ts'] + inner['dur'])
+
+  def test_end_adds_args(self):
+    tracer = tracing.Tracer(enabled=True)
+    token = tracer.begin('call', tracing.CATEGORY_CALL, command='ls')
+    tracer.end(token, exit_code=2)
+    self.assertEqual({'command': 'ls', 'exit_code': 2},
+                     tracer.events[0]['args'])
+
+  def test_lane_per_thread(self):
+    tracer = tracing.Tracer(enabled=True)
+
+    def work():
+      with tracer.span('worker', tracing.CATEGORY_CASE):
+        pass
+
+    with tracer.span('main', tracing.CATEGORY_PHASE):
+      workers = [threading.Thread(target=work, name=f'worker-{n}')
+                 for n in range(2)]
+      for thread in workers:
+        thread.start()
+      for thread in workers:
+        thread.join()
+
+    events = tracer.trace_events()
+    lanes = {event['args']['name']: event['tid']
+             for event in events if event['ph'] == 'M'}
+    self.assertEqual({'MainThread', 'worker-0', 'worker-1'}, set(lanes))
+    self.assertEqual(3, len(set(lanes.values())))
+    span_lanes = {event['tid'] for event in events if event['ph'] == 'X'}
+    self.assertEqual(set(lanes.values()), span_lanes)
+
+  def test_write(self):
+    tracer = tracing.Tracer(enabled=True)
+    with tracer.span('phase', tracing.CATEGORY_PHASE):
+      pass
+    with tempfile.TemporaryDirectory() as tmpdir:
+      path = os.path.join(tmpdir, 'trace.json')
+      tracer.write(path)
+      with open(path) as stream:
+        trace = json.load(stream)
+    self.assertEqual(['M', 'X'],
+                     [event['ph'] for event in trace['traceEvents']])
+
+
+class TestTimings(unittest.TestCase):
+
+  def test_phases_in_start_order(self):
+    timings = tracing.Timings()
+    with timings.phase('outer') as outer_counts:
+      with timings.phase('inner') as inner_counts:
+        inner_counts['elements'] = 3
+      outer_counts['sources'] = 1
+    with timings.phase('after'):
+      pass
+
+    self.assertEqual([('outer', 0, {'sources': 1}),
+                      ('inner', 1, {'elements': 3}),
+                      ('after', 0, {})],
+                     [(phase.name, phase.depth, phase.counts)
+                      for phase in timings.phases])
+    self.assertTrue(all(phase.seconds >= 0 for phase in timings.phases))
+
+  def test_summary(self):
+    timings = tracing.Timings()
+    with timings.phase('load') as counts:
+      counts['documents'] = 2
+    timings.count('things', 5)
+    timings.count('cache.hits', 3)
+    timings.count('cache.misses')
+
+    lines = timings.summary().split('\n')
+    self.assertEqual('Timings:', lines[0])
+    self.assertRegex(lines[1], r'^  load: \d+\.\d{3}s, documents: 2$')
+    self.assertEqual(['  things: 5', '  cache: 3 hits, 1 misses (75.0%)'],
+                     lines[2:])
+    self.assertEqual({'cache': (3, 1, 0.75)}, timings.hit_rates())
+
+  def test_count_from_threads(self):
+    timings = tracing.Timings()
+
+    def count():
+      for _ in range(1000):
+        timings.count('calls')
+
+    threads = [threading.Thread(target=count) for _ in range(8)]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+    self.assertEqual(8000, timings.counters['calls'])
+
+  def test_reset(self):
+    timings = tracing.Timings()
+    with timings.phase('outer'):
+      timings.count('things')
+      timings.reset()
+    self.assertEqual([], timings.phases)
+    self.assertEqual({}, timings.counters)
+
+  def test_phase_traces_counts(self):
+    tracer = tracing.TRACER
+    saved = tracer.enabled, tracer.events
+    tracer.enabled, tracer.events = True, []
+    try:
+      with tracing.phase('load') as counts:
+        counts['documents'] = 2
+      event, = tracer.events
+    finally:
+      tracer.enabled, tracer.events = saved
+    self.assertEqual('load', event['name'])
+    self.assertEqual(tracing.CATEGORY_PHASE, event['cat'])
+    self.assertEqual({'documents': 2}, event['args'])
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import unittest
+
+from sampletester import summary
+from sampletester import watch
+from tests import helpers
+
+MANIFEST = """
+type: manifest/samples
+schema_version: 3
+samples:
+- environment: shell
+  sample: hello
+  path: hello.sh
+  chdir: {directory}
+  invocation: 'sh {{path}} @args'
+- environment: shell
+  sample: goodbye
+  path: goodbye.sh
+  chdir: {directory}
+  invocation: 'sh {{path}} @args'
+  build: 'echo built >> builds.log'
+  build_inputs: goodbye.sh
+"""
+
+TESTPLAN = """
+type: test/samples
+schema_version: 1
+test:
+  suites:
+  - name: greetings
+    cases:
+    - name: hello
+      spec:
+      - call:
+          sample: hello
+      - assert_contains:
+        - literal: {hello}
+    - name: goodbye
+      spec:
+      - call:
+          sample: goodbye
+      - assert_contains:
+        - literal: bye
+"""
+
+
+class TestWatcher(helpers.DirectoryTestCase):
+
+  def setUp(self):
+    super().setUp()
+    self.write('hello.sh', 'echo hello bye')
+    self.write('goodbye.sh', 'echo bye')
+    self.write('samples.manifest.yaml',
+               MANIFEST.format(directory=self.directory))
+    self.write('greetings.yaml', TESTPLAN.format(hello='hello'))
+    self.watcher = watch.Watcher([self.directory], 'tag:sample',
+                                 verbosity=summary.Detail.NONE,
+                                 show_errors=False)
+    self.watcher.load()
+
+  def run_changes(self):
+    """Returns the names of the cases re-run after the changed files."""
+    changed_keys = self.watcher.update(self.watcher.poll())
+    if changed_keys is None:
+      self.watcher.load()
+    manager = self.watcher.run(changed_keys)
+    if not manager:
+      return []
+    return sorted(case.name()
+                  for environment in manager.environments
+                  for suite in environment.suites
+                  for case in suite.cases)
+
+  def test_rerun_affected(self):
+    self.assertEqual(['goodbye', 'hello'], self.run_changes())
+    self.assertTrue(self.watcher.passed)
+    self.assertEqual({('shell', 'hello')},
+                     self.watcher.lookups[('shell',
+                                           os.path.join(self.directory,
+                                                        'greetings.yaml'),
+                                           'greetings', 'hello')])
+    self.assertIn(os.path.join(self.directory, 'hello.sh'),
+                  self.watcher.status)
+    self.assertEqual([], self.run_changes())
+
+    # a sample file
+    self.write('goodbye.sh', 'echo so long')
+    self.assertEqual(['goodbye'], self.run_changes())
+    self.assertFalse(self.watcher.passed)
+
+    # a manifest artifact
+    self.write('samples.manifest.yaml',
+               MANIFEST.format(directory=self.directory)
+               .replace('goodbye.sh', 'hello.sh'))
+    self.assertEqual(['goodbye'], self.run_changes())
+    self.assertTrue(self.watcher.passed)
+
+    # a test case
+    self.write('greetings.yaml', TESTPLAN.format(hello='hi'))
+    self.assertEqual(['hello'], self.run_changes())
+    self.assertFalse(self.watcher.passed)
+
+    # both cases now run hello.sh
+    self.write('hello.sh', 'echo hi bye')
+    self.assertEqual(['goodbye', 'hello'], self.run_changes())
+    self.assertTrue(self.watcher.passed)
+
+  def builds(self):
+    """Returns how many times the goodbye sample was built."""
+    with open(os.path.join(self.directory, 'builds.log')) as stream:
+      return len(stream.read().splitlines())
+
+  def test_builds(self):
+    self.run_changes()
+    self.assertEqual(1, self.builds())
+
+    # the case affected does not call goodbye
+    self.write('hello.sh', 'echo hello bye now')
+    self.assertEqual(['hello'], self.run_changes())
+    self.assertEqual(1, self.builds())
+
+    # the build inputs changed
+    self.write('goodbye.sh', 'echo bye bye')
+    self.assertEqual(['goodbye'], self.run_changes())
+    self.assertEqual(2, self.builds())
+
+    # the build is current
+    self.watcher.load()
+    self.watcher.run()
+    self.assertEqual(2, self.builds())
+
+  def test_new_environment_reloads(self):
+    self.run_changes()
+    self.write('samples.manifest.yaml',
+               MANIFEST.format(directory=self.directory)
+               .replace('environment: shell\n  sample: goodbye',
+                        'environment: bash\n  sample: goodbye'))
+    self.assertIsNone(self.watcher.update(self.watcher.poll()))
+
+
+if __name__ == '__main__':
+  unittest.main()